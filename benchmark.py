@@ -0,0 +1,398 @@
+"""
+Benchmarks the bot's hot paths against a synthetic large world and writes a
+JSON report that can be compared between commits.
+
+    python benchmark.py --json before.json
+    git checkout my-branch
+    python benchmark.py --json after.json --compare before.json
+
+The world (100k members, 300k characters, 1M character_buildings by default,
+see --scale) is generated once per size and seed into .benchmark/ and copied
+for every run. Each benchmark runs its operation sequentially through the real
+Client and cogs (see offline_harness.py), so latencies are per operation with
+nothing else in flight. Production ticks are rolled back after each run, so
+every iteration collects the same due buildings.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from dataclasses import dataclass
+
+import database as db_utils
+import dice
+import migrations
+import offline_harness
+import production
+from offline_harness import FakeMessage, FakeUser
+
+WORLD_DIR = ".benchmark"
+DEFAULT_MEMBERS = 100_000
+CHARACTERS_PER_MEMBER = 3
+BUILDINGS_PER_CHARACTER = 10 / 3 # 1M buildings at the default size
+CHANNELS = 50
+VM_STEP_INTERVAL = 100 # SQLite VM instructions per progress-handler call, see DbCounters
+
+# (name, resource_output, resource_type, resource_frequency); a mix of currencies,
+# goods, dice sizes and frequencies.
+BUILDING_TYPES = [
+    ("Small Mine", "1d6", "gp", "daily"),
+    ("Copper Mine", "2d6", "cp", "hourly"),
+    ("Silver Mine", "1d8", "sp", "daily"),
+    ("Mint", "1d4", "pp", "weekly"),
+    ("Electrum Pit", "3d4", "ep", "daily"),
+    ("Farm", "2d4", "grain", "hourly"),
+    ("Herbalist Hut", "1d6", "herbs", "daily"),
+    ("Lumber Camp", "4d6", "wood", "hourly"),
+    ("Quarry", "2d8", "stone", "daily"),
+    ("Iron Mine", "1d10", "iron_ore", "weekly"),
+    ("Fishery", "3d6", "fish", "hourly"),
+    ("Apiary", "1d4", "honey", "weekly"),
+    ("Market Stall", "1d12", "sp", "daily"),
+    ("Toll Bridge", "5d4", "cp", "hourly"),
+]
+
+@dataclass(frozen=True)
+class WorldSize:
+    members: int
+    characters: int
+    buildings: int
+
+    @classmethod
+    def scaled(cls, scale: float) -> "WorldSize":
+        members = max(1, int(DEFAULT_MEMBERS * scale))
+        return cls(members, members * CHARACTERS_PER_MEMBER, int(members * CHARACTERS_PER_MEMBER * BUILDINGS_PER_CHARACTER))
+
+def world_path(size: WorldSize, seed: int) -> str:
+    return os.path.join(WORLD_DIR, f"world-m{size.members}-c{size.characters}-b{size.buildings}-s{seed}-v{migrations.LATEST_VERSION}.db")
+
+def generate_world(path: str, size: WorldSize, seed: int, now: int):
+    """Writes a migrated database with `size` rows. Member i owns characters 3i+1..3i+3 and the first is active."""
+    rng = random.Random(seed)
+    temp_path = path + ".partial"
+    if os.path.exists(temp_path):
+        os.remove(temp_path)
+    conn = sqlite3.connect(temp_path)
+    try:
+        migrations.run_migrations(conn)
+        conn.execute("PRAGMA synchronous = OFF") # Throwaway file until it is renamed into place
+        conn.execute("BEGIN")
+        conn.executemany(
+            "INSERT INTO building_types (name, resource_output, resource_type, resource_frequency) VALUES (?, ?, ?, ?)",
+            BUILDING_TYPES
+        )
+        intervals = {"hourly": 3600, "daily": 86400, "weekly": 604800}
+        building_types = [(type_id, intervals[frequency]) for type_id, frequency in conn.execute(
+            "SELECT id, resource_frequency FROM building_types"
+        )]
+
+        conn.executemany(
+            "INSERT INTO members (discord_id, discord_tag, active_character_id) VALUES (?, ?, ?)",
+            ((str(member_id(index)), f"member{index}", index * CHARACTERS_PER_MEMBER + 1) for index in range(size.members))
+        )
+        conn.executemany(
+            "INSERT INTO characters (id, discord_id, name, class, spellcaster, cp, sp, ep, gp, pp) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            ((character_id, str(member_id((character_id - 1) // CHARACTERS_PER_MEMBER)), f"Character {character_id}",
+              rng.choice(("Fighter", "Wizard", "Rogue", "Cleric")), rng.random() < 0.5,
+              rng.randint(0, 500), rng.randint(0, 200), rng.randint(0, 20), rng.randint(0, 100), rng.randint(0, 5))
+             for character_id in range(1, size.characters + 1))
+        )
+
+        def buildings():
+            for _ in range(size.buildings):
+                type_id, interval = rng.choice(building_types)
+                # Up to two intervals behind, so roughly half are due and some owe several collections
+                last_collection_time = now - rng.randint(0, 2 * interval)
+                yield (rng.randint(1, size.characters), type_id, None, rng.randint(1, CHANNELS),
+                       last_collection_time, last_collection_time + interval)
+        conn.executemany(
+            '''INSERT INTO character_buildings (character_id, building_type_id, custom_name, channel_id, last_collection_time, next_due_time)
+               VALUES (?, ?, ?, ?, ?, ?)''',
+            buildings()
+        )
+        # Lets each run shift the clock so the same share of buildings is due, however old the file is
+        conn.execute("CREATE TABLE benchmark_world (generated_at INTEGER NOT NULL)")
+        conn.execute("INSERT INTO benchmark_world VALUES (?)", (now,))
+        conn.commit()
+        conn.execute("ANALYZE")
+    finally:
+        conn.close()
+    os.replace(temp_path, path)
+
+def member_id(index: int) -> int:
+    return 1_000_000 + index # Discord IDs of generated members, clear of offline_harness's counter
+
+class DbCounters:
+    """
+    Statement, changed-row and VM-instruction counts across every connection
+    the bot opens. SQLite doesn't report rows scanned per statement, so VM
+    instructions (counted in steps of VM_STEP_INTERVAL) stand in for it.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._connections: list[sqlite3.Connection] = []
+        self._changes: list[int] = [] # Last total_changes seen per connection
+        self.statements = 0
+        self.vm_steps = 0
+
+    def attach(self, conn: sqlite3.Connection):
+        conn.set_trace_callback(self._on_statement)
+        conn.set_progress_handler(self._on_progress, VM_STEP_INTERVAL)
+        with self._lock:
+            self._connections.append(conn)
+            self._changes.append(0)
+
+    def _on_statement(self, sql: str):
+        with self._lock:
+            self.statements += 1
+
+    def _on_progress(self) -> int:
+        with self._lock:
+            self.vm_steps += 1
+        return 0 # Non-zero would abort the statement
+
+    def snapshot(self) -> tuple[int, int, int]:
+        with self._lock:
+            for index, conn in enumerate(self._connections):
+                try:
+                    self._changes[index] = conn.total_changes
+                except sqlite3.ProgrammingError:
+                    pass # Closed (e.g. the migration connection), keep its last count
+            return self.statements, sum(self._changes), self.vm_steps * VM_STEP_INTERVAL
+
+class _RolledBack(Exception):
+    def __init__(self, result):
+        self.result = result
+
+def _tick_then_roll_back(conn: sqlite3.Connection, *args):
+    # run_write rolls back on any exception, which undoes the whole tick
+    raise _RolledBack(production.run_production_tick(conn, *args))
+
+@dataclass
+class Benchmark:
+    name: str
+    iterations: int
+    op: object # async def op(iteration: int)
+
+async def run_benchmark(benchmark: Benchmark, counters: DbCounters | None, warmup: int) -> dict:
+    errors = []
+    for iteration in range(warmup):
+        await benchmark.op(-1 - iteration)
+    before = counters.snapshot() if counters else (0, 0, 0)
+    durations = []
+    started = time.perf_counter()
+    for iteration in range(benchmark.iterations):
+        op_started = time.perf_counter()
+        try:
+            await benchmark.op(iteration)
+        except Exception as e:
+            errors.append(f"{type(e).__name__}: {e}")
+        durations.append((time.perf_counter() - op_started) * 1000)
+    elapsed = time.perf_counter() - started
+    after = counters.snapshot() if counters else (0, 0, 0)
+
+    durations.sort()
+    percentile = offline_harness.percentile
+    statements, rows_changed, vm_instructions = (end - start for start, end in zip(before, after))
+    return {
+        "iterations": benchmark.iterations,
+        "errors": len(errors),
+        "first_error": errors[0] if errors else None,
+        "ops_per_second": benchmark.iterations / elapsed if elapsed else 0.0,
+        "p50_ms": percentile(durations, 0.50),
+        "p99_ms": percentile(durations, 0.99),
+        "max_ms": durations[-1] if durations else 0.0,
+        "statements_per_op": statements / benchmark.iterations,
+        "rows_changed_per_op": rows_changed / benchmark.iterations,
+        "vm_instructions_per_op": vm_instructions / benchmark.iterations,
+    }
+
+def build_benchmarks(harness: offline_harness.Harness, size: WorldSize, args: argparse.Namespace) -> list[Benchmark]:
+    import main # Already imported by create_harness, from the work directory
+    client = harness.client
+    rng = random.Random(args.seed)
+    channel = harness.client.channel()
+    harness.channels = [channel]
+    members = [FakeUser(member_id(index), f"member{index}") for index in range(size.members)]
+    hot_members = members[:args.hot_users] # A small set that stays in character_cache
+
+    async def checked(coro, interaction):
+        await coro
+        # Commands report their own failures as a message rather than raising
+        if interaction is not None and interaction.calls and (interaction.calls[0].content or "").startswith("An error occurred"):
+            raise RuntimeError(interaction.calls[0].content)
+
+    def command(qualified_name: str, users: list[FakeUser], **params):
+        app_command = client.app_command(qualified_name)
+        async def op(iteration: int):
+            interaction = harness.interaction(rng.choice(users), channel)
+            await checked(app_command.callback(app_command.binding, interaction, **params), interaction)
+        return op
+
+    def autocomplete(cog_name: str, method: str, queries: list[str], **namespace):
+        callback = getattr(client.get_cog(cog_name), method)
+        async def op(iteration: int):
+            await callback(harness.interaction(rng.choice(members), channel, **namespace), rng.choice(queries))
+        return op
+
+    async def production_tick(iteration: int):
+        try:
+            await db_utils.run_write(_tick_then_roll_back, int(time.time()), dice.DiceSampler(args.seed), main.PRODUCTION_BATCH_SIZE)
+        except _RolledBack as rolled_back:
+            if rolled_back.result.buildings_collected == 0:
+                raise RuntimeError("Nothing was due, the world is older than its due times")
+
+    async def on_message_known(iteration: int):
+        message = FakeMessage(harness.recorder, channel, author=rng.choice(members), content="Roll for initiative!")
+        await client.on_message(message)
+
+    async def on_message_new(iteration: int):
+        message = FakeMessage(harness.recorder, channel, author=FakeUser(), content="Hello, is this the tavern?")
+        await client.on_message(message)
+
+    iterations = args.iterations
+    return [
+        Benchmark("production_tick", args.production_iterations, production_tick),
+        Benchmark("view_my_buildings", iterations, command("building mybuildings", members)),
+        Benchmark("view_my_buildings_cached_user", iterations, command("building mybuildings", hot_members)),
+        Benchmark("building_type_autocomplete", iterations, autocomplete("BuildingCog", "building_type_autocomplete", ["", "m", "mine", "farm", "zz"])),
+        Benchmark("user_character_autocomplete", iterations, autocomplete("CharacterCog", "user_character_autocomplete", ["", "char", "1"])),
+        Benchmark("class_name_autocomplete", iterations, autocomplete("CharacterCog", "class_name_autocomplete", ["", "wi", "r"])),
+        Benchmark("currency_type_autocomplete", iterations, autocomplete("EconomyCog", "currency_type_autocomplete", ["", "g", "silver"])),
+        Benchmark("creature_autocomplete", iterations, autocomplete("HarvestingCog", "creature_autocomplete", ["", "dr", "beast"])),
+        Benchmark("component_autocomplete", iterations, autocomplete("HarvestingCog", "component_autocomplete", ["", "b", "eye"], creature="dragon")),
+        Benchmark("on_message_known_member", iterations, on_message_known),
+        Benchmark("on_message_new_member", iterations, on_message_new),
+    ]
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compare(report: dict, baseline: dict, tolerance: float) -> list[str]:
+    """Returns a line per benchmark whose p50 or statements per op grew by more than `tolerance` (a fraction)."""
+    regressions = []
+    for name, stats in report["benchmarks"].items():
+        old = baseline.get("benchmarks", {}).get(name)
+        if old is None:
+            continue
+        for metric in ("p50_ms", "statements_per_op"):
+            if old[metric] > 0 and stats[metric] > old[metric] * (1 + tolerance):
+                regressions.append(f"{name}: {metric} {old[metric]:.3f} -> {stats[metric]:.3f} ({stats[metric] / old[metric] - 1:+.0%})")
+    return regressions
+
+def print_report(report: dict, baseline: dict | None):
+    print(f"{'benchmark':<32} {'ops/s':>10} {'p50 ms':>9} {'p99 ms':>9} {'stmts/op':>9} {'rows/op':>9} {'vm/op':>11} {'vs base':>8}")
+    for name, stats in report["benchmarks"].items():
+        old = (baseline or {}).get("benchmarks", {}).get(name)
+        change = f"{stats['p50_ms'] / old['p50_ms'] - 1:+.0%}" if old and old["p50_ms"] else ""
+        print(f"{name:<32} {stats['ops_per_second']:>10.0f} {stats['p50_ms']:>9.3f} {stats['p99_ms']:>9.3f} "
+              f"{stats['statements_per_op']:>9.1f} {stats['rows_changed_per_op']:>9.1f} {stats['vm_instructions_per_op']:>11.0f} {change:>8}")
+        if stats["first_error"]:
+            print(f"    {stats['errors']} errors, first: {stats['first_error']}")
+
+async def run(args: argparse.Namespace) -> dict:
+    size = WorldSize.scaled(args.scale)
+    now = int(time.time())
+    os.makedirs(WORLD_DIR, exist_ok=True)
+    path = world_path(size, args.seed)
+    if not os.path.exists(path):
+        print(f"Generating {size} into {path}...")
+        started = time.perf_counter()
+        generate_world(path, size, args.seed, now)
+        print(f"Generated in {time.perf_counter() - started:.1f}s.")
+
+    with tempfile.TemporaryDirectory(prefix="dnd-benchmark-") as work_dir:
+        shutil.copy(path, os.path.join(work_dir, "database.db"))
+        shift_world_clock(os.path.join(work_dir, "database.db"), now)
+        counters = None
+        if not args.no_db_counters:
+            counters = DbCounters()
+            db_utils.CONNECTION_HOOKS.append(counters.attach)
+        cwd = os.getcwd()
+        os.chdir(work_dir) # main writes discord.log and the command tree hash to the working directory
+        try:
+            harness = await offline_harness.create_harness(work_dir)
+            results = {}
+            for benchmark in build_benchmarks(harness, size, args):
+                if args.only and benchmark.name not in args.only:
+                    continue
+                print(f"Running {benchmark.name}...")
+                results[benchmark.name] = await run_benchmark(benchmark, counters, min(args.warmup, benchmark.iterations))
+            await harness.client.close()
+        finally:
+            os.chdir(cwd)
+
+    return {
+        "meta": {
+            "commit": git_commit(),
+            "created_at": now,
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "world": vars(size),
+            "settings": {key: value for key, value in vars(args).items() if key not in ("json", "compare")},
+        },
+        "benchmarks": results,
+    }
+
+def shift_world_clock(path: str, now: int):
+    """Moves every building's times forward by the world's age, as if it had been generated just now."""
+    conn = sqlite3.connect(path)
+    try:
+        (generated_at,) = conn.execute("SELECT generated_at FROM benchmark_world").fetchone()
+        conn.execute(
+            "UPDATE character_buildings SET last_collection_time = last_collection_time + ?, next_due_time = next_due_time + ?",
+            (now - generated_at, now - generated_at)
+        )
+        conn.commit()
+    finally:
+        conn.close()
+
+def main_cli():
+    parser = argparse.ArgumentParser(description="Benchmark the bot's hot paths against a synthetic world.")
+    parser.add_argument("--scale", type=float, default=1.0, help="World size relative to 100k members / 300k characters / 1M buildings.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--iterations", type=int, default=2000, help="Operations per benchmark.")
+    parser.add_argument("--production-iterations", type=int, default=10, help="Production ticks to run (each is one batch).")
+    parser.add_argument("--warmup", type=int, default=20, help="Untimed operations before each benchmark.")
+    parser.add_argument("--hot-users", type=int, default=50, help="Users in the cached-user benchmarks.")
+    parser.add_argument("--only", nargs="*", help="Run only these benchmarks.")
+    parser.add_argument("--no-db-counters", action="store_true", help="Skip the SQLite trace and progress hooks (slightly faster, no row counts).")
+    parser.add_argument("--json", help="Write the report to this file.")
+    parser.add_argument("--compare", help="A previous report to compare against. Exits with 1 on a regression.")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed p50 / statements-per-op growth before --compare fails.")
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as baseline_file:
+            baseline = json.load(baseline_file)
+    print_report(report, baseline)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as report_file:
+            json.dump(report, report_file, indent=2)
+    if baseline is not None:
+        regressions = compare(report, baseline, args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION: {line}")
+        if regressions:
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,98 @@
+import heapq
+import sqlite3
+from dataclasses import dataclass
+
+import database as db_utils
+from constants import FREQUENCY_SECONDS
+from dice import DiceExpression, parse_dice
+
+NGRAM_SIZE = 3 # Longest substring indexed; longer queries intersect their trigrams
+
+@dataclass(frozen=True)
+class BuildingType:
+    id: int
+    name: str
+    resource_output: str # e.g., "1d6"
+    resource_type: str # Lowercased, e.g., "gp" or "herbs"
+    resource_frequency: str # Lowercased, e.g., "daily"
+    interval: int | None # Seconds between collections, None if the frequency is unknown
+    dice: DiceExpression | None # Parsed resource_output, None if it isn't valid 'NdS'
+
+class BuildingCatalog:
+    """
+    Every building type, loaded once and kept in memory. The table is tiny and
+    only changes through /building addtype, which calls reload() afterwards.
+    Names are indexed by every substring of up to NGRAM_SIZE characters so
+    autocomplete can do substring matching without scanning.
+    """
+
+    def __init__(self):
+        self._types: dict[int, BuildingType] = {}
+        self._sorted: list[BuildingType] = [] # By name, for empty queries and stable result order
+        self._rank: dict[int, int] = {} # type id -> position in _sorted
+        self._ngrams: dict[str, set[int]] = {}
+
+    def load(self, conn: sqlite3.Connection):
+        rows = conn.execute(
+            "SELECT id, name, resource_output, resource_type, resource_frequency FROM building_types"
+        ).fetchall()
+
+        types = {}
+        for row in rows:
+            frequency = (row["resource_frequency"] or "").lower()
+            try:
+                dice = parse_dice(row["resource_output"])
+            except (ValueError, AttributeError):
+                dice = None
+            types[row["id"]] = BuildingType(
+                id=row["id"],
+                name=row["name"],
+                resource_output=row["resource_output"],
+                resource_type=(row["resource_type"] or "").lower(),
+                resource_frequency=frequency,
+                interval=FREQUENCY_SECONDS.get(frequency),
+                dice=dice,
+            )
+
+        ngrams: dict[str, set[int]] = {}
+        for building_type in types.values():
+            name = building_type.name.lower()
+            for size in range(1, NGRAM_SIZE + 1):
+                for start in range(len(name) - size + 1):
+                    ngrams.setdefault(name[start:start + size], set()).add(building_type.id)
+
+        sorted_types = sorted(types.values(), key=lambda building_type: building_type.name.lower())
+        rank = {building_type.id: position for position, building_type in enumerate(sorted_types)}
+        # Publish the lookup tables before the index that points into them, so a
+        # search running on another thread never finds an id it can't resolve
+        self._types, self._sorted, self._rank = types, sorted_types, rank
+        self._ngrams = ngrams
+
+    async def reload(self):
+        await db_utils.run_read(self.load)
+        print(f"DEBUG: Building catalog loaded {len(self._types)} building types.")
+
+    def get(self, building_type_id: int) -> BuildingType | None:
+        return self._types.get(building_type_id)
+
+    def __len__(self) -> int:
+        return len(self._types)
+
+    def search(self, query: str, limit: int = 25) -> list[BuildingType]:
+        """Building types whose name contains query (case-insensitive), sorted by name."""
+        query = query.lower()
+        if not query:
+            return self._sorted[:limit]
+
+        if len(query) <= NGRAM_SIZE:
+            candidate_ids = self._ngrams.get(query, set())
+        else:
+            postings = [self._ngrams.get(query[start:start + NGRAM_SIZE], set()) for start in range(len(query) - NGRAM_SIZE + 1)]
+            candidate_ids = set.intersection(*sorted(postings, key=len))
+            # Sharing every trigram doesn't guarantee the whole query is a substring
+            candidate_ids = {type_id for type_id in candidate_ids if query in self._types[type_id].name.lower()}
+
+        return [self._types[type_id] for type_id in heapq.nsmallest(limit, candidate_ids, key=self._rank.__getitem__)]
+
+# Shared instance, loaded in Client.setup_hook
+catalog = BuildingCatalog()
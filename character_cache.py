@@ -0,0 +1,89 @@
+import sqlite3
+from collections import OrderedDict
+from dataclasses import dataclass
+
+import database as db_utils
+
+MAX_CACHED_USERS = 10000
+
+@dataclass(frozen=True)
+class UserCharacters:
+    """A user's characters and which one is active, as last read from the database."""
+    characters: tuple[tuple[int, str], ...] # (character id, name), in creation order
+    active_character_id: int | None
+
+    @property
+    def active_character_name(self) -> str | None:
+        for character_id, name in self.characters:
+            if character_id == self.active_character_id:
+                return name
+        return None
+
+class CharacterCache:
+    """
+    Bounded LRU cache of each user's characters and active character. Anything
+    that changes a user's characters or active character must call
+    invalidate() after its write commits.
+    """
+
+    def __init__(self, max_users: int = MAX_CACHED_USERS):
+        self.max_users = max_users
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[str, UserCharacters] = OrderedDict()
+        # Loads in flight per user. invalidate() discards them, so a load that started
+        # before the invalidation doesn't store stale data.
+        self._loads: dict[str, set[object]] = {}
+
+    @staticmethod
+    def _load(conn: sqlite3.Connection, discord_id: str) -> UserCharacters:
+        characters = conn.execute(
+            "SELECT id, name FROM characters WHERE discord_id = ? ORDER BY id", (discord_id,)
+        ).fetchall()
+        member = conn.execute("SELECT active_character_id FROM members WHERE discord_id = ?", (discord_id,)).fetchone()
+        return UserCharacters(
+            characters=tuple((row["id"], row["name"]) for row in characters),
+            active_character_id=member["active_character_id"] if member else None,
+        )
+
+    async def get(self, discord_id: str) -> UserCharacters:
+        entry = self._entries.get(discord_id)
+        if entry is not None:
+            self.hits += 1
+            self._entries.move_to_end(discord_id)
+            return entry
+
+        self.misses += 1
+        load = object()
+        self._loads.setdefault(discord_id, set()).add(load)
+        try:
+            entry = await db_utils.run_read(self._load, discord_id)
+        finally:
+            loads = self._loads.get(discord_id)
+            still_valid = loads is not None and load in loads
+            if still_valid:
+                loads.discard(load)
+                if not loads:
+                    del self._loads[discord_id]
+        if still_valid:
+            self._entries[discord_id] = entry
+            self._entries.move_to_end(discord_id)
+            while len(self._entries) > self.max_users:
+                self._entries.popitem(last=False)
+        return entry
+
+    def invalidate(self, discord_id: str):
+        self._entries.pop(discord_id, None)
+        self._loads.pop(discord_id, None)
+
+    def stats(self) -> dict[str, int | float]:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+# Shared instance used by the character, economy and building cogs
+cache = CharacterCache()
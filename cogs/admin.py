@@ -0,0 +1,179 @@
+import asyncio
+import os
+import threading
+import time
+
+import discord
+from discord.ext import commands
+from discord import app_commands
+
+import config # For TEST_SERVER_ID
+import metrics
+import sql_profiler
+import tracing
+from sampling_profiler import SamplingProfiler, profile_path
+
+STATS_ROWS = 8 # Lines per /admin stats section
+MAX_ATTACHMENT_BYTES = 8 * 1024 * 1024 # Larger profiles are only written to disk
+
+def format_ms(seconds: float) -> str:
+    return f"{seconds * 1000:.1f}ms"
+
+def label_value(labels: metrics.Labels, name: str) -> str:
+    return dict(labels).get(name, "?")
+
+def stats_block(lines: list[str]) -> str:
+    # Embed field values are capped at 1024 characters
+    text = "\n".join(lines) if lines else "No data yet."
+    return f"```\n{text[:1000]}\n```"
+
+class AdminCog(commands.Cog):
+    def __init__(self, bot: commands.Bot):
+        self.bot = bot
+
+    admin_group = app_commands.Group(
+        name="admin",
+        description="Bot maintenance commands (Admin only).",
+        default_permissions=discord.Permissions(administrator=True)
+    )
+
+    @admin_group.command(name="sync", description="Force a sync of the slash command tree with Discord.")
+    @app_commands.checks.has_permissions(administrator=True)
+    async def sync_commands(self, interaction: discord.Interaction):
+        await interaction.response.defer(ephemeral=True) # Syncing can take a few seconds
+        synced_count = await self.bot.sync_command_tree(force=True)
+        if synced_count is None:
+            await interaction.followup.send("Command sync failed, check the bot logs.", ephemeral=True)
+        else:
+            await interaction.followup.send(f"Synced {synced_count} commands.", ephemeral=True)
+
+    @admin_group.command(name="stats", description="Show command, database, production and cache metrics.")
+    @app_commands.checks.has_permissions(administrator=True)
+    async def stats(self, interaction: discord.Interaction):
+        embed = discord.Embed(title="Bot Stats", color=discord.Color.dark_grey())
+
+        command_errors: dict[str, float] = {}
+        for labels, count in metrics.COMMAND_ERRORS.values().items():
+            command = label_value(labels, "command")
+            command_errors[command] = command_errors.get(command, 0) + count
+        commands_by_use = sorted(metrics.COMMAND_SECONDS.series().items(), key=lambda item: item[1].count, reverse=True)
+        embed.add_field(name="Commands (count, errors, p50, p99)", value=stats_block([
+            f"/{label_value(labels, 'command')[:28]:<28} {series.count:>6} {command_errors.get(label_value(labels, 'command'), 0):>4.0f} "
+            f"{format_ms(series.quantile(0.5)):>8} {format_ms(series.quantile(0.99)):>8}"
+            for labels, series in commands_by_use[:STATS_ROWS]
+        ]), inline=False)
+
+        queries_by_time = sorted(metrics.DB_QUERY_SECONDS.series().items(), key=lambda item: item[1].total, reverse=True)
+        embed.add_field(name="Database, by total time (count, total, p99)", value=stats_block([
+            f"{label_value(labels, 'query')[:40]:<40} {series.count:>7} {series.total:>7.2f}s {format_ms(series.quantile(0.99)):>8}"
+            for labels, series in queries_by_time[:STATS_ROWS]
+        ]), inline=False)
+
+        write_wait = metrics.DB_WRITE_WAIT_SECONDS.series().get(())
+        ticks = metrics.PRODUCTION_TICK_SECONDS.series().get(())
+        payouts = sorted(metrics.PRODUCTION_PAYOUT.values().items(), key=lambda item: item[1], reverse=True)
+        production_lines = []
+        if ticks:
+            production_lines.append(f"ticks {ticks.count}, p50 {format_ms(ticks.quantile(0.5))}, max {format_ms(ticks.maximum)}")
+        production_lines.append(f"buildings collected {metrics.PRODUCTION_BUILDINGS_COLLECTED.values().get((), 0):.0f}")
+        production_lines += [f"{label_value(labels, 'resource')}: {amount:.0f}" for labels, amount in payouts[:STATS_ROWS]]
+        embed.add_field(name="Production", value=stats_block(production_lines), inline=False)
+
+        lag = metrics.EVENT_LOOP_LAG_SECONDS.series().get(())
+        runtime_lines = []
+        if lag:
+            runtime_lines.append(f"event loop lag p99 {format_ms(lag.quantile(0.99))}, max {format_ms(lag.maximum)}")
+        if write_wait:
+            runtime_lines.append(f"writer queue wait p99 {format_ms(write_wait.quantile(0.99))}, max {format_ms(write_wait.maximum)}")
+        for name in ("dnd_character_cache_hit_ratio", "dnd_character_cache_size", "dnd_member_registry_size", "dnd_member_registry_pending"):
+            gauge = metrics.registry.get(name)
+            if gauge is not None:
+                runtime_lines.append(f"{name.removeprefix('dnd_')}: {gauge.values()[()]:g}")
+        embed.add_field(name="Runtime", value=stats_block(runtime_lines), inline=False)
+
+        await interaction.response.send_message(embed=embed, ephemeral=True)
+
+    @admin_group.command(name="sqlprofile", description="Show the statements taking the most database time (needs SQL_PROFILE=1).")
+    @app_commands.checks.has_permissions(administrator=True)
+    async def sql_profile(self, interaction: discord.Interaction):
+        profiler = sql_profiler.profiler
+        if profiler is None:
+            await interaction.response.send_message("SQL profiling is off. Set `SQL_PROFILE=1` and restart the bot.", ephemeral=True)
+            return
+
+        statements = profiler.statements()
+        embed = discord.Embed(title="SQL Profile", color=discord.Color.dark_grey())
+        embed.add_field(name="By total time (total, max, runs)", value=stats_block([
+            f"{stats.total_seconds:>7.2f}s {stats.max_seconds * 1000:>7.1f}ms {stats.executions:>7}  {stats.sql[:60]}"
+            for stats in statements[:STATS_ROWS]
+        ]), inline=False)
+        scans = [stats for stats in statements if stats.full_scans]
+        embed.add_field(name="Full table scans", value=stats_block([
+            f"{', '.join(stats.full_scans)}: {stats.sql[:70]}" for stats in scans[:STATS_ROWS]
+        ]), inline=False)
+        await interaction.response.send_message(embed=embed, ephemeral=True)
+
+    @admin_group.command(name="profile", description="Sample the bot's stacks for a while and write a flamegraph-ready file.")
+    @app_commands.checks.has_permissions(administrator=True)
+    @app_commands.describe(
+        seconds="How long to sample for.",
+        all_threads="Also sample the database threads, not just the event loop."
+    )
+    async def profile(self, interaction: discord.Interaction, seconds: app_commands.Range[int, 1, 120] = 10, all_threads: bool = False):
+        if SamplingProfiler.is_running():
+            await interaction.response.send_message("A profile is already running.", ephemeral=True)
+            return
+        await interaction.response.defer(ephemeral=True, thinking=True)
+
+        # This runs on the event loop thread, which is the one worth sampling
+        profiler = SamplingProfiler(None if all_threads else {threading.get_ident()})
+        try:
+            await asyncio.to_thread(profiler.run, seconds)
+        except RuntimeError as e: # Another profile started in between
+            await interaction.followup.send(str(e), ephemeral=True)
+            return
+        path = profile_path()
+        await asyncio.to_thread(profiler.write_collapsed, path)
+
+        lines = [f"{count / profiler.samples:>6.1%}  {frame[:70]}" for frame, count in profiler.top_frames(STATS_ROWS)]
+        message = f"{profiler.samples} samples over {seconds}s written to `{path}`. Busiest frames (self time):\n{stats_block(lines)}"
+        if os.path.getsize(path) <= MAX_ATTACHMENT_BYTES:
+            await interaction.followup.send(message, file=discord.File(path), ephemeral=True)
+        else:
+            await interaction.followup.send(message, ephemeral=True)
+
+    @admin_group.command(name="trace", description="Record a timeline of every interaction for a while, as JSONL.")
+    @app_commands.checks.has_permissions(administrator=True)
+    @app_commands.describe(seconds="How long to record for.")
+    async def trace(self, interaction: discord.Interaction, seconds: app_commands.Range[int, 1, 600] = 60):
+        if tracing.tracer.recording:
+            await interaction.response.send_message("A trace is already being recorded.", ephemeral=True)
+            return
+        try:
+            tracing.install(self.bot) # Only hooked into discord.py while recording
+        except RuntimeError as e:
+            print(f"ERROR: Could not start interaction tracing: {e}")
+            await interaction.response.send_message(f"Interaction tracing is unavailable: {e}", ephemeral=True)
+            return
+        os.makedirs(tracing.TRACE_DIR, exist_ok=True)
+        path = os.path.join(tracing.TRACE_DIR, f"trace-{time.strftime('%Y%m%d-%H%M%S')}.jsonl")
+        tracing.tracer.start(path)
+        await interaction.response.send_message(f"Recording interaction traces to `{path}` for {seconds}s.", ephemeral=True)
+
+        await asyncio.sleep(seconds)
+        spans_written = tracing.tracer.spans_written
+        summaries = await asyncio.to_thread(tracing.tracer.stop) # Waits for the writer to finish the file
+        tracing.uninstall(self.bot)
+        lines = [f"{summary.duration_ms:>9.1f}ms  {summary.name[:60]}" for summary in summaries[:STATS_ROWS]]
+        await interaction.followup.send(
+            f"Recorded {len(summaries)} interactions ({spans_written} spans) to `{path}`. Slowest:\n{stats_block(lines)}",
+            ephemeral=True
+        )
+
+async def setup(bot: commands.Bot):
+    guild_id = int(config.TEST_SERVER_ID) if config.TEST_SERVER_ID else None
+    if guild_id:
+        await bot.add_cog(AdminCog(bot), guilds=[discord.Object(id=guild_id)])
+    else:
+        await bot.add_cog(AdminCog(bot))
+    print("AdminCog loaded.")
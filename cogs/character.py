@@ -8,6 +8,7 @@ from typing import List
 # Assuming config.py and database.py are in the parent directory (project root)
 import config # Import the whole config module
 import database as db_utils
+from character_cache import cache as character_cache
 
 class CharacterCog(commands.Cog):
     def __init__(self, bot: commands.Bot):
@@ -18,17 +19,11 @@ class CharacterCog(commands.Cog):
     async def user_character_autocomplete(self, interaction: discord.Interaction, current: str) -> List[Choice[str]]:
         """Autocompletes character names owned by the user."""
         choices = []
-        conn = db_utils.get_db_connection()
-        cursor = conn.cursor()
-        try:
-            cursor.execute("SELECT id, name FROM characters WHERE discord_id = ?", (str(interaction.user.id),))
-            user_characters = cursor.fetchall()
-            for char_id, char_name in user_characters:
-                if current.lower() in char_name.lower():
-                    choices.append(Choice(name=char_name, value=str(char_id))) # Store ID as value
-            return choices[:25]
-        finally:
-            conn.close()
+        user_characters = (await character_cache.get(str(interaction.user.id))).characters
+        for char_id, char_name in user_characters:
+            if current.lower() in char_name.lower():
+                choices.append(Choice(name=char_name, value=str(char_id))) # Store ID as value
+        return choices[:25]
 
     async def class_name_autocomplete(self, interaction: discord.Interaction, current: str) -> List[Choice[str]]:
         """Autocompletes D&D 5e class names."""
@@ -46,17 +41,26 @@ class CharacterCog(commands.Cog):
             # Acknowledge the interaction immediately
             await interaction.response.defer()
 
-            conn = db_utils.get_db_connection()
-            cursor = conn.cursor()
-            try:
-                cursor.execute('SELECT COUNT(*) FROM characters WHERE discord_id = ?', (str(interaction.user.id),))
-                count = cursor.fetchone()[0]
+            is_spellcaster = class_name.lower() in config.SPELLCASTING_CLASSES
+
+            def insert_character(conn) -> bool:
+                # Count and insert in one write transaction so two quick creates can't both pass the limit
+                count = conn.execute('SELECT COUNT(*) FROM characters WHERE discord_id = ?', (str(interaction.user.id),)).fetchone()[0]
                 if count >= 3:
+                    return False
+                conn.execute(
+                    'INSERT INTO characters (discord_id, name, class, spellcaster) VALUES (?, ?, ?, ?)',
+                    (str(interaction.user.id), name, class_name, is_spellcaster)
+                )
+                return True
+
+            try:
+                created = await db_utils.run_write(insert_character)
+                character_cache.invalidate(str(interaction.user.id))
+                if not created:
                     await interaction.followup.send("You can only have up to 3 characters!", ephemeral=True)
                     return
 
-                is_spellcaster = class_name.lower() in config.SPELLCASTING_CLASSES
-
                 # approval_channel = discord.utils.get(interaction.guild.text_channels, name="character-approvals")
                 # if not approval_channel:
                 #     await interaction.response.send_message("Configuration error: 'character-approvals' channel not found.", ephemeral=True)
@@ -84,11 +88,6 @@ class CharacterCog(commands.Cog):
                 # reaction, user = await self.bot.wait_for('reaction_add', timeout=86400.0, check=check) # 24 hour timeout
 
                 # if str(reaction.emoji) == "✅":
-                cursor.execute(
-                    'INSERT INTO characters (discord_id, name, class, spellcaster) VALUES (?, ?, ?, ?)',
-                    (str(interaction.user.id), name, class_name, is_spellcaster)
-                )
-                conn.commit()
                 await interaction.followup.send(f"Character '{name}' ({class_name}) has been created!", ephemeral=True)
                 # await approval_channel.send(f"{user.mention} approved character '{name}' for {interaction.user.mention}.")
                 # else:
@@ -104,8 +103,6 @@ class CharacterCog(commands.Cog):
             except Exception as e:
                 await interaction.followup.send("An error occurred during character creation.", ephemeral=True)
                 print(f"Error in create_character: {e}")
-            finally:
-                conn.close()
         except discord.errors.NotFound:
             # Handle expired interaction token
             print("Interaction token expired. Sending message directly to the channel.")
@@ -127,47 +124,45 @@ class CharacterCog(commands.Cog):
     async def set_active_character(self, interaction: discord.Interaction, character: str):
         character_id_to_set = int(character) # Value from autocomplete is the character ID
 
-        conn = db_utils.get_db_connection()
-        cursor = conn.cursor()
-        try:
+        def activate_character(conn) -> str | None:
             # Verify the character belongs to the user (though autocomplete should handle this)
-            cursor.execute("SELECT name FROM characters WHERE id = ? AND discord_id = ?", 
-                           (character_id_to_set, str(interaction.user.id)))
-            char_data = cursor.fetchone()
-
+            char_data = conn.execute("SELECT name FROM characters WHERE id = ? AND discord_id = ?",
+                                     (character_id_to_set, str(interaction.user.id))).fetchone()
             if not char_data:
-                await interaction.response.send_message("Invalid character selected or character not found.", ephemeral=True)
-                return
-
-            character_name = char_data['name']
+                return None
 
             # Update the members table
-            cursor.execute("UPDATE members SET active_character_id = ? WHERE discord_id = ?",
-                           (character_id_to_set, str(interaction.user.id)))
+            cursor = conn.execute("UPDATE members SET active_character_id = ? WHERE discord_id = ?",
+                                  (character_id_to_set, str(interaction.user.id)))
             # If the user wasn't in members table yet (e.g., only interacted via slash commands)
             if cursor.rowcount == 0:
-                cursor.execute("INSERT INTO members (discord_id, discord_tag, active_character_id) VALUES (?, ?, ?)",
-                               (str(interaction.user.id), str(interaction.user), character_id_to_set))
-            conn.commit()
+                conn.execute("INSERT INTO members (discord_id, discord_tag, active_character_id) VALUES (?, ?, ?)",
+                             (str(interaction.user.id), str(interaction.user), character_id_to_set))
+            return char_data['name']
+
+        try:
+            character_name = await db_utils.run_write(activate_character)
+            character_cache.invalidate(str(interaction.user.id))
+            if not character_name:
+                await interaction.response.send_message("Invalid character selected or character not found.", ephemeral=True)
+                return
+            # The members row exists now, so on_message doesn't need to register this user
+            self.bot.member_registry.mark_known(str(interaction.user.id))
+
             await interaction.response.send_message(f"'{character_name}' is now your active character.", ephemeral=True)
         except Exception as e:
             await interaction.response.send_message(f"An error occurred: {e}", ephemeral=True)
             print(f"Error in set_active_character: {e}")
-        finally:
-            conn.close()
 
     @character_group.command(name="viewactive", description="View your currently active character.")
     async def view_active_character(self, interaction: discord.Interaction):
-        conn = db_utils.get_db_connection()
-        cursor = conn.cursor()
         try:
-            cursor.execute("""
+            active_char = await db_utils.fetch_one("""
                 SELECT c.name, c.class, c.spellcaster 
                 FROM members m
                 JOIN characters c ON m.active_character_id = c.id
                 WHERE m.discord_id = ?
             """, (str(interaction.user.id),))
-            active_char = cursor.fetchone()
 
             if active_char:
                 embed = discord.Embed(title="Active Character", color=discord.Color.green())
@@ -180,8 +175,6 @@ class CharacterCog(commands.Cog):
         except Exception as e:
             await interaction.response.send_message(f"An error occurred: {e}", ephemeral=True)
             print(f"Error in view_active_character: {e}")
-        finally:
-            conn.close()
 
 
 async def setup(bot: commands.Bot):
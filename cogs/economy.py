@@ -1,4 +1,5 @@
 import sqlite3
+import time
 import discord
 from discord.ext import commands
 from discord import app_commands
@@ -6,19 +7,11 @@ from discord.app_commands import Choice
 from typing import List, Dict, Tuple
 
 import database as db_utils
+import wallet
+from constants import CURRENCY_UNITS, CURRENCY_ORDER # Re-exported, other modules import them from here
+from character_cache import cache as character_cache
 import config # For TEST_SERVER_ID
 
-# --- Currency Definitions ---
-CURRENCY_UNITS: Dict[str, Dict[str, any]] = {
-    "cp": {"name": "Copper Pieces", "value_in_cp": 1, "column": "cp"},
-    "sp": {"name": "Silver Pieces", "value_in_cp": 10, "column": "sp"},
-    "ep": {"name": "Electrum Pieces", "value_in_cp": 50, "column": "ep"},
-    "gp": {"name": "Gold Pieces", "value_in_cp": 100, "column": "gp"},
-    "pp": {"name": "Platinum Pieces", "value_in_cp": 1000, "column": "pp"},
-}
-# Order for display and calculations (highest to lowest value)
-CURRENCY_ORDER: List[str] = ["pp", "gp", "ep", "sp", "cp"]
-
 class EconomyCog(commands.Cog):
     def __init__(self, bot: commands.Bot):
         self.bot = bot
@@ -27,62 +20,44 @@ class EconomyCog(commands.Cog):
 
     async def get_active_character_id_and_name(self, user_id: str) -> Tuple[int | None, str | None]:
         """Fetches the active character ID and name for a given user."""
-        conn = db_utils.get_db_connection()
-        cursor = conn.cursor()
-        try:
-            cursor.execute("""
-                SELECT c.id, c.name
-                FROM members m
-                JOIN characters c ON m.active_character_id = c.id
-                WHERE m.discord_id = ?
-            """, (user_id,))
-            char_data = cursor.fetchone()
-            if char_data:
-                return char_data['id'], char_data['name']
-            return None, None
-        finally:
-            conn.close()
+        user_characters = await character_cache.get(user_id)
+        active_name = user_characters.active_character_name
+        if active_name is not None:
+            return user_characters.active_character_id, active_name
+        return None, None
 
     async def get_character_wallet(self, character_id: int) -> Dict[str, int] | None:
         """Fetches the wallet balance for a given character ID."""
-        conn = db_utils.get_db_connection()
-        cursor = conn.cursor()
-        try:
-            currency_columns = ", ".join([unit_data["column"] for unit_data in CURRENCY_UNITS.values()])
-            cursor.execute(f"SELECT {currency_columns} FROM characters WHERE id = ?", (character_id,))
-            wallet_data = cursor.fetchone()
-            if wallet_data:
-                return {unit: wallet_data[unit_data["column"]] for unit, unit_data in CURRENCY_UNITS.items()}
-            return None
-        finally:
-            conn.close()
+        currency_columns = ", ".join([unit_data["column"] for unit_data in CURRENCY_UNITS.values()])
+        wallet_data = await db_utils.fetch_one(f"SELECT {currency_columns} FROM characters WHERE id = ?", (character_id,))
+        if wallet_data:
+            return {unit: wallet_data[unit_data["column"]] for unit, unit_data in CURRENCY_UNITS.items()}
+        return None
 
     async def update_character_wallet(self, character_id: int, currency_unit: str, amount_change: int) -> bool:
         """Updates a specific currency unit in a character's wallet. Amount can be positive or negative."""
         if currency_unit not in CURRENCY_UNITS:
             return False
         
-        column_name = CURRENCY_UNITS[currency_unit]["column"]
-        conn = db_utils.get_db_connection()
-        cursor = conn.cursor()
+        reason = wallet.REASON_ADD if amount_change > 0 else wallet.REASON_REMOVE
+        return await self.apply_wallet_changes([(character_id, currency_unit, amount_change)], reason)
+
+    async def apply_wallet_changes(self, changes: List[wallet.WalletChange], reason: str) -> bool:
+        """Applies many (character_id, currency, amount) changes in one transaction, all or nothing, and records them in the ledger."""
         try:
-            # Ensure the amount doesn't go negative if removing
-            if amount_change < 0:
-                cursor.execute(f"SELECT {column_name} FROM characters WHERE id = ?", (character_id,))
-                current_amount_row = cursor.fetchone()
-                if not current_amount_row or current_amount_row[column_name] + amount_change < 0:
-                    # Not enough funds to remove
-                    return False 
-            
-            cursor.execute(f"UPDATE characters SET {column_name} = {column_name} + ? WHERE id = ?", 
-                           (amount_change, character_id))
-            conn.commit()
-            return cursor.rowcount > 0
+            # Runs on the writer thread; each debit is a single conditional UPDATE, so no balance can go negative
+            return await db_utils.run_write(wallet.apply_changes, changes, reason)
         except sqlite3.Error as e:
             print(f"Error updating wallet: {e}")
             return False
-        finally:
-            conn.close()
+
+    async def run_wallet_write(self, func, *args):
+        """Runs one of the wallet module's spend operations on the writer thread. None on failure."""
+        try:
+            return await db_utils.run_write(func, *args)
+        except sqlite3.Error as e:
+            print(f"Error updating wallet: {e}")
+            return None
 
     def format_wallet_balance(self, wallet: Dict[str, int]) -> str:
         """Formats the wallet balance for display."""
@@ -104,25 +79,43 @@ class EconomyCog(commands.Cog):
         ][:25]
 
     @wallet_group.command(name="view", description="View your active character's wallet.")
-    async def view_wallet(self, interaction: discord.Interaction):
+    @app_commands.describe(days_ago="Show the balance as it was this many days ago (from the wallet history).")
+    async def view_wallet(self, interaction: discord.Interaction, days_ago: app_commands.Range[int, 0, 3650] = 0):
         active_char_id, active_char_name = await self.get_active_character_id_and_name(str(interaction.user.id))
 
         if not active_char_id:
             await interaction.response.send_message("You do not have an active character set. Use `/character setactive`.", ephemeral=True)
             return
 
-        wallet = await self.get_character_wallet(active_char_id)
-        if wallet is None:
+        if days_ago:
+            at_time = int(time.time()) - days_ago * 86400
+            wallet_balance = await db_utils.run_read(wallet.balance_at, active_char_id, at_time)
+            title = f"{active_char_name}'s Wallet on <t:{at_time}:f>"
+        else:
+            wallet_balance = await self.get_character_wallet(active_char_id)
+            title = f"{active_char_name}'s Wallet"
+        if wallet_balance is None:
             await interaction.response.send_message(f"Could not find wallet information for '{active_char_name}'.", ephemeral=True)
             return
 
         embed = discord.Embed(
-            title=f"{active_char_name}'s Wallet",
-            description=self.format_wallet_balance(wallet),
+            title=title,
+            description=self.format_wallet_balance(wallet_balance),
             color=discord.Color.gold()
         )
         await interaction.response.send_message(embed=embed, ephemeral=True)
 
+    @wallet_group.command(name="history", description="View your active character's wallet history, newest first.")
+    async def wallet_history(self, interaction: discord.Interaction):
+        active_char_id, active_char_name = await self.get_active_character_id_and_name(str(interaction.user.id))
+        if not active_char_id:
+            await interaction.response.send_message("You do not have an active character set. Use `/character setactive` first.", ephemeral=True)
+            return
+
+        rows = await db_utils.run_read(wallet.history_page, active_char_id)
+        view = WalletHistoryView(interaction.user.id, active_char_id, active_char_name, rows, is_newest=True)
+        await interaction.response.send_message(embed=view.build_embed(), view=view, ephemeral=True)
+
     @wallet_group.command(name="add", description="Add currency to your active character's wallet.")
     @app_commands.describe(amount="The amount of currency to add.", currency_type="The type of currency (e.g., gp, sp).")
     @app_commands.autocomplete(currency_type=currency_type_autocomplete)
@@ -161,11 +154,125 @@ class EconomyCog(commands.Cog):
             await interaction.response.send_message("You do not have an active character set. Use `/character setactive` first.", ephemeral=True)
             return
         
-        success = await self.update_character_wallet(active_char_id, currency_type, -amount) # Negative amount for removal
+        # Breaks larger coins and hands back change if the exact coin is short
+        new_balance = await self.run_wallet_write(wallet.spend, active_char_id, currency_type, amount)
+        if new_balance is not None:
+            await interaction.response.send_message(
+                f"Removed {amount} {CURRENCY_UNITS[currency_type]['name']} from {active_char_name}'s wallet.\n"
+                f"New balance: {self.format_wallet_balance(new_balance)}",
+                ephemeral=True
+            )
+        else:
+            await interaction.response.send_message(f"Failed to remove currency. {active_char_name} might not have enough money.", ephemeral=True)
+
+    @wallet_group.command(name="consolidate", description="Exchange your active character's coins for the fewest coins of the same value.")
+    async def consolidate_wallet(self, interaction: discord.Interaction):
+        active_char_id, active_char_name = await self.get_active_character_id_and_name(str(interaction.user.id))
+        if not active_char_id:
+            await interaction.response.send_message("You do not have an active character set. Use `/character setactive` first.", ephemeral=True)
+            return
+
+        new_balance = await self.run_wallet_write(wallet.consolidate, active_char_id)
+        if new_balance is None:
+            await interaction.response.send_message(f"Could not consolidate {active_char_name}'s wallet.", ephemeral=True)
+            return
+        embed = discord.Embed(
+            title=f"{active_char_name}'s Wallet",
+            description=self.format_wallet_balance(new_balance),
+            color=discord.Color.gold()
+        )
+        await interaction.response.send_message(embed=embed, ephemeral=True)
+
+    @wallet_group.command(name="pay", description="Pay currency from your active character to another player's active character.")
+    @app_commands.describe(
+        recipient="The player to pay. Their active character receives the money.",
+        amount="The amount of currency to pay.",
+        currency_type="The type of currency (e.g., gp, sp)."
+    )
+    @app_commands.autocomplete(currency_type=currency_type_autocomplete)
+    async def pay_currency(self, interaction: discord.Interaction, recipient: discord.User, amount: int, currency_type: str):
+        if amount <= 0:
+            await interaction.response.send_message("Amount must be positive.", ephemeral=True)
+            return
+        if currency_type not in CURRENCY_UNITS:
+            await interaction.response.send_message("Invalid currency type.", ephemeral=True)
+            return
+
+        active_char_id, active_char_name = await self.get_active_character_id_and_name(str(interaction.user.id))
+        if not active_char_id:
+            await interaction.response.send_message("You do not have an active character set. Use `/character setactive` first.", ephemeral=True)
+            return
+        recipient_char_id, recipient_char_name = await self.get_active_character_id_and_name(str(recipient.id))
+        if not recipient_char_id:
+            await interaction.response.send_message(f"{recipient.display_name} does not have an active character set.", ephemeral=True)
+            return
+        if recipient_char_id == active_char_id:
+            await interaction.response.send_message("You can't pay your own active character.", ephemeral=True)
+            return
+
+        success = await self.run_wallet_write(wallet.transfer, active_char_id, recipient_char_id, currency_type, amount)
+        currency_name = CURRENCY_UNITS[currency_type]['name']
         if success:
-            await interaction.response.send_message(f"Removed {amount} {CURRENCY_UNITS[currency_type]['name']} from {active_char_name}'s wallet.", ephemeral=True)
+            await interaction.response.send_message(
+                f"{active_char_name} paid {amount} {currency_name} to {recipient_char_name} ({recipient.mention})."
+            )
         else:
-            await interaction.response.send_message(f"Failed to remove currency. {active_char_name} might not have enough {CURRENCY_UNITS[currency_type]['name']}.", ephemeral=True)
+            await interaction.response.send_message(f"Payment failed. {active_char_name} might not have enough money.", ephemeral=True)
+
+class WalletHistoryView(discord.ui.View):
+    """Older/Newer buttons for /wallet history. Pages are fetched by ledger id (keyset), never by offset."""
+
+    def __init__(self, user_id: int, character_id: int, character_name: str, rows: list, is_newest: bool):
+        super().__init__(timeout=300)
+        self.user_id = user_id
+        self.character_id = character_id
+        self.character_name = character_name
+        self.show_page(rows, is_newest)
+
+    def show_page(self, rows: list, is_newest: bool):
+        self.rows = rows
+        self.newer_button.disabled = is_newest
+        self.older_button.disabled = len(rows) < wallet.LEDGER_PAGE_SIZE
+
+    @staticmethod
+    def format_entry(row) -> str:
+        changes = [
+            f"{row[f'{currency}_delta']:+} {currency}"
+            for currency in CURRENCY_ORDER if row[f"{currency}_delta"]
+        ]
+        reason = row["reason"].capitalize()
+        if row["related_character_name"]:
+            reason += f" ({row['related_character_name']})"
+        return f"<t:{row['created_at']}:g> **{reason}**: {', '.join(changes)}"
+
+    def build_embed(self) -> discord.Embed:
+        description = "\n".join(self.format_entry(row) for row in self.rows) if self.rows else "No wallet history yet."
+        return discord.Embed(title=f"{self.character_name}'s Wallet History", description=description, color=discord.Color.gold())
+
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        if interaction.user.id != self.user_id:
+            await interaction.response.send_message("This isn't your wallet history.", ephemeral=True)
+            return False
+        return True
+
+    @discord.ui.button(label="Newer", style=discord.ButtonStyle.secondary)
+    async def newer_button(self, interaction: discord.Interaction, button: discord.ui.Button):
+        rows = await db_utils.run_read(wallet.history_page, self.character_id, None, self.rows[0]["id"])
+        is_newest = len(rows) < wallet.LEDGER_PAGE_SIZE
+        if is_newest: # Fewer than a page left, show the newest page instead
+            rows = await db_utils.run_read(wallet.history_page, self.character_id)
+        self.show_page(rows, is_newest)
+        await interaction.response.edit_message(embed=self.build_embed(), view=self)
+
+    @discord.ui.button(label="Older", style=discord.ButtonStyle.secondary)
+    async def older_button(self, interaction: discord.Interaction, button: discord.ui.Button):
+        rows = await db_utils.run_read(wallet.history_page, self.character_id, self.rows[-1]["id"])
+        if not rows: # The last page was exactly full
+            self.older_button.disabled = True
+            await interaction.response.edit_message(view=self)
+            return
+        self.show_page(rows, is_newest=False)
+        await interaction.response.edit_message(embed=self.build_embed(), view=self)
 
 async def setup(bot: commands.Bot):
     guild_id = int(config.TEST_SERVER_ID) if config.TEST_SERVER_ID else None
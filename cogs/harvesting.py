@@ -1,20 +1,31 @@
 import discord
 from discord.ext import commands, tasks
 from discord import app_commands
-from discord.ui import View, Button # Import View and Button
+from discord.ui import View, Button, Modal, TextInput
 from typing import List
 import random
-import asyncio
+import time
 import os # For os.getenv in setup
 
 # Import directly from the project root
-from constants import HARVEST_DC_TABLES, CREATURE_TYPE_SKILLS
+import database as db_utils
+import harvest_planner
+import inventory
+import harvest_sessions
+from harvest_index import CREATURE_NAMES, CreatureHarvest, get_creature # Precomputed from HARVEST_DC_TABLES
+from harvest_sessions import HarvestSession
+from character_cache import cache as character_cache
 # No more sys.path manipulation needed here
 
 class HarvestingCog(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
 
+    async def cog_load(self):
+        purged = await db_utils.run_write(harvest_sessions.purge_expired, int(time.time()))
+        if purged:
+            print(f"DEBUG: Purged {purged} abandoned harvest sessions.")
+
     async def creature_autocomplete(
         self,
         interaction: discord.Interaction,
@@ -23,8 +34,8 @@ class HarvestingCog(commands.Cog):
         # Suggest creatures from HARVEST_DC_TABLES
         return [
             app_commands.Choice(name=creature.title(), value=creature)
-            for creature in HARVEST_DC_TABLES
-            if current.lower() in creature.lower()
+            for creature in CREATURE_NAMES
+            if current.lower() in creature
         ][:25]
 
     async def component_autocomplete(
@@ -33,18 +44,14 @@ class HarvestingCog(commands.Cog):
         current: str
     ) -> List[app_commands.Choice[str]]:
         # Get the selected creature from the interaction
-        creature = getattr(interaction.namespace, 'creature', None)
-        if not creature:
+        creature_data = get_creature(getattr(interaction.namespace, 'creature', None))
+        if not creature_data:
             return []
-        offered_components = HARVEST_DC_TABLES.get(creature.lower(), {})
-        # Flatten all components for this creature
-        all_components = set()
-        for comps in offered_components.values():
-            all_components.update(comp.lower() for comp in comps)
-        # Filter by current input
+        # Filter the creature's precomputed component list by current input
+        current = current.lower()
         return [
             app_commands.Choice(name=comp.title(), value=comp)
-            for comp in all_components if current.lower() in comp.lower()
+            for comp in creature_data.components if current in comp
         ][:25]
 
     harvest_group = app_commands.Group(
@@ -68,19 +75,55 @@ class HarvestingCog(commands.Cog):
         interaction: discord.Interaction,
         creature: str
     ):
-        offered_components = HARVEST_DC_TABLES.get(creature.lower())
-        if not offered_components:
+        creature_data = get_creature(creature)
+        if not creature_data:
             await interaction.response.send_message(f"No harvesting data for creature type '{creature}'.", ephemeral=True)
             return
 
-        # Combine all DC sections into one message
-        dc_messages = []
-        for dc, comps in offered_components.items():
-            dc_lines = [f"\t**{comp.title()}**" for comp in comps]
-            # Adjusted the string formatting here:
-            dc_messages.append(f"**DC {dc} Components:**\n" + "\n".join(dc_lines)) 
-        combined_message = "\n-----------------------\n".join(dc_messages) # Use two newlines to separate DC blocks
-        await interaction.response.send_message("--\n" + combined_message + "\n-----------------------", ephemeral=True)
+        await interaction.response.send_message(creature_data.list_message, ephemeral=True)
+
+    @harvest_group.command(
+        name="odds",
+        description="See your chance of harvesting each component, without rolling"
+    )
+    @app_commands.describe(
+        creature="The creature to harvest (autocomplete)",
+        components="Comma-separated list of components, in the order you'd harvest them",
+        proficiency_bonus="Your proficiency bonus in the creature's skill (0 if not proficient)",
+        int_modifier="Your Intelligence modifier",
+        dex_modifier="Your Dexterity modifier"
+    )
+    @app_commands.autocomplete(
+        creature=creature_autocomplete
+    )
+    async def harvest_odds(
+        self,
+        interaction: discord.Interaction,
+        creature: str,
+        components: str,
+        proficiency_bonus: int,
+        int_modifier: int,
+        dex_modifier: int
+    ):
+        creature_data = get_creature(creature)
+        if not creature_data:
+            await interaction.response.send_message(f"No harvesting data for creature type '{creature}'.", ephemeral=True)
+            return
+
+        requested_components_list = [comp.strip().lower() for comp in components.split(",")]
+        modifier_sum = harvest_planner.harvest_modifier_sum(proficiency_bonus, int_modifier, dex_modifier)
+        lines = []
+        for component, cumulative_dc, chance in harvest_planner.prefix_odds(creature_data, requested_components_list, modifier_sum):
+            if cumulative_dc is None:
+                lines.append(f"- {component.title()}: not harvestable from a {creature_data.creature.title()}")
+            else:
+                lines.append(f"- {component.title()} (total DC {cumulative_dc}): **{float(chance):.1%}**")
+
+        await interaction.response.send_message(
+            f"**Chance of harvesting each component and everything before it**\n"
+            f"Combined roll: 2d20 + {modifier_sum} (Int + Dex + 2 × Proficiency)\n\n" + "\n".join(lines),
+            ephemeral=True
+        )
 
     @harvest_group.command(
         name="roll",
@@ -88,23 +131,29 @@ class HarvestingCog(commands.Cog):
     )
     @app_commands.describe(
         creature="The creature to harvest (autocomplete)",
-        components="Comma-separated list of components to harvest"
+        components="Comma-separated list of components to harvest",
+        optimize="Pick the best components your roll can afford instead of going in the order listed"
     )
     @app_commands.autocomplete(
         creature=creature_autocomplete
     )
+    @app_commands.choices(optimize=[
+        app_commands.Choice(name="Most components", value=harvest_planner.OBJECTIVE_COUNT),
+        app_commands.Choice(name="Most valuable (highest DCs)", value=harvest_planner.OBJECTIVE_VALUE),
+    ])
     async def roll_harvest(
         self,
         interaction: discord.Interaction,
         creature: str,
-        components: str
+        components: str,
+        optimize: app_commands.Choice[str] | None = None
     ):
-        offered_components = HARVEST_DC_TABLES.get(creature.lower())
-        if not offered_components:
+        creature_data = get_creature(creature)
+        if not creature_data:
             await interaction.response.send_message(f"No harvesting data for creature type '{creature}'.", ephemeral=True)
             return
 
-        skill = CREATURE_TYPE_SKILLS.get(creature.lower())
+        skill = creature_data.skill
         if not skill:
             await interaction.response.send_message(f"No skill data for creature type '{creature}'.", ephemeral=True)
             return
@@ -114,10 +163,7 @@ class HarvestingCog(commands.Cog):
         total_dc_display = 0
         requested_components_list = [comp.strip().lower() for comp in components.split(",")] # Renamed for clarity
         for requested_component_name in requested_components_list:
-            for dc_value, component_names_in_dc_table in offered_components.items():
-                if requested_component_name in [cn.lower() for cn in component_names_in_dc_table]:
-                    total_dc_display += int(dc_value)
-                    break
+            total_dc_display += creature_data.component_dcs.get(requested_component_name, 0)
         
         formatted_components = "\n".join([f"- {comp.title()}" for comp in requested_components_list])
         await interaction.response.send_message(
@@ -126,109 +172,126 @@ class HarvestingCog(commands.Cog):
             ephemeral=False
         )
 
-        # Ask the user for their intelligence modifier and proficiency
-        await interaction.followup.send(
-            f"The skill required for harvesting a {creature.title()} is **{skill}**.\nDo you have proficiency in {skill}? Type 0 if no and the modifier if yes.",
-            ephemeral=False
+        # The rest of the harvest is driven by the buttons on this message; its state lives in harvest_sessions.
+        # The session is keyed by the message, so post it first and only add the buttons once the session is
+        # written, otherwise a quick click could arrive before there is a session to find.
+        session_message = await interaction.followup.send(
+            self.session_prompt(creature_data, harvest_sessions.STATE_MODIFIERS),
+            ephemeral=False,
+            wait=True
         )
+        await db_utils.run_write(
+            harvest_sessions.start_session, str(interaction.user.id), interaction.channel_id, session_message.id,
+            creature_data.creature, requested_components_list, optimize.value if optimize else None, int(time.time())
+        )
+        await session_message.edit(view=HarvestSessionView(self, harvest_sessions.STATE_MODIFIERS))
+
+    def session_prompt(self, creature_data: CreatureHarvest, state: str, session: HarvestSession | None = None) -> str:
+        """The text on the session message for a harvest waiting in `state`."""
+        if state == harvest_sessions.STATE_MODIFIERS:
+            return (
+                f"The skill required for harvesting a {creature_data.creature.title()} is **{creature_data.skill}**.\n"
+                "Click **Enter Modifiers** to enter your proficiency, Intelligence and Dexterity modifiers."
+            )
+        modifiers = (
+            f"Proficiency in {creature_data.skill}: **{session.proficiency_bonus}**, "
+            f"Int modifier: **{session.int_modifier}**, Dex modifier: **{session.dex_modifier}**."
+        )
+        if state == harvest_sessions.STATE_ASSESSMENT:
+            return f"{modifiers}\nClick the button below to roll a d20 for assessment."
+        return f"{modifiers}\nAssessment roll: **{session.assessment_roll}**.\nClick the button below to roll a d20 for carving."
+
+    async def load_session(self, interaction: discord.Interaction) -> HarvestSession | None:
+        """The caller's session for the message they clicked, or None after telling them there isn't one."""
+        session = await db_utils.run_read(
+            harvest_sessions.get_session, str(interaction.user.id), interaction.channel_id, int(time.time())
+        )
+        if session is None or session.message_id != interaction.message.id:
+            await interaction.response.send_message(
+                "You don't have a harvest in progress on this message. Start one with `/harvest roll`.", ephemeral=True
+            )
+            return None
+        return session
+
+    async def step_already_done(self, interaction: discord.Interaction):
+        await interaction.response.send_message("That step of your harvest is already done.", ephemeral=True)
+
+    async def open_modifiers(self, interaction: discord.Interaction):
+        session = await self.load_session(interaction)
+        if session is None:
+            return
+        if session.state != harvest_sessions.STATE_MODIFIERS:
+            await self.step_already_done(interaction)
+            return
+        await interaction.response.send_modal(HarvestModifiersModal(self))
 
-        def check(msg):
-            return msg.author == interaction.user and msg.channel == interaction.channel
-
-        try:
-            user_response = await self.bot.wait_for("message", check=check, timeout=60)
-            proficiency_bonus = int(user_response.content)
-        except (ValueError, asyncio.TimeoutError):
-            await interaction.followup.send("Invalid input or timeout. Please try again.", ephemeral=True)
+    async def submit_modifiers(self, interaction: discord.Interaction, proficiency_bonus: int, int_modifier: int, dex_modifier: int):
+        session = await self.load_session(interaction)
+        if session is None:
             return
-        
-        await interaction.followup.send(
-            f"The skill required for harvesting a {creature.title()} is **{skill}**.\n"
-            "What is your Intelligence modifier.",
-            ephemeral=False
+        session = await db_utils.run_write(
+            harvest_sessions.advance_session, session, harvest_sessions.STATE_ASSESSMENT, int(time.time()),
+            {"proficiency_bonus": proficiency_bonus, "int_modifier": int_modifier, "dex_modifier": dex_modifier}
         )
-
-        try:
-            user_response = await self.bot.wait_for("message", check=check, timeout=60)
-            int_modifier = int(user_response.content)
-        except (ValueError, asyncio.TimeoutError):
-            await interaction.followup.send("Invalid input or timeout. Please try again.", ephemeral=True)
+        if session is None:
+            await self.step_already_done(interaction)
             return
+        creature_data = get_creature(session.creature)
+        await interaction.response.edit_message(
+            content=self.session_prompt(creature_data, session.state, session),
+            view=HarvestSessionView(self, session.state)
+        )
 
-        # Create a button for rolling a d20 for assessment
-        class AssessmentRollButton(View):
-            def __init__(self, int_mod, prof_bonus): # Removed outer_instance, pass only needed values
-                super().__init__(timeout=180.0) # Added timeout to the View
-                self.result = None
-                # self.outer_instance = outer_instance # Not strictly needed if bot is accessible via interaction
-                self.int_modifier = int_mod
-                self.proficiency_bonus = prof_bonus
-
-
-            @discord.ui.button(label="Roll d20 for Assessment", style=discord.ButtonStyle.primary)
-            async def roll(self, button_interaction: discord.Interaction, button: Button): # Renamed interaction to button_interaction
-                d20_roll = random.randint(1, 20)
-                total_roll = d20_roll + self.int_modifier + self.proficiency_bonus
-                self.result = total_roll
-                await button_interaction.response.send_message( # Use button_interaction
-                    f"You rolled a **{d20_roll}** (d20) + **{self.int_modifier}** (Int modifier) + **{self.proficiency_bonus}** (Proficiency) = **{total_roll}**.",
-                    ephemeral=False
-                )
-                self.stop()
-
-        assessment_roll_view = AssessmentRollButton(int_modifier, proficiency_bonus) # Pass modifiers
-        await interaction.followup.send("Click the button below to roll a d20 for assessment.", view=assessment_roll_view, ephemeral=False)
-        await assessment_roll_view.wait()
-
-        if assessment_roll_view.result is None:
-            await interaction.followup.send("You did not roll in time. Please try again.", ephemeral=False)
+    async def roll_assessment(self, interaction: discord.Interaction):
+        session = await self.load_session(interaction)
+        if session is None:
+            return
+        if session.state != harvest_sessions.STATE_ASSESSMENT:
+            await self.step_already_done(interaction)
             return
 
-        assessment_roll = assessment_roll_view.result
+        d20_roll = random.randint(1, 20)
+        total_roll = d20_roll + session.int_modifier + session.proficiency_bonus
+        session = await db_utils.run_write(
+            harvest_sessions.advance_session, session, harvest_sessions.STATE_CARVING, int(time.time()),
+            {"assessment_roll": total_roll}
+        )
+        if session is None:
+            await self.step_already_done(interaction)
+            return
 
-        # Ask the user for their Dexterity modifier for carving
+        creature_data = get_creature(session.creature)
+        await interaction.response.edit_message(
+            content=self.session_prompt(creature_data, session.state, session),
+            view=HarvestSessionView(self, session.state)
+        )
         await interaction.followup.send(
-            "What is your Dexterity modifier for carving?",
+            f"You rolled a **{d20_roll}** (d20) + **{session.int_modifier}** (Int modifier) + **{session.proficiency_bonus}** (Proficiency) = **{total_roll}**.",
             ephemeral=False
         )
 
-        try:
-            user_response = await self.bot.wait_for("message", check=check, timeout=60)
-            dex_modifier = int(user_response.content)
-        except (ValueError, asyncio.TimeoutError):
-            await interaction.followup.send("Invalid input or timeout. Please try again.", ephemeral=True)
+    async def roll_carving(self, interaction: discord.Interaction):
+        session = await self.load_session(interaction)
+        if session is None:
             return
-
-        # Create a button for rolling a d20 for carving
-        class CarvingRollButton(View):
-            def __init__(self, dex_mod, prof_bonus): # Removed outer_instance
-                super().__init__(timeout=180.0) # Added timeout to the View
-                self.result = None
-                # self.outer_instance = outer_instance
-                self.dex_modifier = dex_mod
-                self.proficiency_bonus = prof_bonus
-
-
-            @discord.ui.button(label="Roll d20 for Carving", style=discord.ButtonStyle.primary)
-            async def roll(self, button_interaction: discord.Interaction, button: Button): # Renamed interaction
-                d20_roll = random.randint(1, 20)
-                total_roll = d20_roll + self.dex_modifier + self.proficiency_bonus
-                self.result = total_roll
-                await button_interaction.response.send_message( # Use button_interaction
-                    f"You rolled a **{d20_roll}** (d20) + **{self.dex_modifier}** (Dex modifier) + **{self.proficiency_bonus}** (Proficiency) = **{total_roll}**.",
-                    ephemeral=False
-                )
-                self.stop()
-
-        carving_roll_view = CarvingRollButton(dex_modifier, proficiency_bonus) # Pass modifiers
-        await interaction.followup.send("Click the button below to roll a d20 for carving.", view=carving_roll_view, ephemeral=False)
-        await carving_roll_view.wait()
-
-        if carving_roll_view.result is None:
-            await interaction.followup.send("You did not roll in time. Please try again.", ephemeral=False)
+        if session.state != harvest_sessions.STATE_CARVING:
+            await self.step_already_done(interaction)
             return
+        if not await db_utils.run_write(harvest_sessions.end_session, session):
+            await self.step_already_done(interaction)
+            return
+
+        d20_roll = random.randint(1, 20)
+        carving_roll = d20_roll + session.dex_modifier + session.proficiency_bonus
+        assessment_roll = session.assessment_roll
+        await interaction.response.edit_message(
+            content=f"Harvest of a {session.creature.title()} complete.", view=None
+        )
+        await interaction.followup.send(
+            f"You rolled a **{d20_roll}** (d20) + **{session.dex_modifier}** (Dex modifier) + **{session.proficiency_bonus}** (Proficiency) = **{carving_roll}**.",
+            ephemeral=False
+        )
 
-        carving_roll = carving_roll_view.result
         # Show the combined roll of assessment and carving
         combined_roll = assessment_roll + carving_roll # This is the crucial value now
         await interaction.followup.send(
@@ -237,6 +300,11 @@ class HarvestingCog(commands.Cog):
         )
         
         # Determine which components the user successfully harvested using the combined_roll
+        creature_data = get_creature(session.creature)
+        if session.objective:
+            await self.send_optimized_harvest(interaction, creature_data, session, combined_roll)
+            return
+
         successful_components = []
         remaining_combined_roll = combined_roll # Use a new variable for the diminishing combined roll
 
@@ -244,12 +312,8 @@ class HarvestingCog(commands.Cog):
         # For simplicity, we'll process in the order requested.
         # If you want to sort by DC, you'd need to fetch DC for each requested_component first.
 
-        for requested_component_name in requested_components_list:
-            found_component_dc = None
-            for dc_value, component_names_in_dc_table in offered_components.items():
-                if requested_component_name in [cn.lower() for cn in component_names_in_dc_table]:
-                    found_component_dc = int(dc_value)
-                    break
+        for requested_component_name in session.components:
+            found_component_dc = creature_data.component_dcs.get(requested_component_name)
             
             if found_component_dc is not None:
                 if remaining_combined_roll >= found_component_dc:
@@ -265,7 +329,7 @@ class HarvestingCog(commands.Cog):
             else:
                 # This case should ideally not happen if component_autocomplete is working correctly
                 # and HARVEST_DC_TABLES is accurate.
-                print(f"Warning: Component '{requested_component_name}' not found in DC table for '{creature}'.")
+                print(f"Warning: Component '{requested_component_name}' not found in DC table for '{session.creature}'.")
 
 
         if not successful_components:
@@ -279,6 +343,102 @@ class HarvestingCog(commands.Cog):
             f"**Successfully harvested:**\n{formatted_successful_components}\n\n(Remaining roll: **{remaining_combined_roll}**)", 
             ephemeral=False
         )
+        await self.store_harvest(interaction, session, successful_components)
+
+    async def send_optimized_harvest(self, interaction: discord.Interaction, creature_data: CreatureHarvest,
+                                     session: HarvestSession, combined_roll: int):
+        plan = harvest_planner.plan_harvest(creature_data, session.components, combined_roll, session.objective)
+
+        skipped_components = list(session.components)
+        for component in plan.components:
+            skipped_components.remove(component)
+        if skipped_components:
+            formatted_skipped_components = "\n".join(
+                f"- {comp.title()} (DC {creature_data.component_dcs.get(comp, '?')})" for comp in skipped_components
+            )
+            await interaction.followup.send(f"Your roll couldn't also cover:\n{formatted_skipped_components}", ephemeral=True)
+
+        if not plan.components:
+            await interaction.followup.send("You failed to harvest any components with your combined roll.", ephemeral=True)
+            return
+
+        formatted_successful_components = "\n".join([f"- {comp.title()}" for comp in plan.components])
+        await interaction.followup.send(
+            f"**Successfully harvested:**\n{formatted_successful_components}\n\n(Remaining roll: **{plan.remaining_roll}**)",
+            ephemeral=False
+        )
+        await self.store_harvest(interaction, session, plan.components)
+
+    async def store_harvest(self, interaction: discord.Interaction, session: HarvestSession, components: List[str]):
+        """Adds harvested components to the harvester's active character's inventory, e.g. "beast hide"."""
+        user_characters = await character_cache.get(session.discord_id)
+        active_char_name = user_characters.active_character_name
+        if active_char_name is None:
+            await interaction.followup.send(
+                "You don't have an active character, so these components weren't added to an inventory. Use `/character setactive`.",
+                ephemeral=True
+            )
+            return
+        items = [(user_characters.active_character_id, f"{session.creature} {component}", 1) for component in components]
+        await db_utils.run_write(inventory.add_items, items)
+        await interaction.followup.send(f"Added to {active_char_name}'s inventory. See `/inventory view`.", ephemeral=True)
+
+    async def cancel_harvest(self, interaction: discord.Interaction):
+        session = await self.load_session(interaction)
+        if session is None:
+            return
+        if not await db_utils.run_write(harvest_sessions.end_session, session):
+            await self.step_already_done(interaction)
+            return
+        await interaction.response.edit_message(content="Harvest cancelled.", view=None)
+
+class HarvestModifiersModal(Modal, title="Harvest Modifiers"):
+    proficiency_bonus = TextInput(label="Proficiency bonus (0 if not proficient)", max_length=3, default="0")
+    int_modifier = TextInput(label="Intelligence modifier", max_length=3)
+    dex_modifier = TextInput(label="Dexterity modifier", max_length=3)
+
+    def __init__(self, cog: HarvestingCog):
+        super().__init__()
+        self.cog = cog
+
+    async def on_submit(self, interaction: discord.Interaction):
+        try:
+            modifiers = [int(field.value) for field in (self.proficiency_bonus, self.int_modifier, self.dex_modifier)]
+        except ValueError:
+            await interaction.response.send_message("Modifiers must be whole numbers, e.g. `3` or `-1`. Please try again.", ephemeral=True)
+            return
+        await self.cog.submit_modifiers(interaction, *modifiers)
+
+class HarvestSessionView(View):
+    """
+    Buttons for every harvest step. The custom_ids are fixed and the view is
+    registered once with bot.add_view, so buttons keep working across restarts;
+    which session a click belongs to is looked up from the user and channel.
+    """
+
+    def __init__(self, cog: HarvestingCog, state: str | None = None):
+        super().__init__(timeout=None)
+        self.cog = cog
+        if state is not None: # Only enable the button for the step the session is waiting on
+            self.enter_modifiers.disabled = state != harvest_sessions.STATE_MODIFIERS
+            self.roll_assessment.disabled = state != harvest_sessions.STATE_ASSESSMENT
+            self.roll_carving.disabled = state != harvest_sessions.STATE_CARVING
+
+    @discord.ui.button(label="Enter Modifiers", style=discord.ButtonStyle.primary, custom_id="harvest:modifiers")
+    async def enter_modifiers(self, interaction: discord.Interaction, button: Button):
+        await self.cog.open_modifiers(interaction)
+
+    @discord.ui.button(label="Roll d20 for Assessment", style=discord.ButtonStyle.primary, custom_id="harvest:assessment")
+    async def roll_assessment(self, interaction: discord.Interaction, button: Button):
+        await self.cog.roll_assessment(interaction)
+
+    @discord.ui.button(label="Roll d20 for Carving", style=discord.ButtonStyle.primary, custom_id="harvest:carving")
+    async def roll_carving(self, interaction: discord.Interaction, button: Button):
+        await self.cog.roll_carving(interaction)
+
+    @discord.ui.button(label="Cancel", style=discord.ButtonStyle.secondary, custom_id="harvest:cancel")
+    async def cancel(self, interaction: discord.Interaction, button: Button):
+        await self.cog.cancel_harvest(interaction)
 
 async def setup(bot):
     # Import config here to access TEST_SERVER_ID if not already available
@@ -288,4 +448,7 @@ async def setup(bot):
         # Fallback or raise error if not found, os.getenv is also an option
         # but config.py should handle loading .env
         raise ValueError("TEST_SERVER_ID not found in config. Ensure .env is loaded by config.py.")
-    await bot.add_cog(HarvestingCog(bot), guilds=[discord.Object(id=int(TEST_SERVER_ID))])
+    cog = HarvestingCog(bot)
+    await bot.add_cog(cog, guilds=[discord.Object(id=int(TEST_SERVER_ID))])
+    # Re-attach the harvest buttons on messages sent before this start
+    bot.add_view(HarvestSessionView(cog))
@@ -0,0 +1,81 @@
+import discord
+from discord.ext import commands
+from discord import app_commands
+
+import database as db_utils
+import inventory
+import config # For TEST_SERVER_ID
+from character_cache import cache as character_cache
+
+class InventoryCog(commands.Cog):
+    def __init__(self, bot: commands.Bot):
+        self.bot = bot
+
+    inventory_group = app_commands.Group(name="inventory", description="View your character's inventory.")
+
+    @inventory_group.command(name="view", description="View your active character's inventory.")
+    async def view_inventory(self, interaction: discord.Interaction):
+        user_characters = await character_cache.get(str(interaction.user.id))
+        active_char_name = user_characters.active_character_name
+        if active_char_name is None:
+            await interaction.response.send_message("You do not have an active character set. Use `/character setactive` first.", ephemeral=True)
+            return
+
+        rows = await db_utils.run_read(inventory.inventory_page, user_characters.active_character_id)
+        view = InventoryView(interaction.user.id, user_characters.active_character_id, active_char_name, rows, is_first=True)
+        await interaction.response.send_message(embed=view.build_embed(), view=view, ephemeral=True)
+
+class InventoryView(discord.ui.View):
+    """Previous/Next buttons for /inventory view. Pages are fetched by item name (keyset), never by offset."""
+
+    def __init__(self, user_id: int, character_id: int, character_name: str, rows: list, is_first: bool):
+        super().__init__(timeout=300)
+        self.user_id = user_id
+        self.character_id = character_id
+        self.character_name = character_name
+        self.show_page(rows, is_first)
+
+    def show_page(self, rows: list, is_first: bool):
+        self.rows = rows
+        self.previous_button.disabled = is_first
+        self.next_button.disabled = len(rows) < inventory.INVENTORY_PAGE_SIZE
+
+    def build_embed(self) -> discord.Embed:
+        if self.rows:
+            description = "\n".join(f"**{row['item'].title()}** x{row['quantity']}" for row in self.rows)
+        else:
+            description = "Nothing here yet. Buildings that produce goods and `/harvest roll` fill it up."
+        return discord.Embed(title=f"{self.character_name}'s Inventory", description=description, color=discord.Color.dark_green())
+
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        if interaction.user.id != self.user_id:
+            await interaction.response.send_message("This isn't your inventory.", ephemeral=True)
+            return False
+        return True
+
+    @discord.ui.button(label="Previous", style=discord.ButtonStyle.secondary)
+    async def previous_button(self, interaction: discord.Interaction, button: discord.ui.Button):
+        rows = await db_utils.run_read(inventory.inventory_page, self.character_id, None, self.rows[0]["item"])
+        is_first = len(rows) < inventory.INVENTORY_PAGE_SIZE
+        if is_first: # Fewer than a page before this one, show the first page instead
+            rows = await db_utils.run_read(inventory.inventory_page, self.character_id)
+        self.show_page(rows, is_first)
+        await interaction.response.edit_message(embed=self.build_embed(), view=self)
+
+    @discord.ui.button(label="Next", style=discord.ButtonStyle.secondary)
+    async def next_button(self, interaction: discord.Interaction, button: discord.ui.Button):
+        rows = await db_utils.run_read(inventory.inventory_page, self.character_id, self.rows[-1]["item"])
+        if not rows: # The last page was exactly full
+            self.next_button.disabled = True
+            await interaction.response.edit_message(view=self)
+            return
+        self.show_page(rows, is_first=False)
+        await interaction.response.edit_message(embed=self.build_embed(), view=self)
+
+async def setup(bot: commands.Bot):
+    guild_id = int(config.TEST_SERVER_ID) if config.TEST_SERVER_ID else None
+    if guild_id:
+        await bot.add_cog(InventoryCog(bot), guilds=[discord.Object(id=guild_id)])
+    else:
+        await bot.add_cog(InventoryCog(bot))
+    print("InventoryCog loaded.")
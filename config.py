@@ -5,6 +5,12 @@ load_dotenv()
 
 TOKEN = os.getenv('DISCORD_TOKEN')
 TEST_SERVER_ID = os.getenv('DEV_SERVER_ID')
+# Optional: write Prometheus text-format metrics to this file every METRICS_FILE_SECONDS
+METRICS_FILE = os.getenv('METRICS_FILE')
+METRICS_FILE_SECONDS = int(os.getenv('METRICS_FILE_SECONDS', '60'))
+# Optional: profile every SQL statement and log the ones slower than SQL_SLOW_MS, see sql_profiler.py
+SQL_PROFILE = os.getenv('SQL_PROFILE', '').lower() in ('1', 'true', 'yes')
+SQL_SLOW_MS = float(os.getenv('SQL_SLOW_MS', '50'))
 
 SPELLCASTING_CLASSES = [
     "bard", "cleric", "druid", "sorcerer", "wizard", "warlock",
@@ -3,6 +3,25 @@ SPELLCASTING_CLASSES = [
     "paladin", "ranger", "artificer"
 ]
 
+# Seconds between collections for each building resource_frequency
+FREQUENCY_SECONDS = {
+    "daily": 86400,
+    "hourly": 3600,
+    "weekly": 604800,
+    "test": 15,
+}
+
+# --- Currency Definitions ---
+CURRENCY_UNITS = {
+    "cp": {"name": "Copper Pieces", "value_in_cp": 1, "column": "cp"},
+    "sp": {"name": "Silver Pieces", "value_in_cp": 10, "column": "sp"},
+    "ep": {"name": "Electrum Pieces", "value_in_cp": 50, "column": "ep"},
+    "gp": {"name": "Gold Pieces", "value_in_cp": 100, "column": "gp"},
+    "pp": {"name": "Platinum Pieces", "value_in_cp": 1000, "column": "pp"},
+}
+# Order for display and calculations (highest to lowest value)
+CURRENCY_ORDER = ["pp", "gp", "ep", "sp", "cp"]
+
 HARVEST_DC_TABLES = {
     "aberration": {
         5: ["Antenna", "eye", "flesh", "phial of blood"],
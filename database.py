@@ -1,74 +1,197 @@
 import sqlite3
-import random
+import asyncio
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+import metrics
+import migrations
+import tracing
 
 DATABASE_NAME = 'database.db'
+READER_THREADS = 4 # Number of threads serving read-only queries
+READ_POOL_SIZE = READER_THREADS # Pooled read connections, one per reader thread
+
+# Connection tuning
+STATEMENT_CACHE_SIZE = 256 # Prepared statements kept per connection by sqlite3
+PAGE_CACHE_KIB = 64 * 1024 # 64 MiB page cache per connection
+MMAP_SIZE_BYTES = 256 * 1024 * 1024 # Memory-map up to 256 MiB of the database file
+BUSY_TIMEOUT_MS = 5000
+
+# Called with every new connection after it is configured, e.g. to attach
+# instrumentation. Append to this before the first query is made.
+CONNECTION_HOOKS: list = []
+# Class of new connections; sql_profiler swaps in a subclass when profiling
+CONNECTION_CLASS: type[sqlite3.Connection] = sqlite3.Connection
+
+def _configure_connection(conn: sqlite3.Connection):
+    # WAL lets readers keep going while the writer commits; NORMAL sync is safe with WAL
+    # (a power loss can only drop the last commits, never corrupt the file).
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute("PRAGMA synchronous = NORMAL")
+    conn.execute(f"PRAGMA cache_size = -{PAGE_CACHE_KIB}") # Negative value means KiB instead of pages
+    conn.execute(f"PRAGMA mmap_size = {MMAP_SIZE_BYTES}")
+    conn.execute(f"PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}")
+    conn.execute("PRAGMA temp_store = MEMORY")
 
-def get_db_connection():
-    conn = sqlite3.connect(DATABASE_NAME)
+def get_db_connection(check_same_thread: bool = True):
+    conn = sqlite3.connect(
+        DATABASE_NAME, check_same_thread=check_same_thread, cached_statements=STATEMENT_CACHE_SIZE, factory=CONNECTION_CLASS
+    )
     conn.row_factory = sqlite3.Row # Optional: Access columns by name
+    _configure_connection(conn)
+    for hook in CONNECTION_HOOKS:
+        hook(conn)
     return conn
 
+class ConnectionPool:
+    """A fixed-size pool of long-lived connections, opened lazily and shared between threads."""
+
+    def __init__(self, size: int):
+        self._size = size
+        self._idle: queue.LifoQueue[sqlite3.Connection] = queue.LifoQueue() # LIFO keeps the hottest caches in use
+        self._all: list[sqlite3.Connection] = []
+        self._lock = threading.Lock()
+
+    def acquire(self) -> sqlite3.Connection:
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if len(self._all) < self._size:
+                conn = get_db_connection(check_same_thread=False)
+                self._all.append(conn)
+                return conn
+        return self._idle.get() # Pool exhausted, wait for a connection to come back
+
+    def release(self, conn: sqlite3.Connection):
+        if conn.in_transaction:
+            conn.rollback() # Never hand out a connection with a half-finished transaction
+        self._idle.put(conn)
+
+    @contextmanager
+    def connection(self):
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    def close_all(self):
+        with self._lock:
+            for conn in self._all:
+                conn.close()
+            self._all.clear()
+
 def initialize_db():
+    """Brings the schema up to date. See migrations.py for the individual steps."""
     conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS members (
-            discord_id TEXT UNIQUE, 
-            discord_tag TEXT,
-            active_character_id INTEGER, 
-            FOREIGN KEY (active_character_id) REFERENCES characters(id) 
-        )'''
-    )
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS characters (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            discord_id TEXT,
-            name TEXT,
-            class TEXT,
-            spellcaster BOOLEAN,
-            cp INTEGER DEFAULT 0, 
-            sp INTEGER DEFAULT 0, 
-            ep INTEGER DEFAULT 0, 
-            gp INTEGER DEFAULT 0, 
-            pp INTEGER DEFAULT 0  
-        )'''
-    )
-    # Renamed from 'buildings' to 'building_types'
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS building_types (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT UNIQUE, -- e.g., "Small Mine", "Herbalist Hut"
-            resource_output TEXT, -- e.g., "1d6"
-            resource_type TEXT, -- e.g., "gp", "herbs" (for now, assume currency from economy cog)
-            resource_frequency TEXT -- e.g., "daily", "hourly"
-        )'''
-    )
-    # New table to store instances of buildings owned by characters
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS character_buildings (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            character_id INTEGER,
-            building_type_id INTEGER,
-            custom_name TEXT, -- Optional: "Bob's Lucky Mine"
-            channel_id INTEGER, -- Channel for notifications for this specific building
-            last_collection_time INTEGER, -- Unix timestamp
-            FOREIGN KEY (character_id) REFERENCES characters(id),
-            FOREIGN KEY (building_type_id) REFERENCES building_types(id)
-        )'''
-    )
-    # The old 'active_rolls' table is no longer needed with this structure.
-    # cursor.execute('DROP TABLE IF EXISTS active_rolls') # Optional: explicitly drop if it exists
+    try:
+        applied = migrations.run_migrations(conn)
+        version = migrations.get_schema_version(conn)
+        if applied:
+            print(f"DEBUG: Database schema migrated to version {version}.")
+        else:
+            print(f"DEBUG: Database schema is up to date (version {version}).")
+    finally:
+        conn.close()
+
+# --- Async access ---
+# sqlite3 calls block, so they must never run on the event loop. All writes go
+# through a single writer thread with its own connection (SQLite only allows one
+# writer at a time anyway), while reads run on a small thread pool using
+# connections borrowed from the read pool.
+#
+# There is deliberately no per-interaction unit of work pinning one connection.
+# Commands look up characters through character_cache, so an interaction makes at
+# most one read and one write call, and anything needing several statements to
+# commit together does them in one run_write function, on one connection in one
+# transaction. Pinning a connection per interaction would hold it across Discord
+# round trips for no gain.
+_writer_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="db-writer")
+_reader_executor = ThreadPoolExecutor(max_workers=READER_THREADS, thread_name_prefix="db-reader")
+_read_pool = ConnectionPool(READ_POOL_SIZE)
+_writer_conn: sqlite3.Connection | None = None # Only touched from the writer thread
+
+def _timed(label: str, func, conn: sqlite3.Connection, args):
+    # Recorded under the function's name, or the SQL text for the fetch/execute helpers
+    started = time.perf_counter()
+    try:
+        return func(conn, *args)
+    except BaseException:
+        metrics.DB_QUERY_ERRORS.inc(query=label)
+        raise
+    finally:
+        metrics.DB_QUERY_SECONDS.observe(time.perf_counter() - started, query=label)
 
-    conn.commit()
-    conn.close()
+def _run_read(func, args, label: str | None = None):
+    with _read_pool.connection() as conn:
+        return _timed(label or metrics.query_label(func), func, conn, args)
 
-def calculate_roll_result(resource_output: str) -> int:
+def _run_write(func, args, label: str | None = None, queued_at: float | None = None):
+    global _writer_conn
+    if queued_at is not None:
+        metrics.DB_WRITE_WAIT_SECONDS.observe(time.perf_counter() - queued_at)
+    if _writer_conn is None:
+        _writer_conn = get_db_connection(check_same_thread=False)
     try:
-        num, die = map(int, resource_output.lower().split('d'))
-        return sum(random.randint(1, die) for _ in range(num))
-    except ValueError:
-        print(f"Error: Invalid dice format '{resource_output}' in _calculate_roll_result")
-        return 0
-
-# Initialize the database when this module is imported
-initialize_db()
+        result = _timed(label or metrics.query_label(func), func, _writer_conn, args)
+        _writer_conn.commit()
+        return result
+    except BaseException:
+        _writer_conn.rollback()
+        raise
+
+async def _traced(span_name: str, label: str | None, func, future):
+    trace = tracing.current()
+    if trace is None:
+        return await future
+    started = time.perf_counter()
+    try:
+        return await future
+    finally:
+        trace.span(span_name, started, query=label or metrics.query_label(func))
+
+async def _submit_read(func, args, label: str | None = None):
+    loop = asyncio.get_running_loop()
+    return await _traced("db.read", label, func, loop.run_in_executor(_reader_executor, _run_read, func, args, label))
+
+async def _submit_write(func, args, label: str | None = None):
+    loop = asyncio.get_running_loop()
+    future = loop.run_in_executor(_writer_executor, _run_write, func, args, label, time.perf_counter())
+    return await _traced("db.write", label, func, future)
+
+async def run_read(func, *args):
+    """Runs func(conn, *args) on a reader thread and returns its result."""
+    return await _submit_read(func, args)
+
+async def run_write(func, *args):
+    """Runs func(conn, *args) on the writer thread as one transaction (commit on success, rollback on error)."""
+    return await _submit_write(func, args)
+
+async def fetch_one(sql: str, params: tuple = ()) -> sqlite3.Row | None:
+    return await _submit_read(lambda conn: conn.execute(sql, params).fetchone(), (), metrics.sql_label(sql))
+
+async def fetch_all(sql: str, params: tuple = ()) -> list[sqlite3.Row]:
+    return await _submit_read(lambda conn: conn.execute(sql, params).fetchall(), (), metrics.sql_label(sql))
+
+async def execute(sql: str, params: tuple = ()) -> int:
+    """Runs a single write statement and returns the number of affected rows."""
+    return await _submit_write(lambda conn: conn.execute(sql, params).rowcount, (), metrics.sql_label(sql))
+
+async def execute_many(sql: str, seq_of_params) -> int:
+    """Runs a write statement once per parameter tuple in a single transaction."""
+    return await _submit_write(lambda conn: conn.executemany(sql, seq_of_params).rowcount, (), metrics.sql_label(sql))
+
+def shutdown():
+    """Stops the executors and closes every pooled connection. Call once on bot shutdown."""
+    global _writer_conn
+    _reader_executor.shutdown(wait=True)
+    _writer_executor.shutdown(wait=True)
+    _read_pool.close_all()
+    if _writer_conn is not None:
+        _writer_conn.close()
+        _writer_conn = None
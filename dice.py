@@ -0,0 +1,76 @@
+import math
+import random
+from functools import lru_cache
+from typing import Iterable, NamedTuple
+
+# Above this many dice in one draw, sample the total from its normal
+# approximation instead of rolling each die. By the central limit theorem the
+# sum of 200+ uniform dice is normal to well under a percent.
+EXACT_DICE_LIMIT = 200
+
+class DiceExpression(NamedTuple):
+    count: int # Number of dice, the N in NdS
+    sides: int # Sides per die, the S in NdS
+
+    @property
+    def minimum(self) -> int:
+        return self.count
+
+    @property
+    def maximum(self) -> int:
+        return self.count * self.sides
+
+    @property
+    def mean(self) -> float:
+        return self.count * (self.sides + 1) / 2
+
+    @property
+    def variance(self) -> float:
+        return self.count * (self.sides ** 2 - 1) / 12
+
+@lru_cache(maxsize=1024)
+def parse_dice(expression: str) -> DiceExpression:
+    """Parses 'NdS' (e.g. '2d6'). Raises ValueError for anything else."""
+    num, die = map(int, expression.lower().strip().split('d'))
+    if num < 0 or die < 1:
+        raise ValueError(f"Invalid dice expression '{expression}'")
+    return DiceExpression(num, die)
+
+class DiceSampler:
+    """
+    Draws totals of repeated dice rolls. Rolling NdS `repeats` times is the
+    same as rolling (N * repeats)dS once, so catch-up for many missed
+    collections costs one draw instead of one roll per die. Pass a seed for
+    reproducible results.
+    """
+
+    def __init__(self, seed: int | None = None):
+        self._rng = random.Random(seed)
+
+    def seed(self, seed: int | None):
+        self._rng.seed(seed)
+
+    def roll_total(self, dice: DiceExpression, repeats: int = 1) -> int:
+        """Returns the sum of rolling `dice` `repeats` times."""
+        total_dice = dice.count * repeats
+        if total_dice <= 0:
+            return 0
+        if dice.sides == 1:
+            return total_dice
+        if total_dice <= EXACT_DICE_LIMIT:
+            return sum(self._rng.choices(range(1, dice.sides + 1), k=total_dice))
+
+        combined = DiceExpression(total_dice, dice.sides)
+        sample = round(self._rng.gauss(combined.mean, math.sqrt(combined.variance)))
+        return min(max(sample, combined.minimum), combined.maximum)
+
+    def roll_many(self, rolls: Iterable[tuple[DiceExpression, int]]) -> list[int]:
+        """Rolls a whole batch of (dice, repeats) pairs, e.g. every due building in a tick."""
+        return [self.roll_total(dice, repeats) for dice, repeats in rolls]
+
+# Shared sampler for normal bot use. Call seed() on it to make a run reproducible.
+default_sampler = DiceSampler()
+
+def roll(expression: str, repeats: int = 1) -> int:
+    """Parses and rolls an 'NdS' expression `repeats` times with the shared sampler."""
+    return default_sampler.roll_total(parse_dice(expression), repeats)
@@ -0,0 +1,48 @@
+from dataclasses import dataclass
+from types import MappingProxyType
+from typing import Mapping
+
+from constants import HARVEST_DC_TABLES, CREATURE_TYPE_SKILLS
+
+@dataclass(frozen=True)
+class CreatureHarvest:
+    """Everything the harvesting commands need about one creature type, computed once."""
+    creature: str # Lowercased key in HARVEST_DC_TABLES
+    skill: str | None
+    component_dcs: Mapping[str, int] # Lowercased component name -> DC
+    components: tuple[str, ...] # Lowercased component names, sorted for autocomplete
+    list_message: str # The /harvest list reply
+
+def _render_list_message(dc_table: dict[int, list[str]]) -> str:
+    # Combine all DC sections into one message
+    dc_messages = []
+    for dc, comps in dc_table.items():
+        dc_lines = [f"\t**{comp.title()}**" for comp in comps]
+        dc_messages.append(f"**DC {dc} Components:**\n" + "\n".join(dc_lines))
+    combined_message = "\n-----------------------\n".join(dc_messages)
+    return "--\n" + combined_message + "\n-----------------------"
+
+def _build_index() -> Mapping[str, CreatureHarvest]:
+    index = {}
+    for creature, dc_table in HARVEST_DC_TABLES.items():
+        component_dcs: dict[str, int] = {}
+        for dc, comps in dc_table.items():
+            for comp in comps:
+                component_dcs.setdefault(comp.lower(), int(dc)) # If listed twice, the lowest DC wins
+        index[creature.lower()] = CreatureHarvest(
+            creature=creature.lower(),
+            skill=CREATURE_TYPE_SKILLS.get(creature.lower()),
+            component_dcs=MappingProxyType(component_dcs),
+            components=tuple(sorted(component_dcs)),
+            list_message=_render_list_message(dc_table),
+        )
+    return MappingProxyType(index)
+
+# Built once at import; HARVEST_DC_TABLES never changes at runtime
+HARVEST_INDEX: Mapping[str, CreatureHarvest] = _build_index()
+CREATURE_NAMES: tuple[str, ...] = tuple(sorted(HARVEST_INDEX))
+
+def get_creature(creature: str | None) -> CreatureHarvest | None:
+    if not creature:
+        return None
+    return HARVEST_INDEX.get(creature.lower())
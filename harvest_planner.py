@@ -0,0 +1,136 @@
+from dataclasses import dataclass
+from fractions import Fraction
+from functools import lru_cache
+from typing import Sequence
+
+from harvest_index import CreatureHarvest
+
+# What "optimize" maximizes: the number of components, or their total DC
+# (the harder a component is to harvest, the more it's worth)
+OBJECTIVE_COUNT = "count"
+OBJECTIVE_VALUE = "value"
+OBJECTIVES = (OBJECTIVE_COUNT, OBJECTIVE_VALUE)
+
+D20_SIDES = 20
+
+def _convolve(left: list[int], right: list[int]) -> list[int]:
+    ways = [0] * (len(left) + len(right) - 1)
+    for i, left_ways in enumerate(left):
+        for j, right_ways in enumerate(right):
+            ways[i + j] += left_ways * right_ways
+    return ways
+
+# Ways for the assessment d20 plus the carving d20 to total 2, 3, ..., 40
+_D20_WAYS = [1] * D20_SIDES
+_TWO_D20_WAYS = _convolve(_D20_WAYS, _D20_WAYS)
+_TWO_D20_OUTCOMES = D20_SIDES ** 2
+
+@lru_cache(maxsize=512)
+def combined_roll_odds(modifier_sum: int) -> tuple[int, tuple[Fraction, ...]]:
+    """
+    Distribution of a harvest's combined roll, 2d20 + modifier_sum. Returns
+    (lowest possible total, P(total >= lowest + i) for each i).
+    """
+    at_least = []
+    remaining_ways = _TWO_D20_OUTCOMES
+    for ways in _TWO_D20_WAYS:
+        at_least.append(Fraction(remaining_ways, _TWO_D20_OUTCOMES))
+        remaining_ways -= ways
+    return 2 + modifier_sum, tuple(at_least)
+
+def chance_to_reach(modifier_sum: int, target: int) -> Fraction:
+    """Exact probability that 2d20 + modifier_sum is at least target."""
+    lowest, at_least = combined_roll_odds(modifier_sum)
+    index = target - lowest
+    if index <= 0:
+        return Fraction(1)
+    if index >= len(at_least):
+        return Fraction(0)
+    return at_least[index]
+
+def harvest_modifier_sum(proficiency_bonus: int, int_modifier: int, dex_modifier: int) -> int:
+    # Assessment is d20 + Int + proficiency and carving is d20 + Dex + proficiency, see HarvestingCog.roll_harvest
+    return int_modifier + dex_modifier + 2 * proficiency_bonus
+
+@dataclass(frozen=True)
+class HarvestPlan:
+    components: tuple[str, ...] # Components to harvest, in the order they were requested
+    total_dc: int
+    remaining_roll: int
+
+@lru_cache(maxsize=4096)
+def _best_counts(tiers: tuple[tuple[int, int], ...], budget: int, objective: str) -> tuple[int, ...]:
+    """
+    Bounded knapsack over DC tiers: `tiers` is ((dc, components requested at that
+    dc), ...). Returns how many to take from each tier. Components in one tier
+    cost the same, so only the counts matter, which keeps the table tiny.
+    """
+    @lru_cache(maxsize=None)
+    def best(index: int, remaining: int) -> tuple[tuple[int, int], tuple[int, ...]]:
+        # -> ((primary score, tie-breaker), counts for tiers[index:])
+        if index == len(tiers):
+            return (0, 0), ()
+        dc, available = tiers[index]
+        best_score, best_counts = None, None
+        for taken in range(min(available, remaining // dc) + 1):
+            (primary, secondary), counts = best(index + 1, remaining - taken * dc)
+            if objective == OBJECTIVE_COUNT:
+                score = (primary + taken, secondary + taken * dc) # Most components, then the most valuable ones
+            else:
+                score = (primary + taken * dc, secondary + taken) # Most value, then the most components
+            if best_score is None or score > best_score:
+                best_score, best_counts = score, (taken, *counts)
+        return best_score, best_counts
+
+    return best(0, budget)[1]
+
+def plan_harvest(creature_data: CreatureHarvest, components: Sequence[str], roll: int,
+                 objective: str = OBJECTIVE_COUNT) -> HarvestPlan:
+    """The subset of `components` (lowercased) that maximizes `objective` without its DCs adding up to more than `roll`."""
+    if objective not in OBJECTIVES:
+        raise ValueError(f"Unknown harvest objective '{objective}'.")
+
+    by_dc: dict[int, list[str]] = {}
+    for component in components:
+        dc = creature_data.component_dcs.get(component)
+        if dc is not None: # Unknown components can't be harvested
+            by_dc.setdefault(dc, []).append(component)
+    tiers = tuple(sorted((dc, len(names)) for dc, names in by_dc.items()))
+
+    # Any roll above the cost of everything requested has the same answer, so clamp it for better cache hits
+    budget = max(0, min(roll, sum(dc * count for dc, count in tiers)))
+    counts = _best_counts(tiers, budget, objective)
+
+    chosen: dict[str, int] = {}
+    for (dc, _), taken in zip(tiers, counts):
+        for component in by_dc[dc][:taken]: # Earlier requests win ties within a tier
+            chosen[component] = chosen.get(component, 0) + 1
+    selected = []
+    for component in components:
+        if chosen.get(component):
+            chosen[component] -= 1
+            selected.append(component)
+
+    total_dc = sum(creature_data.component_dcs[component] for component in selected)
+    return HarvestPlan(components=tuple(selected), total_dc=total_dc, remaining_roll=roll - total_dc)
+
+def prefix_odds(creature_data: CreatureHarvest, components: Sequence[str], modifier_sum: int) -> list[tuple[str, int | None, Fraction]]:
+    """
+    For each requested component, in order: (component, cumulative DC, chance of
+    harvesting it and everything before it). Harvests spend the roll in order and
+    stop at the first component they can't afford, so that is the chance the
+    combined roll reaches the cumulative DC. Unknown components have no DC and
+    are skipped by the harvest, so they carry the previous chance forward.
+    """
+    odds = []
+    cumulative_dc = 0
+    chance = Fraction(1)
+    for component in components:
+        dc = creature_data.component_dcs.get(component)
+        if dc is None:
+            odds.append((component, None, chance))
+            continue
+        cumulative_dc += dc
+        chance = chance_to_reach(modifier_sum, cumulative_dc)
+        odds.append((component, cumulative_dc, chance))
+    return odds
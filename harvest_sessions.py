@@ -0,0 +1,87 @@
+import sqlite3
+from dataclasses import dataclass
+
+# A harvest moves through these states in order, then the row is deleted
+STATE_MODIFIERS = "modifiers" # Waiting for the modifiers modal
+STATE_ASSESSMENT = "assessment" # Waiting for the assessment roll
+STATE_CARVING = "carving" # Waiting for the carving roll
+
+SESSION_TTL_SECONDS = 24 * 60 * 60 # Sessions untouched for this long are abandoned
+
+@dataclass(frozen=True)
+class HarvestSession:
+    discord_id: str
+    channel_id: int
+    message_id: int
+    creature: str
+    components: tuple[str, ...]
+    objective: str | None # harvest_planner objective, None to spend the roll in the order requested
+    state: str
+    proficiency_bonus: int | None
+    int_modifier: int | None
+    dex_modifier: int | None
+    assessment_roll: int | None
+    updated_at: int
+
+def _from_row(row: sqlite3.Row) -> HarvestSession:
+    return HarvestSession(
+        discord_id=row["discord_id"],
+        channel_id=row["channel_id"],
+        message_id=row["message_id"],
+        creature=row["creature"],
+        components=tuple(row["components"].split(",")),
+        objective=row["objective"],
+        state=row["state"],
+        proficiency_bonus=row["proficiency_bonus"],
+        int_modifier=row["int_modifier"],
+        dex_modifier=row["dex_modifier"],
+        assessment_roll=row["assessment_roll"],
+        updated_at=row["updated_at"],
+    )
+
+def start_session(conn: sqlite3.Connection, discord_id: str, channel_id: int, message_id: int,
+                  creature: str, components: list[str], objective: str | None, current_time: int):
+    """Creates a session in STATE_MODIFIERS, replacing any harvest the user had running in this channel."""
+    conn.execute(
+        '''INSERT OR REPLACE INTO harvest_sessions (discord_id, channel_id, message_id, creature, components, objective, state, updated_at)
+           VALUES (?, ?, ?, ?, ?, ?, ?, ?)''',
+        (discord_id, channel_id, message_id, creature, ",".join(components), objective, STATE_MODIFIERS, current_time)
+    )
+
+def get_session(conn: sqlite3.Connection, discord_id: str, channel_id: int, current_time: int) -> HarvestSession | None:
+    row = conn.execute(
+        "SELECT * FROM harvest_sessions WHERE discord_id = ? AND channel_id = ? AND updated_at >= ?",
+        (discord_id, channel_id, current_time - SESSION_TTL_SECONDS)
+    ).fetchone()
+    return _from_row(row) if row else None
+
+def advance_session(conn: sqlite3.Connection, session: HarvestSession, to_state: str, current_time: int,
+                    fields: dict[str, int] | None = None) -> HarvestSession | None:
+    """
+    Moves the session on from the state it was read in, setting `fields` (column
+    names) at the same time. Returns None if it has since moved on, been
+    replaced or expired, so a double click can't run a step twice.
+    """
+    fields = fields or {}
+    assignments = "".join(f", {column} = ?" for column in fields)
+    cursor = conn.execute(
+        f'''UPDATE harvest_sessions SET state = ?, updated_at = ?{assignments}
+            WHERE discord_id = ? AND channel_id = ? AND message_id = ? AND state = ? AND updated_at >= ?''',
+        (to_state, current_time, *fields.values(),
+         session.discord_id, session.channel_id, session.message_id, session.state, current_time - SESSION_TTL_SECONDS)
+    )
+    if cursor.rowcount == 0:
+        return None
+    return get_session(conn, session.discord_id, session.channel_id, current_time)
+
+def end_session(conn: sqlite3.Connection, session: HarvestSession) -> bool:
+    """Deletes the session if it is still in the state it was read in. Returns False if another step got there first."""
+    cursor = conn.execute(
+        "DELETE FROM harvest_sessions WHERE discord_id = ? AND channel_id = ? AND message_id = ? AND state = ?",
+        (session.discord_id, session.channel_id, session.message_id, session.state)
+    )
+    return cursor.rowcount > 0
+
+def purge_expired(conn: sqlite3.Connection, current_time: int) -> int:
+    cursor = conn.execute("DELETE FROM harvest_sessions WHERE updated_at < ?", (current_time - SESSION_TTL_SECONDS,))
+    return cursor.rowcount
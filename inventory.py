@@ -0,0 +1,44 @@
+import sqlite3
+from collections import defaultdict
+from typing import Iterable
+
+INVENTORY_PAGE_SIZE = 15
+
+# (character_id, item name, quantity to add)
+InventoryAddition = tuple[int, str, int]
+
+def add_items(conn: sqlite3.Connection, additions: Iterable[InventoryAddition]) -> int:
+    """
+    Adds items to inventories with a single batched upsert: new items are
+    inserted, existing ones have their quantity incremented in place. Additions
+    for the same character and item are summed first. Item names are
+    lowercased. Meant to run through db_utils.run_write or inside another
+    write such as the production tick. Returns the number of rows written.
+    """
+    totals: dict[tuple[int, str], int] = defaultdict(int)
+    for character_id, item, quantity in additions:
+        totals[(character_id, item.strip().lower())] += quantity
+    rows = [(character_id, item, quantity) for (character_id, item), quantity in totals.items() if quantity]
+    if not rows:
+        return 0
+    cursor = conn.executemany(
+        '''INSERT INTO character_inventory (character_id, item, quantity) VALUES (?, ?, ?)
+           ON CONFLICT (character_id, item) DO UPDATE SET quantity = quantity + excluded.quantity''',
+        rows
+    )
+    return cursor.rowcount
+
+def inventory_page(conn: sqlite3.Connection, character_id: int, after_item: str | None = None,
+                   before_item: str | None = None, limit: int = INVENTORY_PAGE_SIZE) -> list[sqlite3.Row]:
+    """
+    One page of a character's items in name order. Keyed on the item name like
+    wallet.history_page: pass the last item shown as after_item for the next
+    page, or the first one as before_item for the previous page.
+    """
+    select = "SELECT item, quantity FROM character_inventory WHERE character_id = ? AND quantity > 0"
+    if before_item is not None:
+        rows = conn.execute(f"{select} AND item < ? ORDER BY item DESC LIMIT ?", (character_id, before_item, limit)).fetchall()
+        return rows[::-1]
+    if after_item is not None:
+        return conn.execute(f"{select} AND item > ? ORDER BY item LIMIT ?", (character_id, after_item, limit)).fetchall()
+    return conn.execute(f"{select} ORDER BY item LIMIT ?", (character_id, limit)).fetchall()
@@ -1,44 +1,156 @@
 # Standard library imports
 import os
 import discord
+from discord import app_commands
 from discord.ext import commands, tasks
 import logging
 import asyncio
 import time # Keep for on_ready processing
+import hashlib
+import json
+from contextlib import contextmanager
 
 # Import from local modules
 import config # For TOKEN, TEST_SERVER_ID, SPELLCASTING_CLASSES
 import database as db_utils # For database connection and helper functions
+import building_catalog
+import metrics
+import sql_profiler
+import tracing
+from character_cache import cache as character_cache
+from member_registry import MemberRegistry
+import production
+import wallet
+from notifications import NotificationDispatcher
 from cogs.economy import CURRENCY_UNITS # Import for checking resource type
 
 # --- Environment & Logging ---
 # load_dotenv() is now in config.py
 handler = logging.FileHandler(filename='discord.log', encoding='utf-8', mode='w')
 
+COG_EXTENSIONS = [
+    "cogs.harvesting",
+    "cogs.building",
+    "cogs.character",
+    "cogs.economy",
+    "cogs.inventory",
+    "cogs.test",
+    "cogs.admin",
+]
+# Hash of the last command tree synced to Discord, see Client.sync_command_tree
+COMMAND_TREE_HASH_FILE = 'command_tree.hash'
+# Buildings collected per production transaction. Large catch-ups are split into
+# batches so other writes and events get a turn in between.
+PRODUCTION_BATCH_SIZE = 5000
+# How often wallet balances are snapshotted, which bounds the ledger entries a balance-at-time query sums
+WALLET_SNAPSHOT_HOURS = 6
+
+@contextmanager
+def startup_phase(name: str):
+    started = time.perf_counter()
+    yield
+    print(f"DEBUG: Startup phase '{name}' took {time.perf_counter() - started:.3f}s")
+
 # --- Bot Class ---
+class InstrumentedCommandTree(app_commands.CommandTree):
+    """Times every slash command (see Client.on_app_command_completion) and counts the ones that fail."""
+
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        interaction.extras["started_at"] = time.perf_counter()
+        return True
+
+    async def on_error(self, interaction: discord.Interaction, error: app_commands.AppCommandError):
+        command_name = interaction.command.qualified_name if interaction.command else "unknown"
+        error_name = type(getattr(error, "original", error)).__name__
+        metrics.COMMAND_ERRORS.inc(command=command_name, error=error_name)
+        record_command_time(interaction, command_name, error_name)
+        await super().on_error(interaction, error) # Keep the default logging
+
+def record_command_time(interaction: discord.Interaction, command_name: str, error_name: str | None = None):
+    started_at = interaction.extras.get("started_at")
+    if started_at is None:
+        return
+    metrics.COMMAND_SECONDS.observe(time.perf_counter() - started_at, command=command_name)
+    trace = tracing.current()
+    if trace is not None:
+        trace.span("command", started_at, command=command_name, error=error_name)
+
 class Client(commands.Bot):
     def __init__(self, *args, **kwargs):
+        kwargs.setdefault("tree_cls", InstrumentedCommandTree)
         super().__init__(*args, **kwargs)
-        # The task will be started in on_ready after initial processing
+        self.member_registry = MemberRegistry()
+        self._event_loop_watch: asyncio.Task | None = None
+        self._background_tasks: set[asyncio.Task] = set() # Strong refs so fire-and-forget tasks aren't garbage collected
+        # Wakes up whenever a building is due; started in on_ready after initial processing
+        self.production_scheduler = production.ProductionScheduler(self.process_building_production)
+        self.production_notifier = NotificationDispatcher(self, title="Building Production", color=discord.Color.gold())
 
     async def setup_hook(self):
         # This function is called once the bot is logged in and ready,
         # but before on_ready. It's the ideal place to load cogs and sync commands.
         print("DEBUG: Entered setup_hook")
+        if config.SQL_PROFILE:
+            sql_profiler.enable(config.SQL_SLOW_MS) # Before the first connection is opened
+
+        with startup_phase("database migrations"):
+            await asyncio.to_thread(db_utils.initialize_db)
+
+        with startup_phase("building catalog"):
+            await building_catalog.catalog.reload()
+
+        # Know every existing member before the first message arrives
+        with startup_phase("member registry"):
+            await self.member_registry.warm()
+        self.flush_new_members.start()
+        self.snapshot_wallets.start()
+        self.register_cache_metrics()
+        self._event_loop_watch = asyncio.create_task(metrics.watch_event_loop_lag())
+        if config.METRICS_FILE:
+            self.write_metrics_file.start()
         
-        # Load cogs
-        await self.load_extension("cogs.harvesting")
-        await self.load_extension("cogs.building")
-        await self.load_extension("cogs.character") 
-        await self.load_extension("cogs.economy") # Load the new economy cog
-        await self.load_extension("cogs.test")  # Load the new test cog
+        # Load cogs (independent of each other, so load them concurrently)
+        with startup_phase("cogs"):
+            await asyncio.gather(*(self.load_extension(extension) for extension in COG_EXTENSIONS))
         print("DEBUG: Cogs loaded.")
 
-        # Sync commands after adding the test command
+        # Sync commands, but only if they changed since the last successful sync
+        with startup_phase("command sync"):
+            await self.sync_command_tree()
+
+    def command_sync_guild(self) -> discord.Object | None:
+        """The guild commands are synced to, or None for global commands."""
+        guild_id_int = int(config.TEST_SERVER_ID) if config.TEST_SERVER_ID else None
+        return discord.Object(id=guild_id_int) if guild_id_int else None
+
+    def command_tree_hash(self, guild: discord.Object | None) -> str:
+        """Hashes exactly the payload tree.sync() would upload for this guild (or globally)."""
+        payload = [command.to_dict(self.tree) for command in self.tree.get_commands(guild=guild)]
+        serialized = json.dumps(
+            {"guild": guild.id if guild else None, "commands": sorted(payload, key=lambda command: (command.get("type", 1), command["name"]))},
+            sort_keys=True
+        )
+        return hashlib.sha256(serialized.encode("utf-8")).hexdigest()
+
+    async def sync_command_tree(self, force: bool = False) -> int | None:
+        """
+        Syncs the command tree when it differs from the last synced one, or always when forced.
+        Returns the number of commands synced, or None if the sync was skipped or failed.
+        """
+        guild = self.command_sync_guild()
+        tree_hash = self.command_tree_hash(guild)
+        try:
+            with open(COMMAND_TREE_HASH_FILE, encoding="utf-8") as f:
+                last_synced_hash = f.read().strip()
+        except FileNotFoundError:
+            last_synced_hash = None
+
+        if not force and tree_hash == last_synced_hash:
+            print("DEBUG: Command tree unchanged since last sync, skipping sync.")
+            return None
+
         try:
-            guild_id_int = int(config.TEST_SERVER_ID) if config.TEST_SERVER_ID else None
-            if guild_id_int:
-                guild = discord.Object(id=guild_id_int)
+            if guild:
                 synced = await self.tree.sync(guild=guild)
                 print(f"Synced {len(synced)} commands to guild {guild.id}")
             else:
@@ -46,6 +158,11 @@ class Client(commands.Bot):
                 print(f"Synced {len(synced)} commands globally.")
         except Exception as e:
             print(f"Error syncing commands: {e}")
+            return None
+
+        with open(COMMAND_TREE_HASH_FILE, "w", encoding="utf-8") as f:
+            f.write(tree_hash)
+        return len(synced)
 
     async def on_ready(self):
         print("DEBUG: Entered on_ready method")
@@ -53,154 +170,147 @@ class Client(commands.Bot):
         print(f"Bot ID: {self.user.id}")
         print("HarvestingBot has logged on")
 
-        print("DEBUG: Initial check for building production on startup...")
-        await self.process_building_production() # Call the processing logic directly on startup
-
-        print("DEBUG: Starting background task check_building_production...")
-        if not self.check_building_production.is_running():
-            self.check_building_production.start()
+        # Production catch-up runs in the background: the scheduler's first tick
+        # handles everything that came due while we were offline, in batches.
+        if not self.production_scheduler.is_running():
+            print("DEBUG: Starting production scheduler (includes startup catch-up)...")
+            with startup_phase("production scheduler load"):
+                await self.production_scheduler.load()
+            self.production_scheduler.start()
         print("DEBUG: Finished processing on_ready.")
 
+    async def on_app_command_completion(self, interaction: discord.Interaction, command: app_commands.Command):
+        record_command_time(interaction, command.qualified_name)
+
+    def register_cache_metrics(self):
+        registry = metrics.registry
+        registry.gauge("dnd_character_cache_hit_ratio", "Share of character cache lookups answered from memory.",
+                       lambda: character_cache.stats()["hit_rate"])
+        registry.gauge("dnd_character_cache_size", "Users currently in the character cache.", lambda: character_cache.stats()["size"])
+        registry.gauge("dnd_member_registry_size", "Discord IDs known to have a members row.", lambda: self.member_registry.known_count)
+        registry.gauge("dnd_member_registry_pending", "New members waiting for the next batched insert.", lambda: self.member_registry.pending_count)
+        registry.gauge("dnd_building_catalog_size", "Building types in the in-memory catalog.", lambda: len(building_catalog.catalog))
+
     async def on_message(self, message: discord.Message):
         if message.author == self.user:
             return
         
-        conn = db_utils.get_db_connection()
-        cursor = conn.cursor()
-        try:
-            # Ensure member exists, if not, create them.
-            # This is important for active_character_id to be settable.
-            cursor.execute('SELECT 1 FROM members WHERE discord_id = ?', (str(message.author.id),))
-            if cursor.fetchone() is None:
-                cursor.execute(
-                    'INSERT INTO members (discord_id, discord_tag) VALUES (?, ?)',
-                    (str(message.author.id), str(message.author))
-                )
-                conn.commit()
-                # Send a temporary confirmation message
-                creation_msg = await message.channel.send(f"Added {message.author.name} to the database (first message).")
-                await asyncio.sleep(10) # Wait 10 seconds
-                try:
-                    await creation_msg.delete() # Delete the confirmation message
-                except discord.NotFound: # Message might have been deleted manually
-                    pass
-                except discord.Forbidden: # Bot might lack permissions
-                    pass
-                except Exception as e: # Catch other potential errors
-                    print(f"Error deleting user creation message: {e}")
-        finally:
-            conn.close()
-        
+        # Ensure member exists, if not, create them.
+        # This is important for active_character_id to be settable.
+        # The registry answers from memory; the INSERT is batched by flush_new_members.
+        if self.member_registry.register(str(message.author.id), str(message.author)):
+            # Announce in the background so command processing isn't held up
+            self.spawn(self.announce_new_member(message))
+
         await self.process_commands(message)
 
-    async def process_building_production(self):
-        """Processes resource production for all character_buildings."""
-        print("DEBUG: Running process_building_production task for character buildings.")
-        conn = db_utils.get_db_connection()
-        cursor = conn.cursor()
-        # Need access to economy cog's update_character_wallet or a similar utility
-        economy_cog = self.get_cog("EconomyCog")
-        if not economy_cog:
-            print("ERROR: EconomyCog not found. Cannot process building production.")
-            conn.close()
-            return
+    def spawn(self, coro) -> asyncio.Task:
+        """Runs a coroutine in the background, keeping a reference until it finishes."""
+        task = asyncio.create_task(coro)
+        self._background_tasks.add(task)
+        task.add_done_callback(self._background_tasks.discard)
+        return task
 
+    async def announce_new_member(self, message: discord.Message):
+        # Send a temporary confirmation message, discord.py deletes it after 10 seconds
         try:
-            cursor.execute("""
-                SELECT cb.id, cb.character_id, c.name AS character_name, cb.channel_id, cb.last_collection_time, cb.custom_name,
-                       bt.name AS building_type_name, bt.resource_output, bt.resource_type, bt.resource_frequency
-                FROM character_buildings cb
-                JOIN building_types bt ON cb.building_type_id = bt.id
-                JOIN characters c ON cb.character_id = c.id
-            """) # Added JOIN with characters table and c.name
-            all_character_buildings = cursor.fetchall()
-
-            if not all_character_buildings:
-                # print("DEBUG: No character buildings to process.")
-                conn.close()
-                return
-
-            current_time = int(time.time())
-
-            for building_data in all_character_buildings:
-                building_instance_id = building_data["id"]
-                character_id = building_data["character_id"]
-                character_name = building_data["character_name"] # Get character_name from the query result
-                channel_id = building_data["channel_id"]
-                last_collection_time = building_data["last_collection_time"]
-                building_display_name = building_data["custom_name"] if building_data["custom_name"] else building_data["building_type_name"]
-                
-                resource_output = building_data["resource_output"]
-                resource_type_key = building_data["resource_type"].lower() # e.g., "gp", "sp"
-                resource_frequency = building_data["resource_frequency"]
-
-                frequency_mapping = {
-                    "daily": 86400, "hourly": 3600, "weekly": 604800, "test": 15
-                }
-                interval = frequency_mapping.get(resource_frequency.lower())
-                if not interval:
-                    print(f"WARNING: Invalid frequency '{resource_frequency}' for building instance ID {building_instance_id}. Skipping.")
-                    continue
-
-                time_difference = current_time - last_collection_time
-                if time_difference >= interval:
-                    num_collections_to_process = int(time_difference // interval)
-                    total_resources_gained_amount = 0
-                    for _ in range(num_collections_to_process):
-                        total_resources_gained_amount += db_utils.calculate_roll_result(resource_output)
-                    
-                    if num_collections_to_process > 0 and total_resources_gained_amount > 0:
-                        notification_channel = self.get_channel(channel_id)
-                        
-                        # Check if the resource_type is a known currency
-                        if resource_type_key in CURRENCY_UNITS:
-                            # Add to character's wallet
-                            update_success = await economy_cog.update_character_wallet(
-                                character_id, 
-                                resource_type_key, 
-                                total_resources_gained_amount
-                            )
-
-                            if update_success:
-                                if notification_channel:
-                                    await notification_channel.send(
-                                        f"Your building '{building_display_name}' has produced **{total_resources_gained_amount} {CURRENCY_UNITS[resource_type_key]['name']}** for {character_name}."
-                                    )
-                                print(f"DEBUG: Added {total_resources_gained_amount} {resource_type_key} to {character_name} (ID: {character_id}) from building {building_instance_id}")
-                            else:
-                                if notification_channel:
-                                    await notification_channel.send(
-                                        f"Tried to add resources from '{building_display_name}' to {character_name} (ID: {character_id}), but the wallet update failed."
-                                    )
-                                print(f"ERROR: Failed to update wallet for {character_name} (ID: {character_id}) from building {building_instance_id}")
-                        else:
-                            # Handle non-currency resources (e.g., log, or if inventory system exists, add there)
-                            if notification_channel:
-                                await notification_channel.send(
-                                    f"Your building '{building_display_name}' has produced **{total_resources_gained_amount} {resource_type_key}** for {character_name}."
-                                )
-                            print(f"DEBUG: Building {building_instance_id} produced non-currency item: {total_resources_gained_amount} {resource_type_key} for {character_name} (ID: {character_id})")
-
-                        # Update last_collection_time for this specific building instance
-                        new_last_collection_time = last_collection_time + (num_collections_to_process * interval)
-                        cursor.execute(
-                            "UPDATE character_buildings SET last_collection_time = ? WHERE id = ?",
-                            (new_last_collection_time, building_instance_id)
-                        )
-                        conn.commit()
-                        print(f"DEBUG: Processed {num_collections_to_process} collections for building instance {building_instance_id}. New last_collection_time: {new_last_collection_time}")
+            await message.channel.send(f"Added {message.author.name} to the database (first message).", delete_after=10)
+        except discord.Forbidden: # Bot might lack permissions
+            pass
+        except Exception as e: # Catch other potential errors
+            print(f"Error sending user creation message: {e}")
+
+    @tasks.loop(seconds=5)
+    async def flush_new_members(self):
+        try:
+            flushed = await self.member_registry.flush()
+            if flushed:
+                print(f"DEBUG: Added {flushed} new members to the database.")
         except Exception as e:
-            print(f"ERROR: An error occurred during character building production processing: {e}")
-        finally:
-            conn.close()
+            print(f"ERROR: Failed to flush new members: {e}")
 
-    @tasks.loop(minutes=30) # Changed from minutes=1 to minutes=30
-    async def check_building_production(self):
-        await self.process_building_production()
+    @tasks.loop(seconds=config.METRICS_FILE_SECONDS)
+    async def write_metrics_file(self):
+        try:
+            await asyncio.to_thread(metrics.registry.write_prometheus, config.METRICS_FILE)
+        except Exception as e:
+            print(f"ERROR: Failed to write metrics file {config.METRICS_FILE}: {e}")
 
-    @check_building_production.before_loop
-    async def before_check_building_production(self):
-        await self.wait_until_ready()
+    @tasks.loop(hours=WALLET_SNAPSHOT_HOURS)
+    async def snapshot_wallets(self):
+        try:
+            snapshots = await db_utils.run_write(wallet.snapshot_wallets)
+            print(f"DEBUG: Took {snapshots} wallet snapshots.")
+        except Exception as e:
+            print(f"ERROR: Failed to snapshot wallets: {e}")
+
+    async def process_building_production(self) -> production.TickResult | None:
+        """Processes resource production for every character_building that is due, in batches."""
+        print("DEBUG: Running process_building_production task for character buildings.")
+        started = time.perf_counter()
+        total = production.TickResult()
+        batches = 0
+        while True:
+            try:
+                # Each batch's payouts and collection times are committed in one transaction on the writer thread
+                result = await db_utils.run_write(production.run_production_tick, int(time.time()), None, PRODUCTION_BATCH_SIZE)
+            except Exception as e:
+                print(f"ERROR: An error occurred during character building production processing: {e}")
+                total.failed = True # The scheduler retries the buildings this batch held
+                break
+            batches += 1
+            total.merge(result)
+            metrics.PRODUCTION_BUILDINGS_COLLECTED.inc(result.buildings_collected)
+            if not result.has_more:
+                break
+            await asyncio.sleep(0) # Let queued commands and other writes run between batches
+
+        # Announce only after the transactions have committed. Notices are merged per
+        # channel and sent in the background, so the tick never waits on Discord.
+        for notice in total.notices:
+            if notice.is_currency:
+                resource_name = CURRENCY_UNITS[notice.resource_type]['name']
+            else:
+                resource_name = notice.resource_type # Already added to the character's inventory by the tick
+            self.production_notifier.add(
+                notice.channel_id,
+                f"Your building '{notice.building_name}' has produced **{notice.amount} {resource_name}** for {notice.character_name}."
+            )
+        messages_started = self.production_notifier.dispatch()
+        for notice in total.notices:
+            metrics.PRODUCTION_PAYOUT.inc(notice.amount, resource=notice.resource_type)
+        metrics.PRODUCTION_TICK_SECONDS.observe(time.perf_counter() - started)
+
+        print(
+            f"DEBUG: Production tick collected {total.buildings_collected}/{total.buildings_scanned} due buildings in {batches} batches, "
+            f"updated {total.wallet_rows_updated} wallet rows, {total.inventory_rows_updated} inventory rows "
+            f"and {total.building_rows_updated} building rows "
+            f"(transactions {total.duration_seconds:.3f}s, total {time.perf_counter() - started:.3f}s), "
+            f"{messages_started} notification messages queued."
+        )
+        return total
+
+    async def close(self):
+        self.production_scheduler.stop()
+        await self.production_notifier.drain() # Deliver what's already been collected
+        await super().close()
+        self.flush_new_members.cancel()
+        self.snapshot_wallets.cancel()
+        if self._event_loop_watch is not None:
+            self._event_loop_watch.cancel()
+        if self.write_metrics_file.is_running():
+            self.write_metrics_file.cancel()
+            await asyncio.to_thread(metrics.registry.write_prometheus, config.METRICS_FILE) # Final numbers
+        try:
+            await self.member_registry.flush() # Don't lose members seen since the last flush
+        except Exception as e:
+            print(f"ERROR: Failed to flush new members on shutdown: {e}")
+        if tracing.tracer.recording:
+            tracing.tracer.stop() # Flush what was recorded
+            tracing.uninstall(self)
+        db_utils.shutdown() # Close the database threads and their connections
+        if sql_profiler.profiler is not None:
+            print(f"DEBUG: SQL profile at shutdown:\n{sql_profiler.profiler.format_report()}")
 
 # --- Discord Bot Setup ---
 intents = discord.Intents.default()
@@ -0,0 +1,55 @@
+import database as db_utils
+
+class MemberRegistry:
+    """
+    In-memory set of Discord IDs that have a row in the members table.
+    Lookups never touch the database; newly seen members are queued and
+    written in batches by flush().
+    """
+
+    def __init__(self):
+        self._known: set[str] = set()
+        self._pending: dict[str, str] = {} # discord_id -> discord_tag, waiting to be inserted
+
+    async def warm(self):
+        """Loads every existing member ID. Call once at startup before messages are handled."""
+        rows = await db_utils.fetch_all("SELECT discord_id FROM members")
+        self._known.update(row["discord_id"] for row in rows)
+        print(f"DEBUG: Member registry warmed with {len(self._known)} members.")
+
+    def register(self, discord_id: str, discord_tag: str) -> bool:
+        """Queues a member for insertion. Returns True if this is the first time we've seen them."""
+        if discord_id in self._known:
+            return False
+        self._known.add(discord_id)
+        self._pending[discord_id] = discord_tag
+        return True
+
+    def mark_known(self, discord_id: str):
+        """Records a member row that was written elsewhere (e.g. /character setactive)."""
+        self._known.add(discord_id)
+
+    @property
+    def known_count(self) -> int:
+        return len(self._known)
+
+    @property
+    def pending_count(self) -> int:
+        return len(self._pending)
+
+    async def flush(self) -> int:
+        """Writes all queued members in one transaction. Returns how many were queued."""
+        if not self._pending:
+            return 0
+        batch, self._pending = self._pending, {}
+        try:
+            await db_utils.execute_many(
+                "INSERT OR IGNORE INTO members (discord_id, discord_tag) VALUES (?, ?)",
+                list(batch.items())
+            )
+        except Exception:
+            # Put the batch back so the next flush retries it
+            for discord_id, discord_tag in batch.items():
+                self._pending.setdefault(discord_id, discord_tag)
+            raise
+        return len(batch)
@@ -0,0 +1,226 @@
+"""
+In-process metrics: counters, gauges and latency histograms, shown by
+/admin stats and optionally written to a Prometheus text file (see
+config.METRICS_FILE). Updates are thread-safe, so the database threads can
+record into the same registry as the event loop.
+"""
+import asyncio
+import os
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from dataclasses import dataclass
+
+# Histogram bucket upper bounds in seconds, from 100µs to 30s
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+EVENT_LOOP_LAG_INTERVAL = 0.5 # Seconds between event loop lag probes
+
+Labels = tuple[tuple[str, str], ...] # Sorted (name, value) pairs
+
+def _labels(labels: dict) -> Labels:
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+def _format_labels(labels: Labels) -> str:
+    if not labels:
+        return ""
+    escaped = (value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"') for _, value in labels)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(labels, escaped)) + "}"
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str):
+        self.name = name
+        self.help_text = help_text
+        self._lock = threading.Lock()
+        self._values: dict[Labels, float] = defaultdict(float)
+
+    def inc(self, amount: float = 1, **labels):
+        key = _labels(labels)
+        with self._lock:
+            self._values[key] += amount
+
+    def values(self) -> dict[Labels, float]:
+        with self._lock:
+            return dict(self._values)
+
+    def samples(self) -> list[tuple[str, Labels, float]]:
+        return [(self.name, labels, value) for labels, value in self.values().items()]
+
+class Gauge:
+    """A value that is set directly, or read from `function` whenever the gauge is collected."""
+    kind = "gauge"
+
+    def __init__(self, name: str, help_text: str, function=None):
+        self.name = name
+        self.help_text = help_text
+        self._function = function
+        self._lock = threading.Lock()
+        self._values: dict[Labels, float] = {}
+
+    def set(self, value: float, **labels):
+        key = _labels(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def values(self) -> dict[Labels, float]:
+        if self._function is not None:
+            return {(): float(self._function())}
+        with self._lock:
+            return dict(self._values)
+
+    def samples(self) -> list[tuple[str, Labels, float]]:
+        return [(self.name, labels, value) for labels, value in self.values().items()]
+
+@dataclass
+class HistogramSnapshot:
+    buckets: tuple[float, ...]
+    counts: list[int] # Per bucket (not cumulative), plus one for everything above the last bound
+    count: int
+    total: float
+    maximum: float
+
+    def quantile(self, fraction: float) -> float:
+        """Estimates a quantile by interpolating inside the bucket it falls in."""
+        if not self.count:
+            return 0.0
+        rank = fraction * self.count
+        seen = 0
+        for index, bucket_count in enumerate(self.counts):
+            if bucket_count and seen + bucket_count >= rank:
+                lower = self.buckets[index - 1] if index else 0.0
+                upper = self.buckets[index] if index < len(self.buckets) else self.maximum
+                return min(lower + (upper - lower) * (rank - seen) / bucket_count, self.maximum)
+            seen += bucket_count
+        return self.maximum
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, buckets: tuple[float, ...] = LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._series: dict[Labels, HistogramSnapshot] = {}
+
+    def observe(self, value: float, **labels):
+        key = _labels(labels)
+        index = next((index for index, bound in enumerate(self.buckets) if value <= bound), len(self.buckets))
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = HistogramSnapshot(self.buckets, [0] * (len(self.buckets) + 1), 0, 0.0, 0.0)
+            series.counts[index] += 1
+            series.count += 1
+            series.total += value
+            series.maximum = max(series.maximum, value)
+
+    @contextmanager
+    def time(self, **labels):
+        """Observes how long the `with` block took, in seconds."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def series(self) -> dict[Labels, HistogramSnapshot]:
+        with self._lock:
+            return {
+                labels: HistogramSnapshot(self.buckets, list(series.counts), series.count, series.total, series.maximum)
+                for labels, series in self._series.items()
+            }
+
+    def samples(self) -> list[tuple[str, Labels, float]]:
+        samples = []
+        for labels, series in self.series().items():
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), series.counts):
+                cumulative += bucket_count
+                samples.append((f"{self.name}_bucket", labels + (("le", "+Inf" if bound == float("inf") else repr(bound)),), cumulative))
+            samples.append((f"{self.name}_sum", labels, series.total))
+            samples.append((f"{self.name}_count", labels, series.count))
+        return samples
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: dict[str, Counter | Gauge | Histogram] = {}
+
+    def _register(self, metric):
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric '{metric.name}' is already registered.")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help_text: str) -> Counter:
+        return self._register(Counter(name, help_text))
+
+    def gauge(self, name: str, help_text: str, function=None) -> Gauge:
+        """Registering a callback gauge again points it at the new function (e.g. for a new Client)."""
+        existing = self._metrics.get(name)
+        if function is not None and isinstance(existing, Gauge) and existing._function is not None:
+            existing._function = function
+            return existing
+        return self._register(Gauge(name, help_text, function))
+
+    def histogram(self, name: str, help_text: str, buckets: tuple[float, ...] = LATENCY_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, help_text, buckets))
+
+    def get(self, name: str) -> Counter | Gauge | Histogram | None:
+        return self._metrics.get(name)
+
+    def render_prometheus(self) -> str:
+        """Every metric in the Prometheus text exposition format."""
+        lines = []
+        for metric in self._metrics.values():
+            try:
+                samples = metric.samples()
+            except Exception as e: # A gauge function failing shouldn't lose the rest of the file
+                print(f"WARNING: Could not collect metric {metric.name}: {e}")
+                continue
+            lines.append(f"# HELP {metric.name} {metric.help_text}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(f"{name}{_format_labels(labels)} {value:g}" for name, labels, value in samples)
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path: str):
+        """Writes render_prometheus() to path atomically, so a scraper never reads half a file."""
+        temp_path = f"{path}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            f.write(self.render_prometheus())
+        os.replace(temp_path, path)
+
+# Shared instance, everything below records into it
+registry = MetricsRegistry()
+
+COMMAND_SECONDS = registry.histogram("dnd_command_seconds", "Time from a slash command reaching the command tree to its callback finishing.")
+COMMAND_ERRORS = registry.counter("dnd_command_errors_total", "Slash commands that failed, by command and error type.")
+DB_QUERY_SECONDS = registry.histogram("dnd_db_query_seconds", "Time each database function or SQL statement ran on its database thread.")
+DB_QUERY_ERRORS = registry.counter("dnd_db_query_errors_total", "Database functions or SQL statements that raised.")
+DB_WRITE_WAIT_SECONDS = registry.histogram("dnd_db_write_wait_seconds", "Time writes spent queued for the single writer thread.")
+PRODUCTION_TICK_SECONDS = registry.histogram("dnd_production_tick_seconds", "Duration of process_building_production, all batches included.")
+PRODUCTION_BUILDINGS_COLLECTED = registry.counter("dnd_production_buildings_collected_total", "Building collections made by production ticks.")
+PRODUCTION_PAYOUT = registry.counter("dnd_production_payout_total", "Resources paid out by production, by resource type.")
+EVENT_LOOP_LAG_SECONDS = registry.histogram("dnd_event_loop_lag_seconds", "How late the event loop woke up from a timed sleep.")
+
+def query_label(func) -> str:
+    """How a run_read/run_write function is labelled, e.g. 'inventory.inventory_page'."""
+    return f"{func.__module__}.{func.__qualname__}"
+
+def sql_label(sql: str, limit: int = 120) -> str:
+    """A SQL statement on one line, truncated, for use as a label."""
+    return " ".join(sql.split())[:limit]
+
+async def watch_event_loop_lag(interval: float = EVENT_LOOP_LAG_INTERVAL):
+    """Sleeps in a loop and records how much later than asked each wake-up came. Runs until cancelled."""
+    loop = asyncio.get_running_loop()
+    while True:
+        expected = loop.time() + interval
+        await asyncio.sleep(interval)
+        EVENT_LOOP_LAG_SECONDS.observe(max(0.0, loop.time() - expected))
@@ -0,0 +1,189 @@
+import sqlite3
+import time
+
+# Ordered schema migrations. Each entry is (version, description, statements).
+# Never edit a migration that has shipped; append a new one instead.
+# Version 1 uses IF NOT EXISTS so databases created before migrations existed
+# are adopted as-is.
+MIGRATIONS: list[tuple[int, str, list[str]]] = [
+    (1, "Initial schema", [
+        '''
+        CREATE TABLE IF NOT EXISTS members (
+            discord_id TEXT UNIQUE,
+            discord_tag TEXT,
+            active_character_id INTEGER,
+            FOREIGN KEY (active_character_id) REFERENCES characters(id)
+        )''',
+        '''
+        CREATE TABLE IF NOT EXISTS characters (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            discord_id TEXT,
+            name TEXT,
+            class TEXT,
+            spellcaster BOOLEAN,
+            cp INTEGER DEFAULT 0,
+            sp INTEGER DEFAULT 0,
+            ep INTEGER DEFAULT 0,
+            gp INTEGER DEFAULT 0,
+            pp INTEGER DEFAULT 0
+        )''',
+        '''
+        CREATE TABLE IF NOT EXISTS building_types (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT UNIQUE, -- e.g., "Small Mine", "Herbalist Hut"
+            resource_output TEXT, -- e.g., "1d6"
+            resource_type TEXT, -- e.g., "gp", "herbs" (for now, assume currency from economy cog)
+            resource_frequency TEXT -- e.g., "daily", "hourly"
+        )''',
+        # Instances of buildings owned by characters
+        '''
+        CREATE TABLE IF NOT EXISTS character_buildings (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            character_id INTEGER,
+            building_type_id INTEGER,
+            custom_name TEXT, -- Optional: "Bob's Lucky Mine"
+            channel_id INTEGER, -- Channel for notifications for this specific building
+            last_collection_time INTEGER, -- Unix timestamp
+            FOREIGN KEY (character_id) REFERENCES characters(id),
+            FOREIGN KEY (building_type_id) REFERENCES building_types(id)
+        )''',
+        # The old 'buildings' and 'active_rolls' tables are no longer used, but
+        # are left in place so migrating an existing database never deletes data.
+    ]),
+    (2, "Index foreign keys used by lookups and the production join", [
+        "CREATE INDEX IF NOT EXISTS idx_characters_discord_id ON characters (discord_id)",
+        "CREATE INDEX IF NOT EXISTS idx_character_buildings_character_id ON character_buildings (character_id)",
+        "CREATE INDEX IF NOT EXISTS idx_character_buildings_building_type_id ON character_buildings (building_type_id)",
+        "CREATE INDEX IF NOT EXISTS idx_members_active_character_id ON members (active_character_id)",
+    ]),
+    (3, "Track when each building is next due for collection", [
+        "ALTER TABLE character_buildings ADD COLUMN next_due_time INTEGER", # Unix timestamp, NULL = never due
+        # Frequencies as of this migration; unknown frequencies stay NULL
+        '''
+        UPDATE character_buildings SET next_due_time = last_collection_time + (
+            SELECT CASE lower(bt.resource_frequency)
+                WHEN 'daily' THEN 86400
+                WHEN 'hourly' THEN 3600
+                WHEN 'weekly' THEN 604800
+                WHEN 'test' THEN 15
+            END
+            FROM building_types bt WHERE bt.id = character_buildings.building_type_id
+        )''',
+        "CREATE INDEX IF NOT EXISTS idx_character_buildings_next_due_time ON character_buildings (next_due_time)",
+    ]),
+    (4, "Persist in-progress harvests", [
+        # At most one harvest per user per channel; starting another replaces it
+        '''
+        CREATE TABLE IF NOT EXISTS harvest_sessions (
+            discord_id TEXT NOT NULL,
+            channel_id INTEGER NOT NULL,
+            message_id INTEGER NOT NULL, -- The message carrying the session's buttons
+            creature TEXT NOT NULL, -- Lowercased key in HARVEST_DC_TABLES
+            components TEXT NOT NULL, -- Comma-separated, lowercased, in the order requested
+            state TEXT NOT NULL, -- 'modifiers', 'assessment' or 'carving'
+            proficiency_bonus INTEGER,
+            int_modifier INTEGER,
+            dex_modifier INTEGER,
+            assessment_roll INTEGER,
+            updated_at INTEGER NOT NULL, -- Unix timestamp
+            PRIMARY KEY (discord_id, channel_id)
+        )''',
+        "CREATE INDEX IF NOT EXISTS idx_harvest_sessions_updated_at ON harvest_sessions (updated_at)",
+    ]),
+    (5, "Let harvests optimize which components they take", [
+        "ALTER TABLE harvest_sessions ADD COLUMN objective TEXT", # See harvest_planner.OBJECTIVES, NULL = in the order requested
+    ]),
+    (6, "Wallet ledger and balance snapshots", [
+        # Append-only: one row per character per wallet write, never updated or deleted
+        '''
+        CREATE TABLE IF NOT EXISTS wallet_ledger (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            character_id INTEGER NOT NULL,
+            created_at INTEGER NOT NULL, -- Unix timestamp
+            reason TEXT NOT NULL, -- e.g., "production", "payment", see wallet.py
+            related_character_id INTEGER, -- The other side of a payment
+            cp_delta INTEGER NOT NULL DEFAULT 0,
+            sp_delta INTEGER NOT NULL DEFAULT 0,
+            ep_delta INTEGER NOT NULL DEFAULT 0,
+            gp_delta INTEGER NOT NULL DEFAULT 0,
+            pp_delta INTEGER NOT NULL DEFAULT 0,
+            FOREIGN KEY (character_id) REFERENCES characters(id)
+        )''',
+        "CREATE INDEX IF NOT EXISTS idx_wallet_ledger_character_id ON wallet_ledger (character_id, id)",
+        # Balances after every ledger entry up to and including ledger_id
+        '''
+        CREATE TABLE IF NOT EXISTS wallet_snapshots (
+            character_id INTEGER NOT NULL,
+            ledger_id INTEGER NOT NULL,
+            created_at INTEGER NOT NULL, -- Unix timestamp
+            cp INTEGER NOT NULL,
+            sp INTEGER NOT NULL,
+            ep INTEGER NOT NULL,
+            gp INTEGER NOT NULL,
+            pp INTEGER NOT NULL,
+            PRIMARY KEY (character_id, ledger_id)
+        )''',
+        # Existing balances become each character's first entry, so the ledger always sums to the wallet
+        '''
+        INSERT INTO wallet_ledger (character_id, created_at, reason, cp_delta, sp_delta, ep_delta, gp_delta, pp_delta)
+        SELECT id, CAST(strftime('%s', 'now') AS INTEGER), 'opening balance', cp, sp, ep, gp, pp
+        FROM characters
+        WHERE cp != 0 OR sp != 0 OR ep != 0 OR gp != 0 OR pp != 0''',
+    ]),
+    (7, "Character inventories", [
+        # One row per character per item; the primary key doubles as the index for paging by name
+        '''
+        CREATE TABLE IF NOT EXISTS character_inventory (
+            character_id INTEGER NOT NULL,
+            item TEXT NOT NULL, -- Lowercased, e.g., "iron_ore" or "beast hide"
+            quantity INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (character_id, item),
+            FOREIGN KEY (character_id) REFERENCES characters(id)
+        )''',
+    ]),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+def get_schema_version(conn: sqlite3.Connection) -> int:
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            description TEXT,
+            applied_at INTEGER -- Unix timestamp
+        )'''
+    )
+    row = conn.execute("SELECT MAX(version) FROM schema_version").fetchone()
+    return row[0] or 0
+
+def run_migrations(conn: sqlite3.Connection) -> list[int]:
+    """Applies every migration newer than the database's version, each in its own transaction. Returns the versions applied."""
+    current_version = get_schema_version(conn)
+    conn.commit()
+    if current_version > LATEST_VERSION:
+        raise RuntimeError(
+            f"Database schema is at version {current_version} but this code only knows up to {LATEST_VERSION}. "
+            "Refusing to start with an older build."
+        )
+
+    applied = []
+    for version, description, statements in MIGRATIONS:
+        if version <= current_version:
+            continue
+        try:
+            conn.execute("BEGIN") # DDL doesn't open a transaction on its own
+            for statement in statements:
+                conn.execute(statement)
+            conn.execute(
+                "INSERT INTO schema_version (version, description, applied_at) VALUES (?, ?, ?)",
+                (version, description, int(time.time()))
+            )
+            conn.commit()
+        except sqlite3.Error:
+            conn.rollback()
+            print(f"ERROR: Migration {version} ({description}) failed, schema left at version {current_version}.")
+            raise
+        current_version = version
+        applied.append(version)
+        print(f"DEBUG: Applied migration {version}: {description}")
+    return applied
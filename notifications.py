@@ -0,0 +1,110 @@
+import asyncio
+import time
+from collections import defaultdict
+
+import discord
+
+# Discord limits (https://discord.com/developers/docs/resources/message#embed-object-embed-limits)
+EMBED_DESCRIPTION_LIMIT = 4096
+
+# Discord allows roughly 5 messages per 5 seconds per channel. Staying under
+# that ourselves means we never wait on 429 retries.
+CHANNEL_BURST = 5
+CHANNEL_RATE_PER_SECOND = 1.0
+MAX_CONCURRENT_SENDS = 8
+
+class TokenBucket:
+    """Allows `capacity` sends at once, refilling at `rate` tokens per second."""
+
+    def __init__(self, capacity: int, rate: float):
+        self.capacity = capacity
+        self.rate = rate
+        self._tokens = float(capacity)
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock: # Waiters queue up in order instead of all racing for the next token
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+    def is_full(self) -> bool:
+        """True once refilled to capacity with nobody waiting, when it is no different from a new bucket."""
+        if self._lock.locked():
+            return False
+        return self._tokens + (time.monotonic() - self._updated) * self.rate >= self.capacity
+
+def chunk_lines(lines: list[str], limit: int = EMBED_DESCRIPTION_LIMIT) -> list[str]:
+    """Joins lines with newlines into as few chunks as possible, each at most `limit` characters."""
+    chunks = []
+    current = ""
+    for line in lines:
+        line = line[:limit] # A single line can't be split sensibly, just cut it
+        candidate = f"{current}\n{line}" if current else line
+        if len(candidate) > limit:
+            chunks.append(current)
+            current = line
+        else:
+            current = candidate
+    if current:
+        chunks.append(current)
+    return chunks
+
+class NotificationDispatcher:
+    """
+    Batches outgoing notices. Lines queued for the same channel are merged into
+    as few embeds as the limits allow, then sent in the background with a cap on
+    concurrent requests and a token bucket per channel.
+    """
+
+    def __init__(self, bot: discord.Client, title: str, color: discord.Color):
+        self.bot = bot
+        self.title = title
+        self.color = color
+        self._pending: dict[int, list[str]] = defaultdict(list) # channel_id -> lines
+        self._buckets: dict[int, TokenBucket] = {}
+        self._send_slots = asyncio.Semaphore(MAX_CONCURRENT_SENDS)
+        self._tasks: set[asyncio.Task] = set()
+
+    def add(self, channel_id: int, line: str):
+        self._pending[channel_id].append(line)
+
+    def dispatch(self) -> int:
+        """Starts sending everything queued so far without waiting for it. Returns the number of messages started."""
+        pending, self._pending = self._pending, defaultdict(list)
+        # Only channels sent to in the last few seconds need to keep their bucket
+        for channel_id in [channel_id for channel_id, bucket in self._buckets.items() if bucket.is_full()]:
+            del self._buckets[channel_id]
+        started = 0
+        for channel_id, lines in pending.items():
+            for chunk in chunk_lines(lines):
+                task = asyncio.create_task(self._send(channel_id, chunk))
+                self._tasks.add(task)
+                task.add_done_callback(self._tasks.discard)
+                started += 1
+        return started
+
+    async def drain(self):
+        """Waits for every message that has been dispatched so far."""
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    async def _send(self, channel_id: int, description: str):
+        channel = self.bot.get_channel(channel_id)
+        if channel is None:
+            return
+        bucket = self._buckets.get(channel_id)
+        if bucket is None:
+            bucket = self._buckets[channel_id] = TokenBucket(CHANNEL_BURST, CHANNEL_RATE_PER_SECOND)
+        await bucket.acquire()
+        async with self._send_slots:
+            try:
+                await channel.send(embed=discord.Embed(title=self.title, description=description, color=self.color))
+            except discord.HTTPException as e:
+                print(f"ERROR: Could not send notification to channel {channel_id}: {e}")
@@ -0,0 +1,452 @@
+"""
+Runs the real cogs and Client.on_message without Discord. Interactions,
+channels, messages and users are small stand-ins that record every call the
+bot makes (with an optional simulated round-trip), and the database is a fresh
+SQLite file in a temporary directory.
+
+    python offline_harness.py --users 500 --actions 20000 --concurrency 200 --latency 0.05
+
+Commands are invoked through their callbacks, so app_commands checks such as
+has_permissions are skipped. Set --json to also write the report to a file.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from dataclasses import dataclass, field
+from types import SimpleNamespace
+
+import discord
+from discord import app_commands
+
+FAKE_GUILD_ID = 1
+_ids = itertools.count(10_000) # Snowflake stand-in shared by users, channels, messages and interactions
+
+@dataclass
+class ApiCall:
+    kind: str # e.g. "response.send_message", "followup.send", "channel.send"
+    at: float # time.perf_counter() when the call was made
+    content: str | None = None
+    embed: discord.Embed | None = None
+    view: discord.ui.View | None = None
+    ephemeral: bool = False
+
+class Recorder:
+    """Collects every ApiCall and simulates Discord's round-trip time."""
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.calls: list[ApiCall] = []
+        self.followup_messages: list[FakeMessage] = []
+
+    async def record(self, call: ApiCall) -> ApiCall:
+        self.calls.append(call)
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return call
+
+class FakeUser:
+    def __init__(self, user_id: int | None = None, name: str | None = None):
+        self.id = user_id if user_id is not None else next(_ids)
+        self.name = name or f"user{self.id}"
+        self.display_name = self.name
+        self.mention = f"<@{self.id}>"
+        self.bot = False
+        self.roles = []
+
+    def __str__(self):
+        return self.name
+
+    def __eq__(self, other):
+        return getattr(other, "id", None) == self.id
+
+    def __hash__(self):
+        return hash(self.id)
+
+class FakeMessage:
+    def __init__(self, recorder: Recorder, channel: "FakeChannel", author: FakeUser | None = None, content: str = "",
+                 embed: discord.Embed | None = None, view: discord.ui.View | None = None):
+        self._recorder = recorder
+        self._state = None # commands.Context reads it; nothing uses it without a command prefix
+        self.id = next(_ids)
+        self.channel = channel
+        self.guild = channel.guild
+        self.author = author
+        self.content = content
+        self.embed = embed
+        self.view = view
+
+    async def edit(self, *, content: str | None = discord.utils.MISSING, embed: discord.Embed | None = discord.utils.MISSING,
+                   view: discord.ui.View | None = discord.utils.MISSING):
+        # Like discord.py, anything not passed is left as it was
+        if content is not discord.utils.MISSING:
+            self.content = content
+        if embed is not discord.utils.MISSING:
+            self.embed = embed
+        if view is not discord.utils.MISSING:
+            self.view = view
+        await self._recorder.record(ApiCall("message.edit", time.perf_counter(), self.content, self.embed, self.view))
+
+    async def delete(self, *, delay: float | None = None):
+        await self._recorder.record(ApiCall("message.delete", time.perf_counter()))
+
+class FakeChannel:
+    def __init__(self, recorder: Recorder, guild: "FakeGuild", channel_id: int | None = None):
+        self._recorder = recorder
+        self.guild = guild
+        self.id = channel_id if channel_id is not None else next(_ids)
+        self.name = f"channel{self.id}"
+        self.mention = f"<#{self.id}>"
+
+    async def send(self, content: str | None = None, *, embed: discord.Embed | None = None,
+                   view: discord.ui.View | None = None, delete_after: float | None = None, **kwargs) -> FakeMessage:
+        await self._recorder.record(ApiCall("channel.send", time.perf_counter(), content, embed, view))
+        return FakeMessage(self._recorder, self, content=content or "", embed=embed, view=view)
+
+class FakeGuild:
+    def __init__(self, guild_id: int = FAKE_GUILD_ID):
+        self.id = guild_id
+        self.roles = []
+        self.text_channels = []
+
+    def get_member(self, user_id: int):
+        return None
+
+class FakeResponse:
+    def __init__(self, interaction: "FakeInteraction"):
+        self._interaction = interaction
+        self._done = False
+        self.modal: discord.ui.Modal | None = None # The last modal sent, so the driver can submit it
+
+    def is_done(self) -> bool:
+        return self._done
+
+    async def _respond(self, call: ApiCall):
+        if self._done:
+            raise discord.InteractionResponded(self._interaction)
+        self._done = True
+        await self._interaction.record(call)
+
+    async def send_message(self, content: str | None = None, *, embed: discord.Embed | None = None,
+                           view: discord.ui.View | None = None, ephemeral: bool = False, **kwargs):
+        await self._respond(ApiCall("response.send_message", time.perf_counter(), content, embed, view, ephemeral))
+
+    async def defer(self, *, ephemeral: bool = False, thinking: bool = False):
+        await self._respond(ApiCall("response.defer", time.perf_counter(), ephemeral=ephemeral))
+
+    async def edit_message(self, *, content: str | None = None, embed: discord.Embed | None = None,
+                           view: discord.ui.View | None = None, **kwargs):
+        await self._respond(ApiCall("response.edit_message", time.perf_counter(), content, embed, view))
+        message = self._interaction.message
+        if message is not None:
+            if content is not None:
+                message.content = content
+            if embed is not None:
+                message.embed = embed
+            message.view = view
+
+    async def send_modal(self, modal: discord.ui.Modal):
+        self.modal = modal
+        await self._respond(ApiCall("response.send_modal", time.perf_counter()))
+
+class FakeFollowup:
+    def __init__(self, interaction: "FakeInteraction"):
+        self._interaction = interaction
+
+    async def send(self, content: str | None = None, *, embed: discord.Embed | None = None,
+                   view: discord.ui.View | None = None, ephemeral: bool = False, wait: bool = False, **kwargs):
+        call = ApiCall("followup.send", time.perf_counter(), content, embed, view, ephemeral)
+        await self._interaction.record(call)
+        message = FakeMessage(self._interaction.recorder, self._interaction.channel, content=content or "", embed=embed, view=view)
+        self._interaction.followup_messages.append(message)
+        return message if wait else None
+
+class FakeInteraction:
+    """
+    Enough of discord.Interaction for the cogs. `calls` holds everything sent in
+    reply, in order, and `followup_messages` the messages followups created.
+    """
+
+    def __init__(self, client, recorder: Recorder, user: FakeUser, channel: FakeChannel,
+                 message: FakeMessage | None = None, **namespace):
+        self.id = next(_ids)
+        self.client = client
+        self.recorder = recorder
+        self.user = user
+        self.channel = channel
+        self.channel_id = channel.id
+        self.guild = channel.guild
+        self.guild_id = channel.guild.id
+        self.message = message
+        self.namespace = SimpleNamespace(**namespace)
+        self.response = FakeResponse(self)
+        self.followup = FakeFollowup(self)
+        self.calls: list[ApiCall] = []
+        self.followup_messages: list[FakeMessage] = []
+
+    async def record(self, call: ApiCall):
+        self.calls.append(call)
+        await self.recorder.record(call)
+
+def create_client_class():
+    import main # Imported late: main sets up discord.log in the working directory
+
+    class HarnessClient(main.Client):
+        """The real Client, minus the parts that need a gateway connection."""
+
+        def __init__(self, recorder: Recorder, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            self.recorder = recorder
+            self.guild = FakeGuild()
+            self.channels: dict[int, FakeChannel] = {}
+            self.bot_user = FakeUser(name="harness-bot")
+            self.bot_user.bot = True
+
+        @property
+        def user(self):
+            return self.bot_user # Normally filled in by the gateway's READY event
+
+        def channel(self, channel_id: int | None = None) -> FakeChannel:
+            channel = FakeChannel(self.recorder, self.guild, channel_id)
+            self.channels[channel.id] = channel
+            return channel
+
+        def get_channel(self, channel_id: int):
+            return self.channels.get(channel_id)
+
+        async def sync_command_tree(self, force: bool = False) -> int | None:
+            return len(self.tree.get_commands(guild=discord.Object(id=FAKE_GUILD_ID))) # Nothing to sync with
+
+        def app_command(self, qualified_name: str) -> app_commands.Command:
+            for cog in self.cogs.values():
+                for command in cog.walk_app_commands():
+                    if isinstance(command, app_commands.Command) and command.qualified_name == qualified_name:
+                        return command
+            raise KeyError(qualified_name)
+
+    return HarnessClient
+
+# --- Driver ---
+
+@dataclass
+class Invocation:
+    name: str
+    started: float
+    finished: float = 0.0
+    first_response: float | None = None
+    error: str | None = None
+
+@dataclass
+class Harness:
+    client: "discord.Client"
+    recorder: Recorder
+    users: list[FakeUser] = field(default_factory=list)
+    channels: list[FakeChannel] = field(default_factory=list)
+    building_type_ids: list[int] = field(default_factory=list)
+    invocations: list[Invocation] = field(default_factory=list)
+
+    def interaction(self, user: FakeUser, channel: FakeChannel | None = None, message: FakeMessage | None = None, **namespace) -> FakeInteraction:
+        return FakeInteraction(self.client, self.recorder, user, channel or random.choice(self.channels), message, **namespace)
+
+    async def invoke(self, qualified_name: str, user: FakeUser, channel: FakeChannel | None = None, **params) -> FakeInteraction:
+        """Runs a slash command's callback the way the command tree would."""
+        command = self.client.app_command(qualified_name)
+        interaction = self.interaction(user, channel)
+        await self.timed(qualified_name, interaction, command.callback(command.binding, interaction, **params))
+        return interaction
+
+    async def timed(self, name: str, interaction: FakeInteraction | None, coro):
+        invocation = Invocation(name, time.perf_counter())
+        try:
+            await coro
+        except Exception as e:
+            invocation.error = f"{type(e).__name__}: {e}"
+        invocation.finished = time.perf_counter()
+        if interaction is not None and interaction.calls:
+            invocation.first_response = interaction.calls[0].at
+        self.invocations.append(invocation)
+
+    # Scenarios, each one user action
+
+    async def chat_message(self, user: FakeUser):
+        channel = random.choice(self.channels)
+        message = FakeMessage(self.recorder, channel, author=user, content="hello there")
+        await self.timed("on_message", None, self.client.on_message(message))
+
+    async def autocomplete(self, name: str, cog_name: str, method: str, user: FakeUser, current: str, **namespace):
+        interaction = self.interaction(user, **namespace)
+        cog = self.client.get_cog(cog_name)
+        await self.timed(name, None, getattr(cog, method)(interaction, current))
+
+    async def harvest(self, user: FakeUser):
+        """/harvest roll, then the modifiers modal and both roll buttons, like a player clicking through."""
+        channel = random.choice(self.channels)
+        started = self.interaction(user, channel)
+        cog = self.client.get_cog("HarvestingCog")
+        command = self.client.app_command("harvest roll")
+        await self.timed("harvest roll", started, command.callback(cog, started, creature="beast", components="antler, bone, egg"))
+        # The session message gets its buttons once the session is written
+        message = next((message for message in started.followup_messages if message.view is not None), None)
+        if message is None:
+            return
+
+        view = message.view
+        click = self.interaction(user, channel, message)
+        await self.timed("harvest button: modifiers", click, view.enter_modifiers.callback(click))
+        modal = click.response.modal
+        if modal is None:
+            return
+        for text_input, value in zip((modal.proficiency_bonus, modal.int_modifier, modal.dex_modifier), ("2", "1", "3")):
+            text_input._refresh_state(click, {"value": value})
+        submit = self.interaction(user, channel, message)
+        await self.timed("harvest modal: submit", submit, modal.on_submit(submit))
+        for step, button in (("assessment", view.roll_assessment), ("carving", view.roll_carving)):
+            click = self.interaction(user, channel, message)
+            await self.timed(f"harvest button: {step}", click, button.callback(click))
+
+    def pick_action(self, user: FakeUser):
+        other = random.choice(self.users)
+        actions = [
+            (30, lambda: self.chat_message(user)),
+            (10, lambda: self.invoke("wallet view", user)),
+            (5, lambda: self.invoke("wallet add", user, amount=random.randint(1, 20), currency_type=random.choice(["cp", "sp", "gp"]))),
+            (3, lambda: self.invoke("wallet remove", user, amount=random.randint(1, 5), currency_type="sp")),
+            (2, lambda: self.invoke("wallet pay", user, recipient=other, amount=1, currency_type="cp")),
+            (3, lambda: self.invoke("wallet history", user)),
+            (10, lambda: self.autocomplete("building construct: autocomplete", "BuildingCog", "building_type_autocomplete", user, random.choice(["", "mi", "farm", "x"]))),
+            (3, lambda: self.invoke("building construct", user, building_type_id=str(random.choice(self.building_type_ids)))),
+            (8, lambda: self.invoke("building mybuildings", user)),
+            (5, lambda: self.autocomplete("character setactive: autocomplete", "CharacterCog", "user_character_autocomplete", user, "")),
+            (5, lambda: self.invoke("character viewactive", user)),
+            (3, lambda: self.invoke("harvest list", user, creature=random.choice(["beast", "dragon", "ooze"]))),
+            (3, lambda: self.invoke("harvest odds", user, creature="beast", components="antler, bone, egg", proficiency_bonus=2, int_modifier=1, dex_modifier=3)),
+            (2, lambda: self.harvest(user)),
+            (3, lambda: self.invoke("inventory view", user)),
+        ]
+        weights, factories = zip(*actions)
+        return random.choices(factories, weights)[0]()
+
+    async def populate(self, user_count: int, channel_count: int):
+        """Creates users with an active character each, plus a few building types, through the real commands."""
+        self.channels = [self.client.channel() for _ in range(channel_count)]
+        admin = FakeUser(name="admin")
+        for name, output, resource, frequency in [
+            ("Small Mine", "1d6", "gp", "test"), ("Farm", "2d4", "grain", "hourly"), ("Mint", "1d4", "sp", "daily"),
+        ]:
+            await self.invoke("building addtype", admin, name=name, resource_output=output, resource_type=resource, resource_frequency=frequency)
+        import building_catalog
+        self.building_type_ids = [building_type.id for building_type in building_catalog.catalog.search("", limit=25)]
+
+        self.users = [FakeUser() for _ in range(user_count)]
+        character_cog = self.client.get_cog("CharacterCog")
+        for user in self.users:
+            await self.invoke("character create", user, name=f"Hero {user.id}", class_name="Fighter")
+            choices = await character_cog.user_character_autocomplete(self.interaction(user), "")
+            await self.invoke("character setactive", user, character=choices[0].value)
+        self.invocations.clear() # Only measure the load phase
+
+    async def run_load(self, action_count: int, concurrency: int):
+        slots = asyncio.Semaphore(concurrency)
+
+        async def one_action():
+            async with slots:
+                await self.pick_action(random.choice(self.users))
+
+        await asyncio.gather(*(one_action() for _ in range(action_count)))
+
+def percentile(sorted_values: list[float], fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+def summarize(invocations: list[Invocation], wall_seconds: float) -> dict:
+    """Per-action counts, errors and latency percentiles in milliseconds."""
+    by_name: dict[str, list[Invocation]] = {}
+    for invocation in invocations:
+        by_name.setdefault(invocation.name, []).append(invocation)
+    actions = {}
+    for name, group in sorted(by_name.items()):
+        durations = sorted((invocation.finished - invocation.started) * 1000 for invocation in group)
+        first = sorted((invocation.first_response - invocation.started) * 1000 for invocation in group if invocation.first_response)
+        errors = [invocation.error for invocation in group if invocation.error]
+        actions[name] = {
+            "count": len(group),
+            "errors": len(errors),
+            "first_error": errors[0] if errors else None,
+            "p50_ms": percentile(durations, 0.50),
+            "p99_ms": percentile(durations, 0.99),
+            "max_ms": durations[-1],
+            "first_response_p50_ms": percentile(first, 0.50),
+            "first_response_p99_ms": percentile(first, 0.99),
+        }
+    return {
+        "invocations": len(invocations),
+        "wall_seconds": wall_seconds,
+        "invocations_per_second": len(invocations) / wall_seconds if wall_seconds else 0.0,
+        "actions": actions,
+    }
+
+def print_report(report: dict):
+    print(f"{report['invocations']} invocations in {report['wall_seconds']:.2f}s ({report['invocations_per_second']:.0f}/s)")
+    print(f"{'action':<36} {'count':>7} {'errors':>6} {'p50 ms':>8} {'p99 ms':>8} {'max ms':>8} {'1st p99':>8}")
+    for name, stats in report["actions"].items():
+        print(f"{name:<36} {stats['count']:>7} {stats['errors']:>6} {stats['p50_ms']:>8.2f} {stats['p99_ms']:>8.2f} "
+              f"{stats['max_ms']:>8.2f} {stats['first_response_p99_ms']:>8.2f}")
+        if stats["first_error"]:
+            print(f"    first error: {stats['first_error']}")
+
+async def create_harness(work_dir: str, latency: float = 0.0) -> Harness:
+    """Starts the real Client (migrations, catalog, registry, cogs) against a fresh database in work_dir."""
+    import config
+    import database as db_utils
+    if config.TEST_SERVER_ID is None:
+        config.TEST_SERVER_ID = str(FAKE_GUILD_ID) # The harvesting cog refuses to load without one
+    db_utils.DATABASE_NAME = os.path.join(work_dir, "database.db")
+
+    recorder = Recorder(latency)
+    intents = discord.Intents.default()
+    intents.message_content = True
+    intents.members = True
+    client = create_client_class()(recorder, command_prefix="!", intents=intents)
+    await client.setup_hook()
+    return Harness(client, recorder)
+
+async def main(args: argparse.Namespace):
+    random.seed(args.seed)
+    with tempfile.TemporaryDirectory(prefix="dnd-harness-") as work_dir:
+        cwd = os.getcwd()
+        os.chdir(work_dir) # main writes discord.log and the command tree hash to the working directory
+        try:
+            harness = await create_harness(work_dir, args.latency)
+            await harness.populate(args.users, args.channels)
+            started = time.perf_counter()
+            await harness.run_load(args.actions, args.concurrency)
+            report = summarize(harness.invocations, time.perf_counter() - started)
+            report["discord_calls"] = len(harness.recorder.calls)
+            report["settings"] = vars(args)
+            await harness.client.close()
+        finally:
+            os.chdir(cwd) # Relative paths such as --json are relative to where the harness was started
+
+    print_report(report)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as report_file:
+            json.dump(report, report_file, indent=2)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fire simulated Discord traffic at the real cogs, offline.")
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--channels", type=int, default=10)
+    parser.add_argument("--actions", type=int, default=5000, help="Total commands, clicks and chat messages to send.")
+    parser.add_argument("--concurrency", type=int, default=100, help="Actions in flight at once.")
+    parser.add_argument("--latency", type=float, default=0.0, help="Simulated seconds per Discord API call.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="Also write the report to this file.")
+    args = parser.parse_args()
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__))) # Keep imports working after the chdir
+    asyncio.run(main(args))
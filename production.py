@@ -0,0 +1,262 @@
+import asyncio
+import heapq
+import sqlite3
+import time
+from collections import defaultdict
+from dataclasses import dataclass, field
+
+import building_catalog
+import database as db_utils
+import dice
+import inventory
+import wallet
+from building_catalog import BuildingCatalog
+from constants import CURRENCY_UNITS
+from dice import DiceExpression
+
+@dataclass
+class ProductionNotice:
+    """One building's output, to be announced after the tick has committed."""
+    channel_id: int
+    character_id: int
+    character_name: str
+    building_id: int
+    building_name: str
+    amount: int
+    resource_type: str # Lowercased, e.g. "gp" or "iron_ore"
+
+    @property
+    def is_currency(self) -> bool:
+        return self.resource_type in CURRENCY_UNITS
+
+@dataclass
+class TickResult:
+    buildings_scanned: int = 0
+    buildings_collected: int = 0
+    wallet_rows_updated: int = 0
+    inventory_rows_updated: int = 0
+    building_rows_updated: int = 0
+    duration_seconds: float = 0.0
+    notices: list[ProductionNotice] = field(default_factory=list)
+    next_due_times: list[int] = field(default_factory=list) # New due times of the buildings that were updated
+    has_more: bool = False # The batch limit was hit, more buildings may still be due
+    failed: bool = False # A batch raised and was rolled back, its buildings are still due
+
+    def merge(self, other: "TickResult"):
+        """Adds another batch's numbers and notices to this result."""
+        self.buildings_scanned += other.buildings_scanned
+        self.buildings_collected += other.buildings_collected
+        self.wallet_rows_updated += other.wallet_rows_updated
+        self.inventory_rows_updated += other.inventory_rows_updated
+        self.building_rows_updated += other.building_rows_updated
+        self.duration_seconds += other.duration_seconds
+        self.notices.extend(other.notices)
+        self.next_due_times.extend(other.next_due_times)
+
+def run_production_tick(conn: sqlite3.Connection, current_time: int, sampler: dice.DiceSampler | None = None,
+                        limit: int | None = None, catalog: BuildingCatalog | None = None) -> TickResult:
+    """
+    Collects everything produced up to current_time by buildings that are due.
+    Meant to run through db_utils.run_write: payouts are summed per character
+    and currency in memory, then all wallet increments, inventory additions and
+    last_collection_time updates are written with executemany inside that
+    single transaction.
+    Pass a seeded DiceSampler to make the rolled amounts reproducible, and a
+    limit to only handle the `limit` most overdue buildings (see has_more).
+    Building type details come from the in-memory catalog rather than a JOIN.
+    """
+    if catalog is None:
+        catalog = building_catalog.catalog
+    started = time.perf_counter()
+    result = TickResult()
+
+    all_character_buildings = conn.execute("""
+        SELECT cb.id, cb.character_id, c.name AS character_name, cb.channel_id, cb.last_collection_time, cb.custom_name,
+               cb.building_type_id
+        FROM character_buildings cb
+        JOIN characters c ON cb.character_id = c.id
+        WHERE cb.next_due_time <= ?
+        ORDER BY cb.next_due_time
+        LIMIT ?
+    """, (current_time, -1 if limit is None else limit)).fetchall() # Uses idx_character_buildings_next_due_time, so only due rows are read
+    result.buildings_scanned = len(all_character_buildings)
+    result.has_more = limit is not None and len(all_character_buildings) == limit
+
+    wallet_increments: dict[tuple[int, str], int] = defaultdict(int) # (character_id, currency) -> amount
+    inventory_additions: list[inventory.InventoryAddition] = [] # Everything that isn't currency
+    collection_updates: list[tuple[int, int, int]] = [] # (new_last_collection_time, new_next_due_time, building_id)
+    retry_updates: list[tuple[int | None, int]] = [] # (next_due_time, building_id) for rows we can't process yet
+
+    # First work out how many collections each building is owed...
+    due_buildings = []
+    due_rolls: list[tuple[DiceExpression, int]] = []
+    for building_data in all_character_buildings:
+        building_instance_id = building_data["id"]
+        building_type = catalog.get(building_data["building_type_id"])
+
+        if building_type is None or not building_type.interval:
+            frequency = building_type.resource_frequency if building_type else None
+            print(f"WARNING: Invalid frequency '{frequency}' for building instance ID {building_instance_id}. Skipping.")
+            retry_updates.append((None, building_instance_id)) # Never due until the building type is fixed
+            continue
+        interval = building_type.interval
+
+        time_difference = current_time - building_data["last_collection_time"]
+        if time_difference < interval:
+            # next_due_time was out of step with last_collection_time, resync it
+            retry_updates.append((building_data["last_collection_time"] + interval, building_instance_id))
+            continue
+
+        if building_type.dice is None:
+            print(f"WARNING: Invalid dice format '{building_type.resource_output}' for building instance ID {building_instance_id}. Skipping.")
+            retry_updates.append((current_time + interval, building_instance_id)) # Try again next interval
+            continue
+
+        num_collections_to_process = int(time_difference // interval)
+        due_buildings.append((building_data, building_type, num_collections_to_process))
+        due_rolls.append((building_type.dice, num_collections_to_process))
+
+    # ...then roll all of them in one batch
+    totals = (sampler or dice.default_sampler).roll_many(due_rolls)
+
+    for (building_data, building_type, num_collections_to_process), total_resources_gained_amount in zip(due_buildings, totals):
+        building_instance_id = building_data["id"]
+        new_last_collection_time = building_data["last_collection_time"] + num_collections_to_process * building_type.interval
+        collection_updates.append((new_last_collection_time, new_last_collection_time + building_type.interval, building_instance_id))
+        if total_resources_gained_amount <= 0:
+            continue
+
+        resource_type_key = building_type.resource_type # e.g., "gp", "sp"
+        if resource_type_key in CURRENCY_UNITS:
+            wallet_increments[(building_data["character_id"], resource_type_key)] += total_resources_gained_amount
+        else:
+            inventory_additions.append((building_data["character_id"], resource_type_key, total_resources_gained_amount))
+
+        result.notices.append(ProductionNotice(
+            channel_id=building_data["channel_id"],
+            character_id=building_data["character_id"],
+            character_name=building_data["character_name"],
+            building_id=building_instance_id,
+            building_name=building_data["custom_name"] if building_data["custom_name"] else building_type.name,
+            amount=total_resources_gained_amount,
+            resource_type=resource_type_key,
+        ))
+
+    # One statement per currency column, each run over every character that earned it.
+    # Payouts are all credits to characters we just read, so this can't be refused.
+    wallet_changes = [(character_id, currency, amount) for (character_id, currency), amount in wallet_increments.items()]
+    if wallet.apply_changes(conn, wallet_changes, wallet.REASON_PRODUCTION, current_time):
+        result.wallet_rows_updated = len(wallet_increments)
+    else:
+        print(f"WARNING: Production payouts for {len(wallet_increments)} wallets were refused, a character may have been deleted mid-tick.")
+    # Non-currency output goes to inventories in one batched upsert
+    result.inventory_rows_updated = inventory.add_items(conn, inventory_additions)
+    if collection_updates:
+        cursor = conn.executemany(
+            "UPDATE character_buildings SET last_collection_time = ?, next_due_time = ? WHERE id = ?",
+            collection_updates
+        )
+        result.building_rows_updated = cursor.rowcount
+    if retry_updates:
+        conn.executemany("UPDATE character_buildings SET next_due_time = ? WHERE id = ?", retry_updates)
+    result.next_due_times = [next_due for _, next_due, _ in collection_updates]
+    result.next_due_times += [next_due for next_due, _ in retry_updates if next_due is not None]
+
+    result.buildings_collected = len(collection_updates)
+    result.duration_seconds = time.perf_counter() - started
+    return result
+
+
+class ProductionScheduler:
+    """
+    Runs production exactly when the next building is due. Upcoming due times
+    are kept in a min-heap, and the loop sleeps until the earliest one, so each
+    tick only touches the buildings that are actually due.
+    """
+
+    # Upper bound on a single sleep, so a due time that never made it into the
+    # heap (e.g. a row edited by hand) is still picked up eventually.
+    MAX_SLEEP_SECONDS = 3600
+    # Delay before retrying a tick that failed, so a database that keeps
+    # failing isn't hammered in a tight loop.
+    RETRY_SECONDS = 60
+
+    def __init__(self, collect):
+        # collect(): coroutine that runs one production tick and returns its TickResult (failed set if a batch raised)
+        self._collect = collect
+        self._heap: list[int] = []
+        self._scheduled: set[int] = set() # Due times already in the heap, many buildings share the same second
+        self._wakeup = asyncio.Event()
+        self._task: asyncio.Task | None = None
+
+    async def load(self):
+        """Fills the heap with every distinct due time in the database."""
+        rows = await db_utils.fetch_all(
+            "SELECT DISTINCT next_due_time FROM character_buildings WHERE next_due_time IS NOT NULL"
+        )
+        self._scheduled = {row[0] for row in rows}
+        self._heap = list(self._scheduled)
+        heapq.heapify(self._heap)
+        print(f"DEBUG: Production scheduler loaded {len(self._heap)} distinct due times.")
+
+    def schedule(self, due_time: int):
+        """Adds a due time. Wakes the loop early if it is sooner than what it's sleeping for."""
+        if due_time in self._scheduled:
+            return
+        self._scheduled.add(due_time)
+        wake_early = not self._heap or due_time < self._heap[0]
+        heapq.heappush(self._heap, due_time)
+        if wake_early:
+            self._wakeup.set()
+
+    @property
+    def next_due_time(self) -> int | None:
+        return self._heap[0] if self._heap else None
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def is_running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    async def _run(self):
+        while True:
+            delay = self.MAX_SLEEP_SECONDS
+            if self._heap:
+                delay = min(max(self._heap[0] - time.time(), 0), self.MAX_SLEEP_SECONDS)
+            woken_early = False
+            if delay > 0:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+                    woken_early = True
+                except asyncio.TimeoutError:
+                    pass
+            self._wakeup.clear()
+
+            now = int(time.time())
+            if woken_early and self._heap and self._heap[0] > now:
+                continue # schedule() added an earlier time; go back to sleep until it
+
+            while self._heap and self._heap[0] <= now:
+                self._scheduled.discard(heapq.heappop(self._heap))
+
+            try:
+                result = await self._collect()
+            except Exception as e:
+                print(f"ERROR: Production tick raised: {e}")
+                result = None
+            if result is not None:
+                for due_time in result.next_due_times:
+                    self.schedule(due_time)
+            if result is None or result.failed:
+                # The due times just popped belong to buildings that weren't collected.
+                # A tick collects everything due by then, so one retry time covers them all.
+                retry_at = int(time.time()) + self.RETRY_SECONDS
+                print(f"WARNING: Production tick failed, retrying in {self.RETRY_SECONDS}s.")
+                self.schedule(retry_at)
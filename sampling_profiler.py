@@ -0,0 +1,94 @@
+"""
+On-demand sampling profiler, run with /admin profile.
+
+A background thread looks at the event loop thread's stack every few
+milliseconds (sys._current_frames) and counts identical stacks. The result is
+written in the collapsed-stack format flamegraph.pl, speedscope and inferno
+read: one line per distinct stack, frames root-first separated by ';', then
+the number of samples. An idle bot shows up as time in selectors.py:select.
+
+The sampler needs the GIL to read a stack, and the event loop would otherwise
+only hand it over when it blocks in select (or every 5ms), which would make
+short bursts of work invisible. While a profile runs the interpreter's switch
+interval is lowered so the GIL changes hands well within a sampling interval.
+"""
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+PROFILE_DIR = "profiles"
+DEFAULT_INTERVAL_SECONDS = 0.005
+MAX_STACK_DEPTH = 128
+SWITCH_INTERVAL_SECONDS = 0.0002 # sys.setswitchinterval while sampling, the default is 0.005
+
+def frame_label(code) -> str:
+    """'package/module.py:function', short enough to read and still unambiguous across packages."""
+    path = code.co_filename.replace("\\", "/").split("/")
+    return f"{'/'.join(path[-2:])}:{code.co_name}"
+
+def collapse_stack(frame) -> list[str]:
+    """The frames of a stack, outermost first."""
+    labels = []
+    while frame is not None and len(labels) < MAX_STACK_DEPTH:
+        labels.append(frame_label(frame.f_code))
+        frame = frame.f_back
+    labels.reverse()
+    return labels
+
+class SamplingProfiler:
+    """Samples the stacks of `thread_ids` (all threads if None) until stopped or `seconds` have passed."""
+
+    _running = threading.Lock() # One profile at a time, samples from two would skew each other
+
+    def __init__(self, thread_ids: set[int] | None = None, interval: float = DEFAULT_INTERVAL_SECONDS):
+        self.thread_ids = thread_ids
+        self.interval = interval
+        self.samples = 0
+        self.stacks: Counter[str] = Counter()
+
+    @classmethod
+    def is_running(cls) -> bool:
+        return cls._running.locked()
+
+    def run(self, seconds: float) -> Counter[str]:
+        """Blocks while sampling, so call it from a worker thread (e.g. asyncio.to_thread)."""
+        if not self._running.acquire(blocking=False):
+            raise RuntimeError("A profile is already running.")
+        switch_interval = sys.getswitchinterval()
+        sys.setswitchinterval(min(switch_interval, SWITCH_INTERVAL_SECONDS))
+        try:
+            me = threading.get_ident()
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            deadline = time.perf_counter() + seconds
+            while time.perf_counter() < deadline:
+                for thread_id, frame in sys._current_frames().items():
+                    if thread_id == me or (self.thread_ids is not None and thread_id not in self.thread_ids):
+                        continue
+                    stack = collapse_stack(frame)
+                    if self.thread_ids is None or len(self.thread_ids) > 1: # Tell the threads apart
+                        stack.insert(0, names.get(thread_id, str(thread_id)))
+                    self.stacks[";".join(stack)] += 1
+                self.samples += 1
+                time.sleep(self.interval)
+        finally:
+            sys.setswitchinterval(switch_interval)
+            self._running.release()
+        return self.stacks
+
+    def write_collapsed(self, path: str):
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+    def top_frames(self, limit: int = 10) -> list[tuple[str, int]]:
+        """Innermost frames by samples (self time)."""
+        leaves: Counter[str] = Counter()
+        for stack, count in self.stacks.items():
+            leaves[stack.rsplit(";", 1)[-1]] += count
+        return leaves.most_common(limit)
+
+def profile_path(directory: str = PROFILE_DIR) -> str:
+    os.makedirs(directory, exist_ok=True)
+    return os.path.join(directory, f"profile-{time.strftime('%Y%m%d-%H%M%S')}.collapsed")
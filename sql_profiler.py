@@ -0,0 +1,230 @@
+"""
+Opt-in SQL profiling (set SQL_PROFILE=1). Once enabled, every connection the
+database module opens is a ProfilingConnection:
+
+- SQLite's trace callback counts every statement that runs, including each row
+  of an executemany and the BEGIN/COMMIT sqlite3 issues on its own.
+- Time spent executing a statement and fetching its rows is added up per
+  normalized SQL text (literals replaced with ?).
+- The first time a statement is seen its EXPLAIN QUERY PLAN is captured, and a
+  plan that scans a whole table is reported once.
+- Any single run slower than SQL_SLOW_MS is logged along with its plan.
+
+See /admin sqlprofile for the aggregated numbers.
+"""
+import itertools
+import re
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass, field
+
+import database as db_utils
+
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r"(?<![\w.)])-?\d+(?:\.\d+)?(?:e[-+]?\d+)?\b", re.IGNORECASE)
+_NULL_LITERAL = re.compile(r"\bNULL\b", re.IGNORECASE) # The trace callback shows bound None as NULL
+_PLACEHOLDER_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_PLAN_SCAN = re.compile(r"^SCAN (?:TABLE )?(\w+)(.*)$") # "SCAN TABLE x" before SQLite 3.36, "SCAN x" after
+_PLANNABLE = ("SELECT", "INSERT", "UPDATE", "DELETE", "REPLACE", "WITH")
+
+def normalize_sql(sql: str) -> str:
+    """One line, literals replaced with ?, and IN lists collapsed, so the same query always has the same key."""
+    sql = _STRING_LITERAL.sub("?", sql)
+    sql = _NUMBER_LITERAL.sub("?", sql)
+    sql = _NULL_LITERAL.sub("?", sql)
+    sql = " ".join(sql.split())
+    return _PLACEHOLDER_LIST.sub("(?, ...)", sql)
+
+def full_table_scans(plan: list[str], tables: set[str]) -> list[str]:
+    """Tables a query plan reads in full, i.e. SCAN without an index. Subqueries and CTEs (not in `tables`) are ignored."""
+    scanned = []
+    for detail in plan:
+        match = _PLAN_SCAN.match(detail.strip())
+        if match and "INDEX" not in match.group(2) and match.group(1) in tables:
+            scanned.append(match.group(1))
+    return scanned
+
+@dataclass
+class StatementStats:
+    sql: str # Normalized
+    executions: int = 0 # From the trace callback
+    total_seconds: float = 0.0 # Executing plus fetching
+    max_seconds: float = 0.0 # Slowest single run
+    slow_runs: int = 0
+    plan: list[str] | None = None
+    full_scans: list[str] = field(default_factory=list)
+
+class SqlProfiler:
+    def __init__(self, slow_ms: float):
+        self.slow_seconds = slow_ms / 1000
+        self._lock = threading.Lock()
+        self._stats: dict[str, StatementStats] = {}
+        self._local = threading.local() # Set while capturing a plan, so EXPLAIN isn't counted
+
+    def _get(self, key: str) -> StatementStats:
+        stats = self._stats.get(key)
+        if stats is None:
+            stats = self._stats.setdefault(key, StatementStats(key))
+        return stats
+
+    def attach(self, conn: sqlite3.Connection):
+        """Connection hook, see database.CONNECTION_HOOKS."""
+        conn.set_trace_callback(self._on_statement)
+
+    def _on_statement(self, sql: str):
+        if getattr(self._local, "explaining", False):
+            return
+        key = normalize_sql(sql)
+        with self._lock:
+            self._get(key).executions += 1
+
+    def add_time(self, key: str, seconds: float, run_seconds: float) -> bool:
+        """Adds time to a statement. run_seconds is the run's total so far. Returns True if the run just became slow."""
+        with self._lock:
+            stats = self._get(key)
+            stats.total_seconds += seconds
+            stats.max_seconds = max(stats.max_seconds, run_seconds)
+            became_slow = run_seconds >= self.slow_seconds and run_seconds - seconds < self.slow_seconds
+            if became_slow:
+                stats.slow_runs += 1
+            return became_slow
+
+    def needs_plan(self, key: str) -> bool:
+        with self._lock:
+            return self._get(key).plan is None
+
+    def capture_plan(self, conn: sqlite3.Connection, key: str, sql: str, parameters):
+        """Stores the statement's EXPLAIN QUERY PLAN, and warns once if it scans a whole table."""
+        plan, tables = [], set()
+        if sql.lstrip().upper().startswith(_PLANNABLE):
+            self._local.explaining = True
+            try:
+                cursor = sqlite3.Connection.cursor(conn, sqlite3.Cursor) # A plain cursor, so this isn't profiled
+                plan = [row[3] for row in cursor.execute(f"EXPLAIN QUERY PLAN {sql}", parameters).fetchall()]
+                tables = {row[0] for row in cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+            except sqlite3.Error as e:
+                plan = [f"(plan unavailable: {e})"]
+            finally:
+                self._local.explaining = False
+        scans = full_table_scans(plan, tables)
+        with self._lock:
+            stats = self._get(key)
+            if stats.plan is not None:
+                return # Another thread got there first
+            stats.plan = plan
+            stats.full_scans = scans
+        if scans:
+            print(f"WARNING: Full table scan of {', '.join(scans)}: {key}")
+
+    def log_slow(self, key: str, run_seconds: float):
+        with self._lock:
+            plan = self._get(key).plan or []
+        print(f"WARNING: Slow query ({run_seconds * 1000:.1f}ms): {key}")
+        for detail in plan:
+            print(f"WARNING:   plan: {detail}")
+
+    def statements(self) -> list[StatementStats]:
+        """Every statement seen, most total time first."""
+        with self._lock:
+            return sorted(
+                (StatementStats(s.sql, s.executions, s.total_seconds, s.max_seconds, s.slow_runs, list(s.plan or []), list(s.full_scans))
+                 for s in self._stats.values()),
+                key=lambda s: s.total_seconds, reverse=True
+            )
+
+    def format_report(self, limit: int = 20) -> str:
+        lines = [f"{'total s':>9} {'max ms':>9} {'runs':>8} {'slow':>5}  statement"]
+        for stats in self.statements()[:limit]:
+            flag = f" [SCAN {', '.join(stats.full_scans)}]" if stats.full_scans else ""
+            lines.append(f"{stats.total_seconds:>9.3f} {stats.max_seconds * 1000:>9.1f} {stats.executions:>8} {stats.slow_runs:>5}  {stats.sql[:160]}{flag}")
+        return "\n".join(lines)
+
+class ProfilingCursor(sqlite3.Cursor):
+    """Times execute/executemany and every fetch afterwards, against the statement that was executed."""
+    _profile_key: str | None = None
+    _profile_run_seconds: float = 0.0
+
+    def _track(self, seconds: float):
+        if self._profile_key is None or profiler is None:
+            return
+        self._profile_run_seconds += seconds
+        if profiler.add_time(self._profile_key, seconds, self._profile_run_seconds):
+            profiler.log_slow(self._profile_key, self._profile_run_seconds)
+
+    def _start(self, sql: str, parameters):
+        self._profile_key = normalize_sql(sql)
+        self._profile_run_seconds = 0.0
+        if profiler is not None and profiler.needs_plan(self._profile_key):
+            profiler.capture_plan(self.connection, self._profile_key, sql, parameters)
+
+    def execute(self, sql: str, parameters=()):
+        started = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            seconds = time.perf_counter() - started
+            self._start(sql, parameters) # Plans are captured after the statement, it may create what it plans against
+            self._track(seconds)
+
+    def executemany(self, sql: str, seq_of_parameters):
+        rows = iter(seq_of_parameters)
+        first = next(rows, None)
+        started = time.perf_counter()
+        try:
+            return super().executemany(sql, itertools.chain([first], rows) if first is not None else ())
+        finally:
+            seconds = time.perf_counter() - started
+            self._start(sql, first if first is not None else ())
+            self._track(seconds)
+
+    def fetchone(self):
+        started = time.perf_counter()
+        try:
+            return super().fetchone()
+        finally:
+            self._track(time.perf_counter() - started)
+
+    def fetchmany(self, size: int | None = None):
+        started = time.perf_counter()
+        try:
+            return super().fetchmany(self.arraysize if size is None else size)
+        finally:
+            self._track(time.perf_counter() - started)
+
+    def fetchall(self):
+        started = time.perf_counter()
+        try:
+            return super().fetchall()
+        finally:
+            self._track(time.perf_counter() - started)
+
+    def __next__(self):
+        started = time.perf_counter()
+        try:
+            return super().__next__()
+        finally:
+            self._track(time.perf_counter() - started)
+
+class ProfilingConnection(sqlite3.Connection):
+    def cursor(self, factory=ProfilingCursor):
+        return super().cursor(factory)
+
+    # sqlite3.Connection.execute would skip ProfilingCursor.execute, so go through cursor()
+    def execute(self, sql: str, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql: str, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+profiler: SqlProfiler | None = None # Set by enable()
+
+def enable(slow_ms: float) -> SqlProfiler:
+    """Profiles every connection opened from now on. Call before the first query."""
+    global profiler
+    if profiler is None:
+        profiler = SqlProfiler(slow_ms)
+        db_utils.CONNECTION_CLASS = ProfilingConnection
+        db_utils.CONNECTION_HOOKS.append(profiler.attach)
+        print(f"DEBUG: SQL profiling enabled, logging statements slower than {slow_ms:g}ms.")
+    return profiler
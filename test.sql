@@ -2,11 +2,16 @@ SELECT * FROM members;
 
 SELECT * FROM characters;
 
-SELECT * FROM buildings;
+SELECT * FROM building_types;
 
-SELECT * FROM active_rolls;
+SELECT * FROM character_buildings;
+
+-- Applied schema migrations (see migrations.py):
+SELECT * FROM schema_version;
 
 -- To see the schema (structure) of a specific table, you can use:
 -- PRAGMA table_info(table_name);
 -- For example:
--- PRAGMA table_info(members);
\ No newline at end of file
+-- PRAGMA table_info(members);
+-- And its indexes:
+-- PRAGMA index_list(members);
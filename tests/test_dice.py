@@ -0,0 +1,54 @@
+import pytest
+
+import dice
+from dice import DiceExpression, DiceSampler, parse_dice
+
+def test_parse_dice():
+    assert parse_dice("2d6") == DiceExpression(2, 6)
+    assert parse_dice(" 10D4 ") == DiceExpression(10, 4)
+    with pytest.raises(ValueError):
+        parse_dice("d6")
+    with pytest.raises(ValueError):
+        parse_dice("2d0")
+
+def test_seeded_sampler_is_reproducible():
+    rolls = [(DiceExpression(2, 6), 1), (DiceExpression(1, 20), 3), (DiceExpression(3, 8), 500)]
+    first = DiceSampler(seed=1234).roll_many(rolls)
+    assert DiceSampler(seed=1234).roll_many(rolls) == first
+
+    sampler = DiceSampler(seed=1234)
+    sampler.roll_many(rolls)
+    sampler.seed(1234)
+    assert sampler.roll_many(rolls) == first
+
+def test_exact_rolls_stay_in_range():
+    sampler = DiceSampler(seed=1)
+    d6 = DiceExpression(1, 6)
+    totals = {sampler.roll_total(d6) for _ in range(1000)}
+    assert totals == {1, 2, 3, 4, 5, 6}
+    assert sampler.roll_total(DiceExpression(4, 1), repeats=3) == 12
+    assert sampler.roll_total(d6, repeats=0) == 0
+
+@pytest.mark.parametrize("dice_expression, repeats", [
+    (DiceExpression(1, 6), dice.EXACT_DICE_LIMIT + 1),
+    (DiceExpression(2, 20), 1000),
+    (DiceExpression(1, 2), 5000),
+    (DiceExpression(300, 100), 1),
+])
+def test_normal_approximation_stays_within_bounds(dice_expression, repeats):
+    sampler = DiceSampler(seed=42)
+    combined = DiceExpression(dice_expression.count * repeats, dice_expression.sides)
+    totals = [sampler.roll_total(dice_expression, repeats) for _ in range(2000)]
+    assert all(combined.minimum <= total <= combined.maximum for total in totals)
+    # Six standard deviations of the sample mean is far outside anything a correct sampler produces
+    mean = sum(totals) / len(totals)
+    assert abs(mean - combined.mean) < 6 * (combined.variance / len(totals)) ** 0.5
+
+def test_normal_approximation_is_clamped():
+    # However far off the sample is, the total is clamped to what the dice can roll
+    class ExtremeRandom:
+        def gauss(self, mean, sigma):
+            return mean + 1e9
+    sampler = DiceSampler(seed=0)
+    sampler._rng = ExtremeRandom()
+    assert sampler.roll_total(DiceExpression(1, 6), repeats=500) == 3000
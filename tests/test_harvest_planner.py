@@ -0,0 +1,88 @@
+import itertools
+import random
+from fractions import Fraction
+from types import MappingProxyType
+
+import pytest
+
+import harvest_planner
+from harvest_index import HARVEST_INDEX, CreatureHarvest
+from harvest_planner import OBJECTIVE_COUNT, OBJECTIVE_VALUE, chance_to_reach, plan_harvest
+
+def make_creature(component_dcs: dict[str, int]) -> CreatureHarvest:
+    return CreatureHarvest(
+        creature="test", skill=None, component_dcs=MappingProxyType(component_dcs),
+        components=tuple(sorted(component_dcs)), list_message="",
+    )
+
+def score(creature: CreatureHarvest, components, objective: str) -> tuple[int, int]:
+    count = len(components)
+    value = sum(creature.component_dcs[component] for component in components)
+    return (count, value) if objective == OBJECTIVE_COUNT else (value, count)
+
+def brute_force_best(creature: CreatureHarvest, requested: list[str], roll: int, objective: str) -> tuple[int, int]:
+    known = [component for component in requested if component in creature.component_dcs]
+    best = (0, 0)
+    for size in range(len(known) + 1):
+        for subset in itertools.combinations(known, size):
+            if sum(creature.component_dcs[component] for component in subset) <= roll:
+                best = max(best, score(creature, subset, objective))
+    return best
+
+def is_subsequence(selected, requested) -> bool:
+    remaining = iter(requested)
+    return all(component in remaining for component in selected)
+
+@pytest.mark.parametrize("objective", [OBJECTIVE_COUNT, OBJECTIVE_VALUE])
+def test_plan_matches_brute_force(objective):
+    rng = random.Random(7)
+    for _ in range(300):
+        component_dcs = {f"part{i}": rng.choice([5, 8, 10, 12, 15, 20, 25]) for i in range(rng.randint(1, 6))}
+        creature = make_creature(component_dcs)
+        # Repeats and unknown components are allowed in a request
+        requested = [rng.choice([*component_dcs, "unknown"]) for _ in range(rng.randint(0, 8))]
+        roll = rng.randint(0, 80)
+
+        plan = plan_harvest(creature, requested, roll, objective)
+
+        assert plan.total_dc <= roll
+        assert plan.remaining_roll == roll - plan.total_dc
+        assert plan.total_dc == sum(component_dcs[component] for component in plan.components)
+        assert is_subsequence(plan.components, requested)
+        assert score(creature, plan.components, objective) == brute_force_best(creature, requested, roll, objective)
+
+def test_plan_prefers_objective():
+    creature = make_creature({"scale": 4, "tooth": 4, "heart": 10})
+    requested = ["heart", "scale", "tooth"]
+    assert plan_harvest(creature, requested, 10, OBJECTIVE_COUNT).components == ("scale", "tooth")
+    assert plan_harvest(creature, requested, 10, OBJECTIVE_VALUE).components == ("heart",)
+    # Equal value, so the tie-breaker (more components) decides
+    assert plan_harvest(creature, requested, 8, OBJECTIVE_VALUE).components == ("scale", "tooth")
+    assert plan_harvest(creature, requested, 18, OBJECTIVE_VALUE).components == ("heart", "scale", "tooth")
+
+def test_plan_with_real_creature():
+    creature = HARVEST_INDEX[next(iter(HARVEST_INDEX))]
+    requested = list(creature.components)
+    plan = plan_harvest(creature, requested, 10 ** 6)
+    assert plan.components == tuple(requested)
+
+def test_plan_rejects_unknown_objective():
+    with pytest.raises(ValueError):
+        plan_harvest(make_creature({"bone": 5}), ["bone"], 10, "cheapest")
+
+def brute_force_chance(modifier_sum: int, target: int) -> Fraction:
+    sides = range(1, harvest_planner.D20_SIDES + 1)
+    hits = sum(1 for first in sides for second in sides if first + second + modifier_sum >= target)
+    return Fraction(hits, harvest_planner.D20_SIDES ** 2)
+
+@pytest.mark.parametrize("modifier_sum", [-3, 0, 4, 11])
+def test_chance_to_reach_is_exact(modifier_sum):
+    for target in range(-10, 60):
+        assert chance_to_reach(modifier_sum, target) == brute_force_chance(modifier_sum, target)
+
+def test_chance_to_reach_known_values():
+    assert chance_to_reach(0, 2) == 1
+    assert chance_to_reach(0, 21) == Fraction(210, 400)
+    assert chance_to_reach(0, 40) == Fraction(1, 400)
+    assert chance_to_reach(0, 41) == 0
+    assert chance_to_reach(5, 45) == Fraction(1, 400)
@@ -0,0 +1,143 @@
+import random
+import sqlite3
+
+import pytest
+
+import migrations
+import wallet
+from constants import CURRENCY_ORDER
+
+@pytest.fixture
+def conn():
+    conn = sqlite3.connect(":memory:")
+    conn.row_factory = sqlite3.Row
+    migrations.run_migrations(conn)
+    yield conn
+    conn.close()
+
+def add_character(conn: sqlite3.Connection, name: str = "Alice", **balances: int) -> int:
+    columns = ["name", *balances]
+    cursor = conn.execute(
+        f"INSERT INTO characters ({', '.join(columns)}) VALUES ({', '.join('?' for _ in columns)})",
+        (name, *balances.values())
+    )
+    conn.commit()
+    return cursor.lastrowid
+
+def balances(conn: sqlite3.Connection, character_id: int) -> dict[str, int]:
+    return wallet._read_balances(conn, character_id)
+
+def coins(**balances: int) -> dict[str, int]:
+    return {currency: balances.get(currency, 0) for currency in CURRENCY_ORDER}
+
+def ledger_count(conn: sqlite3.Connection) -> int:
+    return conn.execute("SELECT COUNT(*) FROM wallet_ledger").fetchone()[0]
+
+def test_make_change_exact():
+    assert wallet.make_change(coins(gp=5, sp=3), "gp", 3) == coins(gp=2, sp=3)
+
+def test_make_change_uses_smaller_coins_before_breaking_larger_ones():
+    assert wallet.make_change(coins(pp=1, sp=20), "gp", 1) == coins(pp=1, sp=10)
+
+def test_make_change_borrows_from_higher_coins():
+    # 1pp 5sp (1050cp) - 1gp = 950cp, paid with the 5sp and the pp, change as 9gp 1ep
+    assert wallet.make_change(coins(pp=1, sp=5), "gp", 1) == coins(gp=9, ep=1)
+    assert wallet.make_change(coins(gp=1), "cp", 1) == coins(ep=1, sp=4, cp=9) # 99cp of change as the fewest coins
+
+def test_make_change_insufficient():
+    assert wallet.make_change(coins(gp=1, sp=9), "gp", 2) is None
+
+def test_make_change_keeps_value():
+    rng = random.Random(3)
+    for _ in range(500):
+        before = {currency: rng.randint(0, 12) for currency in CURRENCY_ORDER}
+        currency = rng.choice(CURRENCY_ORDER)
+        amount = rng.randint(1, 15)
+        after = wallet.make_change(before, currency, amount)
+        cost = amount * wallet.CURRENCY_UNITS[currency]["value_in_cp"]
+        if wallet.wallet_value_in_cp(before) < cost:
+            assert after is None
+            continue
+        assert all(count >= 0 for count in after.values())
+        assert wallet.wallet_value_in_cp(after) == wallet.wallet_value_in_cp(before) - cost
+
+def test_spend_exact(conn):
+    character_id = add_character(conn, gp=5)
+    assert wallet.spend(conn, character_id, "gp", 3) == coins(gp=2)
+    conn.commit()
+    assert balances(conn, character_id) == coins(gp=2)
+    entry = conn.execute("SELECT reason, gp_delta FROM wallet_ledger WHERE character_id = ?", (character_id,)).fetchone()
+    assert (entry["reason"], entry["gp_delta"]) == (wallet.REASON_REMOVE, -3)
+
+def test_spend_borrows_from_higher_coins(conn):
+    character_id = add_character(conn, pp=1)
+    assert wallet.spend(conn, character_id, "gp", 3) == coins(gp=7)
+    conn.commit()
+    assert balances(conn, character_id) == coins(gp=7)
+
+def test_spend_insufficient_funds_leaves_balances_untouched(conn):
+    character_id = add_character(conn, gp=1, sp=5, cp=3)
+    assert wallet.spend(conn, character_id, "pp", 1) is None
+    conn.commit()
+    assert balances(conn, character_id) == coins(gp=1, sp=5, cp=3)
+    assert ledger_count(conn) == 0
+
+def test_spend_fails_if_wallet_changed_since_it_was_read(conn, monkeypatch):
+    character_id = add_character(conn, gp=5)
+    read_balances = wallet._read_balances
+    def stale_read(conn, character_id):
+        result = read_balances(conn, character_id)
+        conn.execute("UPDATE characters SET gp = gp + 1 WHERE id = ?", (character_id,)) # A concurrent write
+        return result
+    monkeypatch.setattr(wallet, "_read_balances", stale_read)
+    assert wallet.spend(conn, character_id, "gp", 1) is None
+    assert read_balances(conn, character_id) == coins(gp=6)
+
+def test_apply_changes_is_all_or_nothing(conn):
+    rich = add_character(conn, "Rich", gp=10)
+    poor = add_character(conn, "Poor", gp=1)
+    assert not wallet.apply_changes(conn, [(rich, "gp", -5), (poor, "gp", -2)], wallet.REASON_REMOVE)
+    conn.commit()
+    assert balances(conn, rich) == coins(gp=10)
+    assert balances(conn, poor) == coins(gp=1)
+    assert ledger_count(conn) == 0
+
+def test_consolidate(conn):
+    character_id = add_character(conn, cp=1234, sp=7)
+    assert wallet.consolidate(conn, character_id) == coins(pp=1, gp=3, cp=4)
+    conn.commit()
+    assert balances(conn, character_id) == coins(pp=1, gp=3, cp=4)
+
+def test_transfer(conn):
+    payer = add_character(conn, "Payer", pp=1)
+    payee = add_character(conn, "Payee")
+    assert wallet.transfer(conn, payer, payee, "gp", 4)
+    conn.commit()
+    assert balances(conn, payer) == coins(gp=6)
+    assert balances(conn, payee) == coins(gp=4)
+    reasons = {row["reason"] for row in conn.execute("SELECT reason FROM wallet_ledger")}
+    assert reasons == {wallet.REASON_PAYMENT}
+
+def test_transfer_rolls_back_credit_when_spend_fails(conn):
+    payer = add_character(conn, "Payer", gp=2)
+    payee = add_character(conn, "Payee", gp=1)
+    assert not wallet.transfer(conn, payer, payee, "gp", 3)
+    conn.commit()
+    assert balances(conn, payer) == coins(gp=2)
+    assert balances(conn, payee) == coins(gp=1) # Credited first, then rolled back
+    assert ledger_count(conn) == 0
+
+def test_transfer_keeps_callers_transaction(conn):
+    payer = add_character(conn, "Payer", gp=2)
+    payee = add_character(conn, "Payee")
+    conn.execute("UPDATE characters SET sp = 5 WHERE id = ?", (payee,)) # Earlier work in the same write
+    assert not wallet.transfer(conn, payer, payee, "gp", 3)
+    conn.commit()
+    assert balances(conn, payee) == coins(sp=5)
+
+def test_transfer_to_missing_character(conn):
+    payer = add_character(conn, "Payer", gp=2)
+    assert not wallet.transfer(conn, payer, payer + 100, "gp", 1)
+    conn.commit()
+    assert balances(conn, payer) == coins(gp=2)
+    assert ledger_count(conn) == 0
@@ -0,0 +1,235 @@
+"""
+Per-interaction trace spans, recorded for a while at a time with /admin trace.
+
+While recording, every interaction Discord delivers (slash commands, buttons,
+modals; autocomplete is skipped) opens a trace keyed by the interaction ID,
+and each step is written to a JSONL file as one span per line:
+
+    received                      the interaction arrived (at_ms is always 0)
+    db.read / db.write            a database call, including time queued for a thread
+    response.<method>             defer, send_message, edit_message or send_modal, a Discord round trip
+    followup.send                 a followup message, another round trip
+    command                       a slash command's callback finished (error set if it failed)
+
+at_ms is the span's start relative to `received` and duration_ms its length,
+so sorting a trace's spans by at_ms gives its timeline. The discord.py hooks
+are only in place while a recording runs (see install()), and the database
+spans cost one context variable lookup otherwise.
+"""
+import json
+import queue
+import threading
+import time
+from contextvars import ContextVar
+from dataclasses import dataclass
+
+TRACE_DIR = "traces"
+_STOP = object() # Tells the writer thread to finish
+
+@dataclass
+class Trace:
+    trace_id: int
+    started: float # time.perf_counter() when the interaction arrived
+
+    def span(self, name: str, started: float, ended: float | None = None, **attributes):
+        """Records a span that began at `started` (perf_counter) and ended at `ended` (default: now)."""
+        if ended is None:
+            ended = time.perf_counter()
+        tracer.emit(self, name, started, ended, attributes)
+
+_current_trace: ContextVar[Trace | None] = ContextVar("current_trace", default=None)
+
+def current() -> Trace | None:
+    """The trace of the interaction being handled in this task, if one is being recorded."""
+    return _current_trace.get()
+
+class TraceWriter(threading.Thread):
+    """Appends JSON lines to a file off the event loop."""
+
+    def __init__(self, path: str):
+        super().__init__(name="trace-writer", daemon=True)
+        self.path = path
+        self._queue: queue.SimpleQueue = queue.SimpleQueue()
+
+    def write(self, record: dict):
+        self._queue.put(record)
+
+    def stop(self):
+        self._queue.put(_STOP)
+        self.join()
+
+    def run(self):
+        with open(self.path, "a", encoding="utf-8") as f:
+            while True:
+                record = self._queue.get()
+                if record is _STOP:
+                    break
+                f.write(json.dumps(record, separators=(",", ":")) + "\n")
+                if self._queue.empty():
+                    f.flush()
+
+@dataclass
+class TraceSummary:
+    """One trace's name and how long it took from arrival to its last span, for /admin trace."""
+    name: str
+    duration_ms: float = 0.0
+
+class Tracer:
+    def __init__(self):
+        self._writer: TraceWriter | None = None
+        self._summaries: dict[int, TraceSummary] = {}
+        self.spans_written = 0
+
+    @property
+    def recording(self) -> bool:
+        return self._writer is not None
+
+    def start(self, path: str):
+        if self._writer is not None:
+            raise RuntimeError("A trace is already being recorded.")
+        self._summaries = {}
+        self.spans_written = 0
+        self._writer = TraceWriter(path)
+        self._writer.start()
+
+    def stop(self) -> list[TraceSummary]:
+        """Stops recording, waits for every span to be written and returns the traces, slowest first."""
+        writer, self._writer = self._writer, None
+        if writer is not None:
+            writer.stop()
+        return sorted(self._summaries.values(), key=lambda summary: summary.duration_ms, reverse=True)
+
+    def begin(self, trace_id: int, name: str, **attributes) -> Trace | None:
+        """Opens a trace and records its `received` span. Returns None when not recording."""
+        if self._writer is None:
+            return None
+        trace = Trace(trace_id, time.perf_counter())
+        self._summaries[trace_id] = TraceSummary(name)
+        self.emit(trace, "received", trace.started, trace.started, {"name": name, **attributes})
+        return trace
+
+    def emit(self, trace: Trace, name: str, started: float, ended: float, attributes: dict):
+        writer = self._writer
+        if writer is None:
+            return # Recording stopped while the interaction was still running
+        record = {
+            "trace": trace.trace_id,
+            "span": name,
+            "at_ms": round((started - trace.started) * 1000, 3),
+            "duration_ms": round((ended - started) * 1000, 3),
+            "ts": round(time.time(), 3),
+        }
+        record.update((key, value) for key, value in attributes.items() if value is not None)
+        writer.write(record)
+        self.spans_written += 1
+        summary = self._summaries.get(trace.trace_id)
+        if summary is not None:
+            summary.duration_ms = max(summary.duration_ms, (ended - trace.started) * 1000)
+
+# Shared instance, see install()
+tracer = Tracer()
+
+def _interaction_name(data: dict) -> tuple[str, str]:
+    """(kind, name) of a raw INTERACTION_CREATE payload, e.g. ("command", "harvest roll")."""
+    inner = data.get("data") or {}
+    if data.get("type") == 2:
+        name = inner.get("name", "?")
+        options = inner.get("options") or []
+        while options and options[0].get("type") in (1, 2): # Subcommand (group)s
+            name += f" {options[0]['name']}"
+            options = options[0].get("options") or []
+        return "command", name
+    if data.get("type") == 3:
+        return "component", inner.get("custom_id", "?")
+    if data.get("type") == 5:
+        return "modal", inner.get("custom_id", "?")
+    return "other", str(data.get("type"))
+
+def _traced_call(span_name: str, method):
+    async def wrapper(*args, **kwargs):
+        trace = _current_trace.get()
+        if trace is None:
+            return await method(*args, **kwargs)
+        started = time.perf_counter()
+        error = None
+        try:
+            return await method(*args, **kwargs)
+        except Exception as e:
+            error = type(e).__name__
+            raise
+        finally:
+            trace.span(span_name, started, error=error)
+    wrapper.__wrapped__ = method
+    return wrapper
+
+# install() reaches into discord.py internals (ConnectionState.parsers) that were
+# checked against these versions. Anything else is refused rather than half-hooked.
+SUPPORTED_DISCORD_VERSIONS = ((2, 0), (3, 0)) # [lowest, highest)
+_RESPONSE_METHODS = ("defer", "send_message", "edit_message", "send_modal")
+_patched: list[tuple[type, str, object]] = [] # (class, attribute, original) for uninstall()
+
+def _interaction_parsers(client) -> dict:
+    import discord
+
+    version = (discord.version_info.major, discord.version_info.minor)
+    lowest, highest = SUPPORTED_DISCORD_VERSIONS
+    if not lowest <= version < highest:
+        raise RuntimeError(f"Interaction tracing hooks discord.py internals and doesn't support discord.py {discord.__version__}.")
+    parsers = getattr(client._connection, "parsers", None)
+    if not isinstance(parsers, dict) or "INTERACTION_CREATE" not in parsers:
+        raise RuntimeError(f"discord.py {discord.__version__} has no ConnectionState.parsers['INTERACTION_CREATE'] to hook.")
+    return parsers
+
+def is_installed(client) -> bool:
+    parsers = getattr(client._connection, "parsers", None) or {}
+    return hasattr(parsers.get("INTERACTION_CREATE"), "__wrapped__")
+
+def install(client):
+    """
+    Hooks tracing into a client; called when a recording starts and undone by
+    uninstall() when it ends. Traces start when the gateway hands over an
+    interaction, so the tasks discord.py creates for it (command tree, view or
+    modal callbacks, on_interaction) all run inside the trace. Responses and
+    followups are timed by wrapping discord.py's InteractionResponse and
+    Webhook.send, which pass straight through when there is no current trace.
+    Raises RuntimeError if this discord.py version can't be hooked.
+    """
+    import discord
+
+    parsers = _interaction_parsers(client)
+    if is_installed(client):
+        return
+    parse_interaction_create = parsers["INTERACTION_CREATE"]
+
+    def traced_parse_interaction_create(data):
+        if not tracer.recording or data.get("type") == 4: # Autocomplete would drown everything else out
+            return parse_interaction_create(data)
+        kind, name = _interaction_name(data)
+        user = (data.get("member") or {}).get("user") or data.get("user") or {}
+        trace = tracer.begin(int(data["id"]), name, kind=kind, user=user.get("id"))
+        token = _current_trace.set(trace)
+        try:
+            return parse_interaction_create(data) # Tasks created in here copy the context, and the trace with it
+        finally:
+            _current_trace.reset(token)
+    traced_parse_interaction_create.__wrapped__ = parse_interaction_create
+    # The gateway reads this same dict, so the hook takes effect on a connected client
+    parsers["INTERACTION_CREATE"] = traced_parse_interaction_create
+
+    if not _patched:
+        targets = [(discord.InteractionResponse, method_name, f"response.{method_name}") for method_name in _RESPONSE_METHODS]
+        targets.append((discord.Webhook, "send", "followup.send"))
+        for owner, attribute, span_name in targets:
+            method = getattr(owner, attribute)
+            _patched.append((owner, attribute, method))
+            setattr(owner, attribute, _traced_call(span_name, method))
+
+def uninstall(client):
+    """Puts back everything install() replaced."""
+    parsers = getattr(client._connection, "parsers", None) or {}
+    hook = parsers.get("INTERACTION_CREATE")
+    if hasattr(hook, "__wrapped__"):
+        parsers["INTERACTION_CREATE"] = hook.__wrapped__
+    while _patched:
+        owner, attribute, method = _patched.pop()
+        setattr(owner, attribute, method)
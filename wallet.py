@@ -0,0 +1,255 @@
+import sqlite3
+import time
+from collections import defaultdict
+from typing import Iterable
+
+from constants import CURRENCY_UNITS, CURRENCY_ORDER
+
+# (character_id, currency key e.g. "gp", amount to add; negative to spend)
+WalletChange = tuple[int, str, int]
+
+# Ledger reasons. Migration 6 also wrote "opening balance" entries for balances that predate the ledger.
+REASON_PRODUCTION = "production"
+REASON_ADD = "add"
+REASON_REMOVE = "remove"
+REASON_PAYMENT = "payment"
+REASON_CONSOLIDATE = "consolidate"
+
+LEDGER_PAGE_SIZE = 10
+_DELTA_COLUMNS = [f"{CURRENCY_UNITS[currency]['column']}_delta" for currency in CURRENCY_ORDER]
+
+def _record(conn: sqlite3.Connection, deltas: dict[int, dict[str, int]], reason: str,
+            current_time: int | None = None, related_character_id: int | None = None):
+    """Appends one ledger entry per character, with all of its currency deltas, in a single executemany."""
+    created_at = int(time.time()) if current_time is None else current_time
+    rows = [
+        (character_id, created_at, reason, related_character_id, *(by_currency.get(currency, 0) for currency in CURRENCY_ORDER))
+        for character_id, by_currency in deltas.items()
+        if any(by_currency.values()) # Changes that netted out leave no trace
+    ]
+    if rows:
+        conn.executemany(
+            f'''INSERT INTO wallet_ledger (character_id, created_at, reason, related_character_id, {", ".join(_DELTA_COLUMNS)})
+               VALUES (?, ?, ?, ?, {", ".join("?" for _ in _DELTA_COLUMNS)})''',
+            rows
+        )
+
+def apply_changes(conn: sqlite3.Connection, changes: Iterable[WalletChange], reason: str,
+                  current_time: int | None = None, related_character_id: int | None = None) -> bool:
+    """
+    Applies every change or none of them. Changes to the same character and
+    currency are netted first, then each currency is written with one
+    conditional UPDATE per row that refuses to take a balance below zero, so
+    there is no read-then-write window for a concurrent write to slip into.
+    Returns False, with nothing changed, if a character doesn't exist or can't
+    afford its debit. Meant to run through db_utils.run_write, or inside
+    another write such as the production tick; it only rolls back its own work.
+    Each character's net change is appended to the ledger under `reason`.
+    """
+    deltas: dict[str, dict[int, int]] = defaultdict(lambda: defaultdict(int)) # column -> character_id -> delta
+    character_deltas: dict[int, dict[str, int]] = defaultdict(lambda: defaultdict(int)) # character_id -> currency -> delta
+    for character_id, currency, amount in changes:
+        if currency not in CURRENCY_UNITS:
+            raise ValueError(f"Unknown currency '{currency}'.")
+        deltas[CURRENCY_UNITS[currency]["column"]][character_id] += amount
+        character_deltas[character_id][currency] += amount
+
+    expected_rows = sum(len(by_character) for by_character in deltas.values())
+    if expected_rows == 0:
+        return True
+
+    if not conn.in_transaction:
+        conn.execute("BEGIN") # Otherwise releasing the savepoint would commit, and the caller decides when to commit
+    conn.execute("SAVEPOINT wallet_changes")
+    updated_rows = 0
+    for column_name, by_character in deltas.items():
+        cursor = conn.executemany(
+            f"UPDATE characters SET {column_name} = {column_name} + ? WHERE id = ? AND {column_name} + ? >= 0",
+            [(delta, character_id, delta) for character_id, delta in by_character.items()]
+        )
+        updated_rows += cursor.rowcount
+    if updated_rows != expected_rows:
+        conn.execute("ROLLBACK TO wallet_changes")
+        conn.execute("RELEASE wallet_changes")
+        return False
+    _record(conn, character_deltas, reason, current_time, related_character_id)
+    conn.execute("RELEASE wallet_changes")
+    return True
+
+def wallet_value_in_cp(balances: dict[str, int]) -> int:
+    return sum(balances[currency] * CURRENCY_UNITS[currency]["value_in_cp"] for currency in CURRENCY_ORDER)
+
+def fewest_coins(value_in_cp: int) -> dict[str, int]:
+    """The fewest coins worth exactly value_in_cp. Greedy is optimal for these denominations."""
+    coins = {}
+    for currency in CURRENCY_ORDER: # Highest value first
+        coins[currency], value_in_cp = divmod(value_in_cp, CURRENCY_UNITS[currency]["value_in_cp"])
+    return coins
+
+def make_change(balances: dict[str, int], currency: str, amount: int) -> dict[str, int] | None:
+    """
+    New balances after spending `amount` of `currency`, or None if the whole
+    wallet isn't worth that much. Coins of that currency are used first, then
+    any other coins that fit without overpaying, largest first, then the
+    smallest coins that cover what's left, with change returned as the fewest
+    coins. Coins that don't need touching are kept.
+    """
+    cost = amount * CURRENCY_UNITS[currency]["value_in_cp"]
+    if wallet_value_in_cp(balances) < cost:
+        return None
+
+    remaining = dict(balances)
+    owed = cost
+    ascending = list(reversed(CURRENCY_ORDER))
+
+    # The exact coin first...
+    used = min(remaining[currency], amount)
+    remaining[currency] -= used
+    owed -= used * CURRENCY_UNITS[currency]["value_in_cp"]
+
+    # ...then any other coins that fit without overpaying, largest first...
+    for coin in CURRENCY_ORDER:
+        value = CURRENCY_UNITS[coin]["value_in_cp"]
+        if owed <= 0 or value > owed:
+            continue
+        used = min(remaining[coin], owed // value)
+        remaining[coin] -= used
+        owed -= used * value
+
+    # ...then break the smallest coins that cover the rest
+    for coin in ascending:
+        if owed <= 0:
+            break
+        value = CURRENCY_UNITS[coin]["value_in_cp"]
+        used = min(remaining[coin], -(-owed // value))
+        remaining[coin] -= used
+        owed -= used * value
+
+    for coin, count in fewest_coins(-owed).items(): # owed <= 0 here, anything below zero is change
+        remaining[coin] += count
+    return remaining
+
+def _read_balances(conn: sqlite3.Connection, character_id: int) -> dict[str, int] | None:
+    columns = ", ".join(CURRENCY_UNITS[currency]["column"] for currency in CURRENCY_ORDER)
+    row = conn.execute(f"SELECT {columns} FROM characters WHERE id = ?", (character_id,)).fetchone()
+    if row is None:
+        return None
+    return {currency: row[CURRENCY_UNITS[currency]["column"]] for currency in CURRENCY_ORDER}
+
+def _replace_balances(conn: sqlite3.Connection, character_id: int, old: dict[str, int], new: dict[str, int]) -> bool:
+    """Writes all five columns in one UPDATE, only if the wallet still holds `old`."""
+    columns = [CURRENCY_UNITS[currency]["column"] for currency in CURRENCY_ORDER]
+    assignments = ", ".join(f"{column} = ?" for column in columns)
+    conditions = " AND ".join(f"{column} = ?" for column in columns)
+    cursor = conn.execute(
+        f"UPDATE characters SET {assignments} WHERE id = ? AND {conditions}",
+        (*(new[currency] for currency in CURRENCY_ORDER), character_id, *(old[currency] for currency in CURRENCY_ORDER))
+    )
+    return cursor.rowcount > 0
+
+def _record_replacement(conn: sqlite3.Connection, character_id: int, old: dict[str, int], new: dict[str, int],
+                        reason: str, related_character_id: int | None = None):
+    deltas = {currency: new[currency] - old[currency] for currency in CURRENCY_ORDER}
+    _record(conn, {character_id: deltas}, reason, related_character_id=related_character_id)
+
+def spend(conn: sqlite3.Connection, character_id: int, currency: str, amount: int,
+          reason: str = REASON_REMOVE, related_character_id: int | None = None) -> dict[str, int] | None:
+    """Spends `amount` of `currency`, making change from other coins if needed. Returns the new balances, or None if unaffordable."""
+    if currency not in CURRENCY_UNITS:
+        raise ValueError(f"Unknown currency '{currency}'.")
+    balances = _read_balances(conn, character_id)
+    if balances is None:
+        return None
+    new_balances = make_change(balances, currency, amount)
+    if new_balances is None or not _replace_balances(conn, character_id, balances, new_balances):
+        return None
+    _record_replacement(conn, character_id, balances, new_balances, reason, related_character_id)
+    return new_balances
+
+def consolidate(conn: sqlite3.Connection, character_id: int) -> dict[str, int] | None:
+    """Exchanges the whole wallet for the fewest coins of the same value. Returns the new balances."""
+    balances = _read_balances(conn, character_id)
+    if balances is None:
+        return None
+    new_balances = fewest_coins(wallet_value_in_cp(balances))
+    if not _replace_balances(conn, character_id, balances, new_balances):
+        return None
+    _record_replacement(conn, character_id, balances, new_balances, REASON_CONSOLIDATE)
+    return new_balances
+
+def transfer(conn: sqlite3.Connection, from_character_id: int, to_character_id: int, currency: str, amount: int) -> bool:
+    """
+    Moves `amount` of one currency between two characters, making change from
+    the payer's other coins if needed. False, with nothing changed, if the payer
+    can't afford it or either character doesn't exist.
+    """
+    if amount <= 0 or from_character_id == to_character_id:
+        return False
+    if not conn.in_transaction:
+        conn.execute("BEGIN")
+    conn.execute("SAVEPOINT wallet_transfer")
+    credited = apply_changes(conn, [(to_character_id, currency, amount)], REASON_PAYMENT, related_character_id=from_character_id)
+    if credited and spend(conn, from_character_id, currency, amount, REASON_PAYMENT, to_character_id) is not None:
+        conn.execute("RELEASE wallet_transfer")
+        return True
+    conn.execute("ROLLBACK TO wallet_transfer")
+    conn.execute("RELEASE wallet_transfer")
+    return False
+
+def snapshot_wallets(conn: sqlite3.Connection, current_time: int | None = None) -> int:
+    """
+    Snapshots the balance of every character with ledger entries since the last
+    run, so balance_at() never has to sum more than one period of entries.
+    Runs on the writer thread, so the balances match the ledger exactly.
+    Returns the number of snapshots taken.
+    """
+    created_at = int(time.time()) if current_time is None else current_time
+    # Every run snapshots everyone it sees, so the newest snapshot marks how far the last run got
+    watermark = conn.execute("SELECT COALESCE(MAX(ledger_id), 0) FROM wallet_snapshots").fetchone()[0]
+    columns = [CURRENCY_UNITS[currency]["column"] for currency in CURRENCY_ORDER]
+    cursor = conn.execute(f'''
+        INSERT INTO wallet_snapshots (character_id, ledger_id, created_at, {", ".join(columns)})
+        SELECT c.id, recent.ledger_id, ?, {", ".join(f"c.{column}" for column in columns)}
+        FROM (
+            SELECT character_id, MAX(id) AS ledger_id FROM wallet_ledger WHERE id > ? GROUP BY character_id
+        ) recent
+        JOIN characters c ON c.id = recent.character_id''', (created_at, watermark))
+    return cursor.rowcount
+
+def balance_at(conn: sqlite3.Connection, character_id: int, at_time: int) -> dict[str, int]:
+    """A character's balances as of at_time: the last snapshot before it plus the ledger entries after that snapshot."""
+    columns = [CURRENCY_UNITS[currency]["column"] for currency in CURRENCY_ORDER]
+    snapshot = conn.execute(
+        f'''SELECT ledger_id, {", ".join(columns)} FROM wallet_snapshots
+            WHERE character_id = ? AND created_at <= ? ORDER BY ledger_id DESC LIMIT 1''',
+        (character_id, at_time)
+    ).fetchone()
+    since = conn.execute(
+        f'''SELECT {", ".join(f"COALESCE(SUM({column}), 0)" for column in _DELTA_COLUMNS)} FROM wallet_ledger
+            WHERE character_id = ? AND id > ? AND created_at <= ?''',
+        (character_id, snapshot["ledger_id"] if snapshot else 0, at_time)
+    ).fetchone()
+    return {
+        currency: (snapshot[CURRENCY_UNITS[currency]["column"]] if snapshot else 0) + since[index]
+        for index, currency in enumerate(CURRENCY_ORDER)
+    }
+
+def history_page(conn: sqlite3.Connection, character_id: int, before_id: int | None = None,
+                 after_id: int | None = None, limit: int = LEDGER_PAGE_SIZE) -> list[sqlite3.Row]:
+    """
+    One page of a character's ledger, newest first. Pages are keyed by entry id
+    rather than OFFSET, so every page is an index range scan however deep it is:
+    pass the oldest id shown as before_id for the next page, or the newest id
+    shown as after_id for the previous one.
+    """
+    select = f'''
+        SELECT l.id, l.created_at, l.reason, rc.name AS related_character_name, {", ".join(f"l.{column}" for column in _DELTA_COLUMNS)}
+        FROM wallet_ledger l
+        LEFT JOIN characters rc ON rc.id = l.related_character_id
+        WHERE l.character_id = ?'''
+    if after_id is not None:
+        rows = conn.execute(f"{select} AND l.id > ? ORDER BY l.id ASC LIMIT ?", (character_id, after_id, limit)).fetchall()
+        return rows[::-1]
+    if before_id is not None:
+        return conn.execute(f"{select} AND l.id < ? ORDER BY l.id DESC LIMIT ?", (character_id, before_id, limit)).fetchall()
+    return conn.execute(f"{select} ORDER BY l.id DESC LIMIT ?", (character_id, limit)).fetchall()